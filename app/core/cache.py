@@ -0,0 +1,93 @@
+# app/core/cache.py
+"""
+Кэш редко меняющихся справочников в памяти воркера.
+
+Ответ хранится уже сериализованным вместе со строгим ETag, поэтому
+попадание в кэш не обращается к БД и не сериализует данные заново,
+а запрос с совпадающим If-None-Match получает 304 без тела.
+Обработчики записи вызывают invalidate() после commit.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from app.core.config import settings
+
+
+class _Entry:
+    __slots__ = ("body", "etag", "expires_at")
+
+    def __init__(self, body: bytes, etag: str, expires_at: float):
+        self.body = body
+        self.etag = etag
+        self.expires_at = expires_at
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match сравнивается слабым сравнением (RFC 9110, 13.1.2)
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class ReferenceCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[str, _Entry] = {}
+        self._generations: Dict[str, int] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _fresh_entry(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            return entry
+        return None
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[object]]) -> _Entry:
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Пока ждали блокировку, справочник мог загрузить другой запрос
+            entry = self._fresh_entry(key)
+            if entry is not None:
+                return entry
+
+            generation = self._generations.get(key, 0)
+            data = await loader()
+            body = json.dumps(jsonable_encoder(data), ensure_ascii=False, separators=(",", ":")).encode()
+            etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+            entry = _Entry(body, etag, time.monotonic() + self.ttl)
+
+            # Если во время загрузки справочник изменили, устаревший
+            # результат отдаём этому запросу, но в кэш не кладём
+            if self._generations.get(key, 0) == generation:
+                self._entries[key] = entry
+            return entry
+
+    async def response(
+        self,
+        request: Request,
+        key: str,
+        loader: Callable[[], Awaitable[object]],
+    ) -> Response:
+        """JSON-ответ из кэша (или из loader при промахе) с поддержкой ETag/304"""
+        entry = self._fresh_entry(key) or await self._load(key, loader)
+        headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+        if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    def invalidate(self, *keys: str) -> None:
+        for key in keys:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._entries.pop(key, None)
+
+
+reference_cache = ReferenceCache(ttl=settings.reference_cache_ttl)
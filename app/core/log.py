@@ -0,0 +1,94 @@
+# app/core/log.py
+"""
+Логирование через очередь: обработчики запросов только кладут запись
+в очередь (QueueHandler), а форматирование в JSON и запись в stderr
+выполняет фоновый поток (QueueListener). Сообщения передаются в стиле
+logger.info("... %s", value): строка собирается, только если уровень
+записи включён.
+"""
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.core.config import settings
+
+# Атрибуты LogRecord, которые не относятся к полям из extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON; поля из extra= попадают в объект"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Стандартный QueueHandler склеивает трассировку с текстом сообщения;
+    здесь она остаётся отдельным полем, чтобы попасть в JSON как exc_info
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _plain.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_plain = logging.Formatter()
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: str = settings.log_level, json_format: bool = settings.log_json) -> None:
+    """Подключает корневой логгер к очереди и запускает фоновый поток записи"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(
+        JsonFormatter() if json_format
+        else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [_QueueHandler(log_queue)]
+    root.setLevel(level.upper())
+    # Пул SQLAlchemy пишет от имени своего класса (app.db.pool.InstrumentedQueuePool),
+    # а не из иерархии "sqlalchemy", поэтому его INFO-сообщения отсекаем отдельно
+    if not settings.db_echo:
+        logging.getLogger("app.db.pool").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Дописывает оставшиеся в очереди записи и останавливает поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
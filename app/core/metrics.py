@@ -0,0 +1,222 @@
+# app/core/metrics.py
+"""
+Метрики запросов в формате Prometheus и заголовок Server-Timing.
+
+Для каждого шаблона маршрута (например /products/{product_id}) считаются:
+длительность запроса, число SQL-запросов, суммарное время в БД и число
+возвращённых строк. SQL считается слушателями before/after_cursor_execute,
+которые пишут в статистику текущего HTTP-запроса через contextvar.
+
+Метрики живут в памяти процесса: при нескольких воркерах каждый отдаёт
+на /metrics свои значения.
+"""
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+from app.db.pool import pool_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class RequestStats:
+    """SQL-статистика одного HTTP-запроса"""
+    __slots__ = ("queries", "db_seconds", "rows")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+
+
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...], amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {_format_number(value)}")
+        return "\n".join(lines)
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [счётчики по корзинам..., сумма, количество]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        data = self._values.get(labels)
+        if data is None:
+            data = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                data[i] += 1
+        data[-2] += value
+        data[-1] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, data in sorted(self._values.items()):
+            for bound, count in zip(self.buckets, data):
+                le = f'le="{_format_number(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {count}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, inf)} {data[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_number(data[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {data[-1]}")
+        return "\n".join(lines)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        route_labels = ("method", "route")
+        self.requests = Counter(
+            "http_requests_total", "HTTP requests by route template and status.",
+            ("method", "route", "status"),
+        )
+        self.latency = Histogram(
+            "http_request_duration_seconds", "HTTP request latency.",
+            route_labels, LATENCY_BUCKETS,
+        )
+        self.queries = Histogram(
+            "db_queries_per_request", "SQL statements executed per HTTP request.",
+            route_labels, QUERY_COUNT_BUCKETS,
+        )
+        self.db_time = Histogram(
+            "db_time_per_request_seconds", "Total time spent in SQL per HTTP request.",
+            route_labels, LATENCY_BUCKETS,
+        )
+        self.rows = Counter(
+            "db_rows_total", "Rows returned or affected by SQL statements.",
+            route_labels,
+        )
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+        labels = (method, route)
+        with self._lock:
+            self.requests.inc((method, route, str(status)))
+            self.latency.observe(labels, seconds)
+            self.queries.observe(labels, stats.queries)
+            self.db_time.observe(labels, stats.db_seconds)
+            self.rows.inc(labels, stats.rows)
+
+    def render(self) -> str:
+        with self._lock:
+            sections = [
+                metric.render()
+                for metric in (self.requests, self.latency, self.queries, self.db_time, self.rows)
+            ]
+        pool = pool_stats.snapshot()
+        sections.append("\n".join(
+            f"# TYPE db_pool_{name} {'counter' if name.endswith('_total') else 'gauge'}\n"
+            f"db_pool_{name} {_format_number(value)}"
+            for name, value in pool.items()
+        ))
+        return "\n".join(sections) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def install_sql_instrumentation(engine) -> None:
+    """Считает SQL-запросы, время и строки в статистику текущего HTTP-запроса"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start_time"].pop()
+        stats = _current_request.get()
+        if stats is None:
+            return
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+        stats.rows += max(getattr(cursor, "rowcount", 0) or 0, 0)
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: собирает метрики по шаблону маршрута и добавляет
+    заголовок Server-Timing (время в БД и число SQL до начала ответа).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                timing = (
+                    f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", '
+                    f"app;dur={elapsed_ms:.1f}"
+                )
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timing.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_request.reset(token)
+            route = scope.get("route")
+            registry.observe_request(
+                scope["method"],
+                getattr(route, "path", UNMATCHED_ROUTE),
+                status_code,
+                time.perf_counter() - started,
+                stats,
+            )
@@ -0,0 +1,90 @@
+# app/core/pagination.py
+"""
+Непрозрачные курсоры для keyset-пагинации.
+
+Курсор — base64url от JSON-списка значений ключа сортировки последней
+строки страницы, например [date, id]. Клиент передаёт его обратно как есть.
+Если в курсоре есть значения, которым сервер должен доверять (например,
+нарастающий остаток), курсор подписывается HMAC ключом JWT_ACTIVE_KID:
+encode_signed_cursor()/decode_signed_cursor().
+"""
+import base64
+import hashlib
+import hmac
+import json
+from typing import Any, List, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+from app.core.config import settings
+
+SIGNATURE_BYTES = 16
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps(list(values), default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _cursor_signature(key: str, payload: str) -> str:
+    # Префикс отделяет подписи курсоров от подписей токенов тем же ключом
+    digest = hmac.new(key.encode(), b"cursor." + payload.encode(), hashlib.sha256).digest()
+    return _b64encode(digest[:SIGNATURE_BYTES])
+
+
+def encode_signed_cursor(values: Sequence[Any]) -> str:
+    kid = settings.jwt_active_kid
+    payload = encode_cursor([kid, *values])
+    return f"{payload}.{_cursor_signature(settings.jwt_keys[kid], payload)}"
+
+
+def decode_signed_cursor(cursor: str, size: int) -> List[Any]:
+    """Значения подписанного курсора; изменённый клиентом курсор — 400"""
+    payload, _, signature = cursor.partition(".")
+    kid, *values = decode_cursor(payload, size + 1)
+    key = settings.jwt_keys.get(kid) if isinstance(kid, str) else None
+    if key is None or not hmac.compare_digest(signature, _cursor_signature(key, payload)):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def keyset_after(column, id_column, value, last_id, descending: bool = False):
+    """
+    Условие "строго после (value, last_id)" для сортировки (column, id_column)
+    в одном направлении. Учитывает порядок NULL в MySQL: при ASC они идут
+    первыми, при DESC — последними.
+    """
+    if descending:
+        if value is None:
+            return and_(column.is_(None), id_column < last_id)
+        return or_(
+            column < value,
+            and_(column == value, id_column < last_id),
+            column.is_(None),
+        )
+
+    if value is None:
+        return or_(
+            and_(column.is_(None), id_column > last_id),
+            column.is_not(None),
+        )
+    return or_(
+        column > value,
+        and_(column == value, id_column > last_id),
+    )
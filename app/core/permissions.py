@@ -0,0 +1,73 @@
+# app/core/permissions.py
+"""
+Права ролей в памяти воркера.
+
+Таблица role_permissions маленькая, поэтому при промахе она читается
+целиком одним запросом, а проверка права — поиск в frozenset.
+Изменения ролей в этом воркере сбрасывают кэш через invalidate();
+остальные воркеры увидят их не позже чем через PERMISSION_CACHE_TTL.
+"""
+import asyncio
+import time
+from typing import Dict, FrozenSet, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.models import RolePermission
+
+WILDCARD = "*"
+
+
+def permission_granted(granted: FrozenSet[str], permission: str) -> bool:
+    """Проверка права с учётом шаблонов "*" и "ресурс:*" """
+    if WILDCARD in granted or permission in granted:
+        return True
+    resource, _, _ = permission.partition(":")
+    return f"{resource}:{WILDCARD}" in granted
+
+
+class RolePermissionCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._roles: Optional[Dict[int, FrozenSet[str]]] = None
+        self._expires_at = 0.0
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    async def _load(self, db: AsyncSession) -> Dict[int, FrozenSet[str]]:
+        async with self._lock:
+            # Пока ждали блокировку, права мог загрузить другой запрос
+            if self._roles is not None and self._expires_at > time.monotonic():
+                return self._roles
+
+            generation = self._generation
+            grouped: Dict[int, set] = {}
+            for role_id, permission in await db.execute(
+                select(RolePermission.role_id, RolePermission.permission)
+            ):
+                grouped.setdefault(role_id, set()).add(permission)
+            roles = {role_id: frozenset(permissions) for role_id, permissions in grouped.items()}
+
+            # Права, изменённые во время загрузки, в кэш не кладём
+            if self._generation == generation:
+                self._roles = roles
+                self._expires_at = time.monotonic() + self.ttl
+            return roles
+
+    async def permissions(self, db: AsyncSession, role_id: Optional[int]) -> FrozenSet[str]:
+        roles = self._roles
+        if roles is None or self._expires_at <= time.monotonic():
+            roles = await self._load(db)
+        return roles.get(role_id, frozenset())
+
+    async def has_permission(self, db: AsyncSession, role_id: Optional[int], permission: str) -> bool:
+        return permission_granted(await self.permissions(db, role_id), permission)
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._roles = None
+
+
+role_permissions = RolePermissionCache(ttl=settings.permission_cache_ttl)
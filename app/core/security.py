@@ -0,0 +1,151 @@
+# app/core/security.py
+"""
+Выпуск и проверка JWT без обращения к БД.
+
+Токен подписывается ключом JWT_ACTIVE_KID (kid передаётся в заголовке
+токена) и проверяется любым ключом из JWT_KEYS, поэтому все воркеры
+принимают токены друг друга, а ключ можно ротировать без разлогинивания.
+Данные пользователя, нужные фронтенду, лежат в claims токена; уже
+проверенные токены запоминаются в LRU-кэше принципалов с TTL.
+"""
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import jwt
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+# Claims, из которых собирается Principal без запроса к БД
+PRINCIPAL_CLAIMS = ("sub", "uid", "first_name", "last_name", "role_id")
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    login: str
+    first_name: str
+    last_name: str
+    role_id: Optional[int]
+
+    @property
+    def name(self) -> str:
+        return f"{self.first_name} {self.last_name}"
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "name": self.name}
+
+    @classmethod
+    def from_employee(cls, employee) -> "Principal":
+        return cls(
+            id=employee.id,
+            login=employee.login,
+            first_name=employee.first_name,
+            last_name=employee.last_name,
+            role_id=employee.role_id,
+        )
+
+    @classmethod
+    def from_claims(cls, claims: dict) -> Optional["Principal"]:
+        """Principal из claims токена; None, если каких-то claims нет"""
+        if not all(claim in claims for claim in PRINCIPAL_CLAIMS):
+            return None
+        return cls(
+            id=claims["uid"],
+            login=claims["sub"],
+            first_name=claims["first_name"],
+            last_name=claims["last_name"],
+            role_id=claims["role_id"],
+        )
+
+
+def create_access_token(principal: Principal, expires_delta: Optional[timedelta] = None) -> str:
+    now = datetime.now(timezone.utc)
+    expire = now + (expires_delta or timedelta(minutes=settings.access_token_expire_minutes))
+    payload = {
+        "sub": principal.login,
+        "uid": principal.id,
+        "first_name": principal.first_name,
+        "last_name": principal.last_name,
+        "role_id": principal.role_id,
+        "iat": now,
+        "exp": expire,
+    }
+    kid = settings.jwt_active_kid
+    return jwt.encode(
+        payload, settings.jwt_keys[kid], algorithm=settings.jwt_algorithm, headers={"kid": kid},
+    )
+
+
+def decode_access_token(token: str) -> dict:
+    """Проверяет подпись и срок действия; ошибки — исключения jwt.InvalidTokenError"""
+    kid = jwt.get_unverified_header(token).get("kid")
+    key = settings.jwt_keys.get(kid)
+    if key is None:
+        raise jwt.InvalidTokenError("Unknown signing key")
+    claims = jwt.decode(token, key, algorithms=[settings.jwt_algorithm])
+    if not claims.get("sub"):
+        raise jwt.InvalidTokenError("Token has no subject")
+    return claims
+
+
+class PrincipalCache:
+    """
+    LRU-кэш "токен -> Principal". Запись живёт не дольше ttl и не дольше
+    самого токена, так что истёкший токен из кэша не вернётся.
+    """
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[Principal]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        principal, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[token]
+            return None
+        self._entries.move_to_end(token)
+        return principal
+
+    def put(self, token: str, principal: Principal, token_exp: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, time.monotonic() + (token_exp - time.time()))
+        self._entries[token] = (principal, expires_at)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+principal_cache = PrincipalCache(ttl=settings.principal_cache_ttl, maxsize=settings.principal_cache_size)
+
+
+def resolve_principal(token: str) -> Principal:
+    """Principal по токену: из кэша, иначе проверкой подписи и разбором claims"""
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
+    try:
+        claims = decode_access_token(token)
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    principal = Principal.from_claims(claims)
+    if principal is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    principal_cache.put(token, principal, claims.get("exp"))
+    return principal
@@ -0,0 +1,32 @@
+# app/db/loading.py
+"""
+Стратегии загрузки связей для эндпоинтов.
+
+Все relationship в моделях объявлены с lazy="raise_on_sql": неявная
+ленивая загрузка (и N+1 запросов в списках) падает с ошибкой сразу,
+а не тихо делает SELECT на каждую строку. Эндпоинт, которому нужны
+связанные объекты, объявляет их здесь одним планом и применяет его
+через with_plan(). Для списков, где нужны только имена связанных
+записей, лучше подходит проекция с JOIN без ORM-объектов.
+"""
+from typing import Dict, Sequence
+
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.interfaces import LoaderOption
+
+from app.models.models import Company, Document, StorageZone
+
+LOAD_PLANS: Dict[str, Sequence[LoaderOption]] = {
+    # many-to-one: один LEFT JOIN в том же запросе
+    "company": (joinedload(Company.company_type),),
+    "storage_zone": (joinedload(StorageZone.storage_condition),),
+    "document": (
+        joinedload(Document.company),
+        joinedload(Document.document_type),
+    ),
+}
+
+
+def with_plan(statement, name: str):
+    """Добавляет к select() опции загрузки из плана name"""
+    return statement.options(*LOAD_PLANS[name])
@@ -1,9 +1,35 @@
 # dependencies.py
-from app.db.database import SessionLocal
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 
-def get_db():
-    db = SessionLocal()
-    try:
+from app.core.permissions import role_permissions
+from app.core.security import Principal, resolve_principal
+from app.db.database import AsyncSessionLocal
+
+async def get_db():
+    """Единственная зависимость сессии БД для всех роутеров"""
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+bearer = HTTPBearer()
+
+async def current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer)) -> Principal:
+    """Пользователь из JWT: подпись проверяется локально, без запроса к БД"""
+    return resolve_principal(credentials.credentials)
+
+def require_permission(permission: str):
+    """
+    Зависимость маршрута, требующая право роли, например
+    Depends(require_permission("documents:writeoff")).
+    Права берутся из кэша role_permissions; в БД — только при его промахе.
+    """
+    async def check(
+        user: Principal = Depends(current_user),
+        db: AsyncSession = Depends(get_db),
+    ) -> Principal:
+        if not await role_permissions.has_permission(db, user.role_id, permission):
+            raise HTTPException(status_code=403, detail=f"Недостаточно прав: {permission}")
+        return user
+
+    return check
@@ -1,10 +1,28 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from app.core.log import setup_logging, shutdown_logging
+from app.core.metrics import MetricsMiddleware, install_sql_instrumentation, registry
+from app.db.database import engine
+from app.db.pool import pool_stats
 from app.routers import products, documents, companies, companytypes, documenttypes, categories, units, employees,  storageconditions, storagezones
 from app.routers import auth, documentlines
-from app.routers import reference
+from app.routers import reference, stockperiods
+from app.services.stock_periods import PeriodClosedError
 
-app = FastAPI(title="Inventory API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setup_logging()
+    yield
+    # Закрываем соединения пула при остановке воркера
+    await engine.dispose()
+    shutdown_logging()
+
+app = FastAPI(title="Inventory API", lifespan=lifespan)
+
+# Счётчики SQL по HTTP-запросам (см. app/core/metrics.py)
+install_sql_instrumentation(engine)
 
 # Настройка CORS
 origins = [
@@ -20,6 +38,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Метрики добавляются последними, чтобы внешним слоем измерять весь запрос
+app.add_middleware(MetricsMiddleware)
+
 # Подключаем роутеры
 app.include_router(products.router)
 app.include_router(documents.router)
@@ -34,8 +55,24 @@ app.include_router(storageconditions.router)
 app.include_router(storagezones.router)
 app.include_router(reference.router) 
 app.include_router(documentlines.router)
+app.include_router(stockperiods.router)
+
+# Запись в закрытый период (см. app/services/stock_periods.py)
+@app.exception_handler(PeriodClosedError)
+async def period_closed_handler(request: Request, exc: PeriodClosedError):
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
 
 # Корневой эндпоинт
 @app.get("/")
 def root():
     return {"message": "Inventory API is running"}
+
+# Состояние пула соединений текущего воркера
+@app.get("/health/pool")
+async def pool_health():
+    return pool_stats.snapshot()
+
+# Метрики текущего воркера в формате Prometheus
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
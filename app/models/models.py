@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Date, Numeric, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, BigInteger, BINARY, Date, DateTime, SmallInteger, Text, Numeric, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.db.database import Base
 
@@ -13,8 +13,26 @@ class Document(Base):
     company_id = Column(Integer, ForeignKey("companies.id"))
     document_type_id = Column(Integer, ForeignKey("documenttypes.id"), nullable=False)
    
-    company = relationship("Company", back_populates="documents")
-    document_type = relationship("DocumentType", back_populates="documents")
+    company = relationship("Company", back_populates="documents", lazy="raise_on_sql")
+    document_type = relationship("DocumentType", back_populates="documents", lazy="raise_on_sql")
+
+    # Имена связанных записей для DocumentOut; связи должны быть
+    # загружены заранее (план "document" в app/db/loading.py)
+    @property
+    def company_name(self):
+        return self.company.name if self.company else None
+
+    @property
+    def document_type_name(self):
+        return self.document_type.name if self.document_type else None
+
+    # Индексы под keyset-пагинацию GET /documents/ (сортировка date DESC, id DESC)
+    __table_args__ = (
+        Index("ix_documents_date_id", "date", "id"),
+        Index("ix_documents_type_date_id", "document_type_id", "date", "id"),
+        Index("ix_documents_company_date_id", "company_id", "date", "id"),
+        Index("ix_documents_type_company_date_id", "document_type_id", "company_id", "date", "id"),
+    )
 
 class DocumentLine(Base):
     __tablename__ = "documentlines"
@@ -26,6 +44,17 @@ class DocumentLine(Base):
     document_id = Column(Integer, ForeignKey("documents.id"))
     storage_zone_sender_id = Column(Integer, ForeignKey("storagezones.id"), nullable=True)
     storage_zone_receiver_id = Column(Integer, ForeignKey("storagezones.id"), nullable = True)
+    # Копия documents.date; заполняется триггерами БД (миграция 0010_documentlines_document_date)
+    document_date = Column(Date, nullable=True)
+
+    # Движения товара по датам: журнал (GET /products/{id}/movements) и остатки
+    # после снимка читаются только из индекса
+    __table_args__ = (
+        Index(
+            "ix_documentlines_product_date", "product_id", "document_date", "document_id", "id",
+            "quantity", "storage_zone_sender_id", "storage_zone_receiver_id",
+        ),
+    )
 
 class DocumentType(Base):
     __tablename__ = "documenttypes"
@@ -33,7 +62,7 @@ class DocumentType(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(45), nullable=False)
 
-    documents = relationship("Document", back_populates="document_type")
+    documents = relationship("Document", back_populates="document_type", lazy="raise_on_sql")
 
 class Company(Base):
     __tablename__ = "companies"
@@ -43,9 +72,9 @@ class Company(Base):
     
     company_type_id = Column(Integer, ForeignKey("companytypes.id"), nullable=False)
 
-    documents = relationship("Document", back_populates="company")
+    documents = relationship("Document", back_populates="company", lazy="raise_on_sql")
     
-    company_type = relationship("CompanyType", back_populates="companies")
+    company_type = relationship("CompanyType", back_populates="companies", lazy="raise_on_sql")
 
 class CompanyType(Base):
     __tablename__ = "companytypes"
@@ -53,7 +82,7 @@ class CompanyType(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(45), nullable=False)
 
-    companies = relationship("Company", back_populates="company_type")
+    companies = relationship("Company", back_populates="company_type", lazy="raise_on_sql")
 
 class Employee(Base):
     __tablename__ = "employees"
@@ -90,8 +119,19 @@ class Product(Base):
     category_id = Column(Integer, ForeignKey("categories.id"))
     unit_id = Column(Integer, ForeignKey("units.id"))
     
-    category = relationship("Category", back_populates="products")
-    unit = relationship("Unit", back_populates="products")
+    category = relationship("Category", back_populates="products", lazy="raise_on_sql")
+    unit = relationship("Unit", back_populates="products", lazy="raise_on_sql")
+
+    # Индексы под сортировку и фильтры каталога GET /products/;
+    # article уникален — по нему идёт импорт каталога (upsert)
+    __table_args__ = (
+        Index("ix_products_name_id", "name", "id"),
+        Index("ux_products_article", "article", unique=True),
+        Index("ix_products_sell_price_id", "sell_price", "id"),
+        Index("ix_products_category_sell_price_id", "category_id", "sell_price", "id"),
+        Index("ix_products_unit_id_id", "unit_id", "id"),
+        Index("ix_products_is_active_id", "is_active", "id"),
+    )
 
 class Category(Base):
     __tablename__ = "categories"
@@ -99,7 +139,7 @@ class Category(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(45), nullable=False)
 
-    products = relationship("Product", back_populates="category")
+    products = relationship("Product", back_populates="category", lazy="raise_on_sql")
 
 class Unit(Base):
     __tablename__ = "units"
@@ -107,7 +147,7 @@ class Unit(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(45), nullable=False)
 
-    products = relationship("Product", back_populates="unit")
+    products = relationship("Product", back_populates="unit", lazy="raise_on_sql")
 
 class StorageCondition(Base):
     __tablename__ = "storageconditions"
@@ -115,7 +155,7 @@ class StorageCondition(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
 
-    zones = relationship("StorageZone", back_populates="storage_condition")
+    zones = relationship("StorageZone", back_populates="storage_condition", lazy="raise_on_sql")
 
 class StorageZone(Base):
     __tablename__ = "storagezones"
@@ -125,7 +165,7 @@ class StorageZone(Base):
     comment = Column(String)
     storage_condition_id = Column(Integer, ForeignKey("storageconditions.id"), nullable=False)
 
-    storage_condition = relationship("StorageCondition", back_populates="zones")
+    storage_condition = relationship("StorageCondition", back_populates="zones", lazy="raise_on_sql")
 
 class Role(Base):
     __tablename__ = "roles"
@@ -134,6 +174,14 @@ class Role(Base):
     name = Column(String, unique=True, nullable=False)
 
 
+class RolePermission(Base):
+    __tablename__ = "role_permissions"
+
+    # Права вида "ресурс:действие"; "*" и "ресурс:*" — шаблоны
+    role_id = Column(Integer, ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True)
+    permission = Column(String(64), primary_key=True)
+
+
 class Position(Base):
     __tablename__ = "positions"
 
@@ -145,4 +193,53 @@ class Subdivision(Base):
     __tablename__ = "subdivisions"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, unique=True, nullable=False)
\ No newline at end of file
+    name = Column(String, unique=True, nullable=False)
+
+class StockBalance(Base):
+    __tablename__ = "stock_balances"
+
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    zone_id = Column(Integer, ForeignKey("storagezones.id"), primary_key=True, index=True)
+    quantity = Column(Integer, nullable=False, default=0)
+
+class DocumentStatsDaily(Base):
+    __tablename__ = "document_stats_daily"
+
+    # Сводка по документам за день, см. app/services/document_stats.py;
+    # company_id = 0 — документы без компании
+    date = Column(Date, primary_key=True)
+    document_type_id = Column(Integer, ForeignKey("documenttypes.id"), primary_key=True)
+    company_id = Column(Integer, primary_key=True, default=0)
+    count = Column(Integer, nullable=False, default=0)
+    total_quantity = Column(BigInteger, nullable=False, default=0)
+
+class StockPeriod(Base):
+    __tablename__ = "stock_periods"
+
+    # Закрытые месяцы, см. app/services/stock_periods.py
+    period_end = Column(Date, primary_key=True)
+    closed_at = Column(DateTime, nullable=False)
+
+class StockSnapshot(Base):
+    __tablename__ = "stock_snapshots"
+
+    # Остаток на конец закрытого месяца; нулевые остатки не хранятся
+    period_end = Column(Date, ForeignKey("stock_periods.period_end", ondelete="CASCADE"), primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    zone_id = Column(Integer, ForeignKey("storagezones.id"), primary_key=True)
+    quantity = Column(Integer, nullable=False)
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    # sha256 от (пользователь, операция, Idempotency-Key) и от тела запроса,
+    # см. app/services/idempotency.py; status_code = NULL — запрос ещё выполняется
+    # и держит ключ до locked_until; lock_token — какой именно запрос (меняется при перехвате)
+    key_hash = Column(BINARY(32), primary_key=True)
+    request_hash = Column(BINARY(32), nullable=False)
+    lock_token = Column(BINARY(16), nullable=False)
+    status_code = Column(SmallInteger, nullable=True)
+    response = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    locked_until = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
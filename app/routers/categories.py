@@ -1,58 +1,59 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.db.database import SessionLocal
+from app.dependencies import current_user, get_db, require_permission
+from app.core.cache import reference_cache
 from app.models.models import Category
 from app.schemas.schemas import CategoryOut, CategoryCreate
 
 router = APIRouter(
     prefix="/categories",
-    tags=["categories"]
+    tags=["categories"],
+    dependencies=[Depends(current_user)]
 )
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/", response_model=List[CategoryOut])
-def get_categories(db: Session = Depends(get_db)):
-    return db.query(Category).all()
+async def get_categories(request: Request, db: AsyncSession = Depends(get_db)):
+    async def load():
+        return [CategoryOut.model_validate(row, from_attributes=True) for row in (await db.scalars(select(Category))).all()]
+    return await reference_cache.response(request, "categories", load)
 
 @router.get("/{category_id}", response_model=CategoryOut)
-def get_category(category_id: int, db: Session = Depends(get_db)):
-    category = db.query(Category).filter(Category.id == category_id).first()
+async def get_category(category_id: int, db: AsyncSession = Depends(get_db)):
+    category = await db.get(Category, category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     return category
 
-@router.post("/", response_model=CategoryOut)
-def create_category(category: CategoryCreate, db: Session = Depends(get_db)):
+@router.post("/", response_model=CategoryOut, dependencies=[Depends(require_permission("references:write"))])
+async def create_category(category: CategoryCreate, db: AsyncSession = Depends(get_db)):
     db_category = Category(**category.dict())
     db.add(db_category)
-    db.commit()
-    db.refresh(db_category)
+    await db.commit()
+    reference_cache.invalidate("categories")
+    await db.refresh(db_category)
     return db_category
 
-@router.put("/{category_id}", response_model=CategoryOut)
-def update_category(category_id: int, category: CategoryCreate, db: Session = Depends(get_db)):
-    db_category = db.query(Category).filter(Category.id == category_id).first()
+@router.put("/{category_id}", response_model=CategoryOut, dependencies=[Depends(require_permission("references:write"))])
+async def update_category(category_id: int, category: CategoryCreate, db: AsyncSession = Depends(get_db)):
+    db_category = await db.get(Category, category_id)
     if not db_category:
         raise HTTPException(status_code=404, detail="Category not found")
     
     db_category.name = category.name
-    db.commit()
-    db.refresh(db_category)
+    await db.commit()
+    reference_cache.invalidate("categories")
+    await db.refresh(db_category)
     return db_category
 
-@router.delete("/{category_id}")
-def delete_category(category_id: int, db: Session = Depends(get_db)):
-    db_category = db.query(Category).filter(Category.id == category_id).first()
+@router.delete("/{category_id}", dependencies=[Depends(require_permission("references:write"))])
+async def delete_category(category_id: int, db: AsyncSession = Depends(get_db)):
+    db_category = await db.get(Category, category_id)
     if not db_category:
         raise HTTPException(status_code=404, detail="Category not found")
     
-    db.delete(db_category)
-    db.commit()
+    await db.delete(db_category)
+    await db.commit()
+    reference_cache.invalidate("categories")
     return {"detail": "Category deleted"}
@@ -1,84 +1,78 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.db.database import SessionLocal
+from app.dependencies import current_user, get_db, require_permission
+from app.db.loading import with_plan
 from app.models.models import Company, CompanyType
 from app.schemas.schemas import CompanyOut, CompanyCreate
 
 router = APIRouter(
     prefix="/companies",
-    tags=["companies"]
+    tags=["companies"],
+    dependencies=[Depends(current_user)]
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+async def load_company(db: AsyncSession, company_id: int):
+    """Компания вместе с типом одним запросом (план "company")"""
+    return (await db.scalars(
+        with_plan(select(Company), "company").where(Company.id == company_id)
+    )).first()
+
+def company_to_out(company: Company) -> CompanyOut:
+    return CompanyOut(
+        id=company.id,
+        name=company.name,
+        company_type=company.company_type.name if company.company_type else None
+    )
 
 @router.get("/", response_model=List[CompanyOut])
-def get_companies(db: Session = Depends(get_db)):
-    companies = db.query(Company).all()
-    result = []
-    for company in companies:
-        result.append(
-            CompanyOut(
-                id=company.id,
-                name=company.name,
-                company_type=company.company_type.name if company.company_type else None
-            )
-        )
-    return result
+async def get_companies(db: AsyncSession = Depends(get_db)):
+    # Проекция с JOIN: одно обращение к БД на весь список
+    rows = await db.execute(
+        select(Company.id, Company.name, CompanyType.name.label("company_type"))
+        .outerjoin(CompanyType, CompanyType.id == Company.company_type_id)
+        .order_by(Company.id)
+    )
+    return [
+        CompanyOut(id=row.id, name=row.name, company_type=row.company_type)
+        for row in rows
+    ]
 
 @router.get("/{company_id}", response_model=CompanyOut)
-def get_company(company_id: int, db: Session = Depends(get_db)):
-    company = db.query(Company).filter(Company.id == company_id).first()
+async def get_company(company_id: int, db: AsyncSession = Depends(get_db)):
+    company = await load_company(db, company_id)
     if not company:
         raise HTTPException(status_code=404, detail="Company not found")
     
-    return CompanyOut(
-        id=company.id,
-        name=company.name,
-        company_type=company.company_type.name if company.company_type else None
-    )
+    return company_to_out(company)
 
-@router.post("/", response_model=CompanyOut)
-def create_company(company: CompanyCreate, db: Session = Depends(get_db)):
+@router.post("/", response_model=CompanyOut, dependencies=[Depends(require_permission("companies:write"))])
+async def create_company(company: CompanyCreate, db: AsyncSession = Depends(get_db)):
     db_company = Company(**company.dict())
     db.add(db_company)
-    db.commit()
-    db.refresh(db_company)
-    return CompanyOut(
-        id=db_company.id,
-        name=db_company.name,
-        company_type=db_company.company_type.name if db_company.company_type else None
-    )
+    await db.commit()
+    return company_to_out(await load_company(db, db_company.id))
 
-@router.put("/{company_id}", response_model=CompanyOut)
-def update_company(company_id: int, company: CompanyCreate, db: Session = Depends(get_db)):
-    db_company = db.query(Company).filter(Company.id == company_id).first()
+@router.put("/{company_id}", response_model=CompanyOut, dependencies=[Depends(require_permission("companies:write"))])
+async def update_company(company_id: int, company: CompanyCreate, db: AsyncSession = Depends(get_db)):
+    db_company = await db.get(Company, company_id)
     if not db_company:
         raise HTTPException(status_code=404, detail="Company not found")
     
     db_company.name = company.name
     db_company.company_type_id = company.company_type_id
-    db.commit()
-    db.refresh(db_company)
+    await db.commit()
     
-    return CompanyOut(
-        id=db_company.id,
-        name=db_company.name,
-        company_type=db_company.company_type.name if db_company.company_type else None
-    )
+    return company_to_out(await load_company(db, company_id))
 
-@router.delete("/{company_id}")
-def delete_company(company_id: int, db: Session = Depends(get_db)):
-    db_company = db.query(Company).filter(Company.id == company_id).first()
+@router.delete("/{company_id}", dependencies=[Depends(require_permission("companies:write"))])
+async def delete_company(company_id: int, db: AsyncSession = Depends(get_db)):
+    db_company = await db.get(Company, company_id)
     if not db_company:
         raise HTTPException(status_code=404, detail="Company not found")
     
-    db.delete(db_company)
-    db.commit()
+    await db.delete(db_company)
+    await db.commit()
     return {"detail": "Company deleted"}
@@ -1,58 +1,59 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.db.database import SessionLocal
+from app.dependencies import current_user, get_db, require_permission
+from app.core.cache import reference_cache
 from app.models.models import CompanyType
 from app.schemas.schemas import CompanyTypeOut, CompanyTypeCreate
 
 router = APIRouter(
     prefix="/companytypes",
-    tags=["companytypes"]
+    tags=["companytypes"],
+    dependencies=[Depends(current_user)]
 )
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/", response_model=List[CompanyTypeOut])
-def get_company_types(db: Session = Depends(get_db)):
-    return db.query(CompanyType).all()
+async def get_company_types(request: Request, db: AsyncSession = Depends(get_db)):
+    async def load():
+        return [CompanyTypeOut.model_validate(row, from_attributes=True) for row in (await db.scalars(select(CompanyType))).all()]
+    return await reference_cache.response(request, "companytypes", load)
 
 @router.get("/{company_type_id}", response_model=CompanyTypeOut)
-def get_company_type(company_type_id: int, db: Session = Depends(get_db)):
-    company_type = db.query(CompanyType).filter(CompanyType.id == company_type_id).first()
+async def get_company_type(company_type_id: int, db: AsyncSession = Depends(get_db)):
+    company_type = await db.get(CompanyType, company_type_id)
     if not company_type:
         raise HTTPException(status_code=404, detail="CompanyType not found")
     return company_type
 
-@router.post("/", response_model=CompanyTypeOut)
-def create_company_type(company_type: CompanyTypeCreate, db: Session = Depends(get_db)):
+@router.post("/", response_model=CompanyTypeOut, dependencies=[Depends(require_permission("references:write"))])
+async def create_company_type(company_type: CompanyTypeCreate, db: AsyncSession = Depends(get_db)):
     db_company_type = CompanyType(**company_type.dict())
     db.add(db_company_type)
-    db.commit()
-    db.refresh(db_company_type)
+    await db.commit()
+    reference_cache.invalidate("companytypes")
+    await db.refresh(db_company_type)
     return db_company_type
 
-@router.put("/{company_type_id}", response_model=CompanyTypeOut)
-def update_company_type(company_type_id: int, company_type: CompanyTypeCreate, db: Session = Depends(get_db)):
-    db_company_type = db.query(CompanyType).filter(CompanyType.id == company_type_id).first()
+@router.put("/{company_type_id}", response_model=CompanyTypeOut, dependencies=[Depends(require_permission("references:write"))])
+async def update_company_type(company_type_id: int, company_type: CompanyTypeCreate, db: AsyncSession = Depends(get_db)):
+    db_company_type = await db.get(CompanyType, company_type_id)
     if not db_company_type:
         raise HTTPException(status_code=404, detail="CompanyType not found")
     
     db_company_type.name = company_type.name
-    db.commit()
-    db.refresh(db_company_type)
+    await db.commit()
+    reference_cache.invalidate("companytypes")
+    await db.refresh(db_company_type)
     return db_company_type
 
-@router.delete("/{company_type_id}")
-def delete_company_type(company_type_id: int, db: Session = Depends(get_db)):
-    db_company_type = db.query(CompanyType).filter(CompanyType.id == company_type_id).first()
+@router.delete("/{company_type_id}", dependencies=[Depends(require_permission("references:write"))])
+async def delete_company_type(company_type_id: int, db: AsyncSession = Depends(get_db)):
+    db_company_type = await db.get(CompanyType, company_type_id)
     if not db_company_type:
         raise HTTPException(status_code=404, detail="CompanyType not found")
     
-    db.delete(db_company_type)
-    db.commit()
+    await db.delete(db_company_type)
+    await db.commit()
+    reference_cache.invalidate("companytypes")
     return {"detail": "CompanyType deleted"}
@@ -1,68 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from fastapi import APIRouter, Depends, Header, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert, select, text
 from typing import List, Optional
-from app.db.database import SessionLocal
+from app.dependencies import current_user, get_db, require_permission
 from app.models.models import DocumentLine, Product, StorageZone, Document
-from app.schemas.schemas import DocumentLineOut, DocumentLineCreate, DocumentLineUpdate
+from app.schemas.schemas import DocumentLineOut, DocumentLineCreate, DocumentLineUpdate, DocumentLineBatchCreate
+from app.schemas.schemas import DocumentLineCountBatch
+from app.core.security import Principal
+from app.services import document_stats, idempotency, stock, stock_periods
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/documentlines",
-    tags=["documentlines"]
+    tags=["documentlines"],
+    dependencies=[Depends(current_user)]
 )
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-from sqlalchemy import text
-
 @router.get("/document/{document_id}")
-def get_document_lines_debug(
+async def get_document_lines_debug(
     document_id: int, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Версия с правильным использованием text()"""
-    print(f"=== DEBUG: Getting lines for document {document_id} ===")
-    
+    """
+    Строки документа. Для карточки документа удобнее
+    GET /documents/{id}?include=lines,products,zones.
+    """
     try:
-        # 1. Проверяем подключение к БД (правильно)
-        print("1. Testing DB connection...")
-        db.execute(text("SELECT 1")).fetchone()
-        print("   ✓ DB connection OK")
-        
-        # 2. Проверяем документ
-        print(f"2. Looking for document ID={document_id}...")
-        document = db.query(Document).filter(Document.id == document_id).first()
-        print(f"   Document found: {bool(document)}")
+        # Проверяем документ
+        document = await db.get(Document, document_id)
         
         if not document:
-            print(f"   ✗ Document {document_id} NOT FOUND")
+            logger.debug("Document %s not found", document_id)
             return {"error": f"Document {document_id} not found", "status": 404}
         
-        # 3. Проверяем таблицу document_lines
-        print("3. Checking document_lines table...")
-        try:
-            count = db.query(DocumentLine).count()
-            print(f"   Total lines in DB: {count}")
-        except Exception as e:
-            print(f"   ✗ Error counting lines: {str(e)}")
-            print(f"   Error type: {type(e)}")
-            import traceback
-            traceback.print_exc()
-        
-        # 4. Получаем строки
-        print(f"4. Getting lines for document {document_id}...")
-        lines = db.query(DocumentLine)\
-                 .filter(DocumentLine.document_id == document_id)\
-                 .all()
-        
-        print(f"   Found {len(lines)} lines")
+        # Получаем строки
+        lines = (await db.scalars(
+            select(DocumentLine).where(DocumentLine.document_id == document_id)
+        )).all()
         
-        # 5. Преобразуем в словари
+        # Преобразуем в словари
         result = []
         for line in lines:
             result.append({
@@ -74,7 +52,7 @@ def get_document_lines_debug(
                 "storage_zone_sender_id": line.storage_zone_sender_id,
                 "storage_zone_receiver_id": line.storage_zone_receiver_id
             })
-            print(f"   - Line {line.id}: product={line.product_id}, qty={line.quantity}, actual_qty={line.actual_quantity}")
+        logger.debug("Found %d lines for document %s", len(lines), document_id)
         
         return {
             "document_id": document_id,
@@ -83,21 +61,33 @@ def get_document_lines_debug(
         }
         
     except Exception as e:
-        print(f"=== CRITICAL ERROR ===")
-        print(f"Error type: {type(e)}")
-        print(f"Error message: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error getting lines for document %s", document_id)
         return {"error": str(e), "type": type(e).__name__, "status": 500}
 
-@router.post("/", response_model=dict)
-def create_document_line(document_line: DocumentLineCreate, db: Session = Depends(get_db)):
+@router.post("/", response_model=dict, dependencies=[Depends(require_permission("documents:write"))])
+async def create_document_line(
+    document_line: DocumentLineCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    user: Principal = Depends(current_user),
+    db: AsyncSession = Depends(get_db),
+):
     """
-    Создание строки документа через хранимую процедуру add_document_line
+    Создание строки документа через хранимую процедуру add_document_line.
+    С заголовком Idempotency-Key повтор запроса вернёт первый ответ, не добавляя строку заново
     """
+    if idempotency_key:
+        return await idempotency.run_once(
+            idempotency_key, f"{user.id}:create_document_line", document_line,
+            lambda claim: _create_document_line(document_line, db, claim),
+        )
+    return await _create_document_line(document_line, db)
+
+async def _create_document_line(
+    document_line: DocumentLineCreate, db: AsyncSession, claim: Optional[idempotency.Claim] = None,
+):
+    await stock_periods.check_document_open(db, document_line.document_id)
+    
     try:
-        print(f"📝 Creating line: doc={document_line.document_id}, product={document_line.product_id}")
-        
         # Подготавливаем параметры
         params = {
             "p_document_id": document_line.document_id,
@@ -108,7 +98,7 @@ def create_document_line(document_line: DocumentLineCreate, db: Session = Depend
             "p_storage_to": document_line.storage_zone_receiver_id or None
         }
         
-        print(f"🔍 Procedure params: {params}")
+        logger.debug("add_document_line params: %s", params)
         
         # ВАРИАНТ 1: Вызов процедуры с получением результата
         sql = text("""
@@ -122,7 +112,7 @@ def create_document_line(document_line: DocumentLineCreate, db: Session = Depend
             )
         """)
         
-        result = db.execute(sql, params)
+        result = await db.execute(sql, params)
         
         # Получаем результат из процедуры
         procedure_result = result.fetchone()
@@ -134,34 +124,47 @@ def create_document_line(document_line: DocumentLineCreate, db: Session = Depend
         else:
             # Если процедура не вернула результат, получаем последний ID
             message = "Строка добавлена"
-            result = db.execute(text("SELECT LAST_INSERT_ID()"))
+            result = await db.execute(text("SELECT LAST_INSERT_ID()"))
             new_id = result.scalar()
         
-        # Фиксируем изменения
-        db.commit()
-        
         # Получаем созданную строку
         if new_id:
-            last_line = db.query(DocumentLine).filter(DocumentLine.id == new_id).first()
+            last_line = await db.get(DocumentLine, new_id)
         else:
             # Если не получили ID, ищем последнюю строку для этого документа
-            last_line = db.query(DocumentLine)\
-                         .filter(DocumentLine.document_id == document_line.document_id)\
-                         .order_by(DocumentLine.id.desc())\
-                         .first()
-        
-        return {
+            last_line = (await db.scalars(
+                select(DocumentLine)
+                .where(DocumentLine.document_id == document_line.document_id)
+                .order_by(DocumentLine.id.desc())
+                .limit(1)
+            )).first()
+        
+        # Проводим строку по остаткам в той же транзакции
+        if last_line:
+            await stock.apply_line(db, last_line)
+            await document_stats.lines_changed(db, last_line.document_id, last_line.quantity or 0)
+
+        response = {
             "message": message,
             "line_id": last_line.id if last_line else new_id,
             "line": DocumentLineOut.from_orm(last_line) if last_line else None
         }
-            
+        if claim is not None:
+            # Ответ на повторы фиксируется вместе со строкой
+            await claim.store(db, response)
+
+        # Фиксируем изменения
+        await db.commit()
+
+        return response
+
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         error_msg = str(e)
-        print(f"❌ Error creating document line: {error_msg}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error creating document line for document %s", document_line.document_id)
         
         # Обработка ошибок
         error_lower = error_msg.lower()
@@ -176,24 +179,244 @@ def create_document_line(document_line: DocumentLineCreate, db: Session = Depend
         else:
             raise HTTPException(status_code=400, detail=f"Error creating document line: {error_msg}")
 
-@router.post("/test-sql/", response_model=dict)
-def test_direct_sql(
+MAX_BATCH_LINES = 1000
+
+@router.post("/batch", response_model=dict, dependencies=[Depends(require_permission("documents:write"))])
+async def create_document_lines_batch(batch: DocumentLineBatchCreate, db: AsyncSession = Depends(get_db)):
+    """
+    Пакетное добавление строк в документ одной транзакцией.
+    Проверки те же, что в add_document_line (документ, активный товар,
+    повтор товара в документе, зоны хранения), но выполняются пачкой.
+    Если хоть одна строка не прошла проверку, ничего не сохраняется,
+    а ошибки возвращаются по каждой строке (index — позиция в lines).
+    """
+    if not batch.lines:
+        raise HTTPException(status_code=400, detail="No lines to add")
+    if len(batch.lines) > MAX_BATCH_LINES:
+        raise HTTPException(status_code=400, detail=f"Too many lines: at most {MAX_BATCH_LINES} per request")
+
+    if not await db.get(Document, batch.document_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    await stock_periods.check_document_open(db, batch.document_id)
+
+    product_ids = {line.product_id for line in batch.lines}
+    zone_ids = {
+        zone_id
+        for line in batch.lines
+        for zone_id in (line.storage_zone_sender_id, line.storage_zone_receiver_id)
+        if zone_id
+    }
+
+    active_products = set((await db.scalars(
+        select(Product.id).where(Product.id.in_(product_ids), Product.is_active.is_(True))
+    )).all())
+    existing_zones = set((await db.scalars(
+        select(StorageZone.id).where(StorageZone.id.in_(zone_ids))
+    )).all()) if zone_ids else set()
+    products_in_document = set((await db.scalars(
+        select(DocumentLine.product_id).where(
+            DocumentLine.document_id == batch.document_id,
+            DocumentLine.product_id.in_(product_ids),
+        )
+    )).all())
+
+    errors = []
+    seen_products = set()
+    for index, line in enumerate(batch.lines):
+        if line.product_id not in active_products:
+            errors.append({"index": index, "product_id": line.product_id,
+                           "status": 404, "error": "Product not found or inactive"})
+        elif line.product_id in products_in_document or line.product_id in seen_products:
+            errors.append({"index": index, "product_id": line.product_id,
+                           "status": 409, "error": "Product already exists in document"})
+        else:
+            for zone_id in (line.storage_zone_sender_id, line.storage_zone_receiver_id):
+                if zone_id and zone_id not in existing_zones:
+                    errors.append({"index": index, "product_id": line.product_id,
+                                   "status": 404, "error": f"Storage zone {zone_id} not found"})
+                    break
+        seen_products.add(line.product_id)
+
+    if errors:
+        raise HTTPException(status_code=422, detail={"errors": errors})
+
+    rows = [
+        {
+            "document_id": batch.document_id,
+            "product_id": line.product_id,
+            "quantity": line.quantity,
+            "actual_quantity": line.actual_quantity,
+            "storage_zone_sender_id": line.storage_zone_sender_id or None,
+            "storage_zone_receiver_id": line.storage_zone_receiver_id or None,
+        }
+        for line in batch.lines
+    ]
+
+    try:
+        # Один многострочный INSERT ... VALUES (...), (...)
+        await db.execute(insert(DocumentLine).values(rows))
+
+        movements = []
+        for row in rows:
+            movements.extend(stock.line_movements(
+                row["product_id"], row["quantity"],
+                row["storage_zone_sender_id"], row["storage_zone_receiver_id"],
+            ))
+        await stock.apply_movements(db, movements)
+        await document_stats.lines_changed(
+            db, batch.document_id, sum(row["quantity"] or 0 for row in rows),
+        )
+
+        # Товар в документе уникален, поэтому id новых строк однозначно находятся по product_id
+        new_ids = dict((await db.execute(
+            select(DocumentLine.product_id, DocumentLine.id).where(
+                DocumentLine.document_id == batch.document_id,
+                DocumentLine.product_id.in_(product_ids),
+            )
+        )).all())
+
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error creating document lines: {str(e)}")
+
+    return {
+        "message": f"Добавлено строк: {len(rows)}",
+        "document_id": batch.document_id,
+        "line_ids": [new_ids.get(line.product_id) for line in batch.lines],
+    }
+
+MAX_COUNT_LINES = 50000
+
+@router.patch("/actual", response_model=dict, dependencies=[Depends(require_permission("documents:write"))])
+async def update_actual_quantities(batch: DocumentLineCountBatch, db: AsyncSession = Depends(get_db)):
+    """
+    Пакетная запись фактических количеств (actual_quantity) по результатам
+    пересчёта. Строки документа читаются одним запросом, новые значения
+    кладутся во временную таблицу и переносятся одним UPDATE ... JOIN.
+    Остатки и сводка не меняются: они считаются по quantity.
+    В ответе — только расхождения факта с ожидаемым количеством.
+    Если у товара в документе несколько строк, счёт по product_id
+    отклоняется с 409: для такой строки нужен line_id.
+    """
+    if not batch.counts:
+        raise HTTPException(status_code=400, detail="No counts to apply")
+    if len(batch.counts) > MAX_COUNT_LINES:
+        raise HTTPException(status_code=400, detail=f"Too many counts: at most {MAX_COUNT_LINES} per request")
+
+    if not await db.get(Document, batch.document_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    await stock_periods.check_document_open(db, batch.document_id)
+
+    lines = (await db.execute(
+        select(DocumentLine.id, DocumentLine.product_id, DocumentLine.quantity, DocumentLine.actual_quantity)
+        .where(DocumentLine.document_id == batch.document_id)
+    )).all()
+    by_id = {line.id: line for line in lines}
+    by_product = {}
+    for line in lines:
+        by_product.setdefault(line.product_id, []).append(line)
+
+    errors = []
+    ambiguous = []
+    actual = {}
+    for index, count in enumerate(batch.counts):
+        if (count.line_id is None) == (count.product_id is None):
+            errors.append({"index": index, "status": 400, "error": "Specify either line_id or product_id"})
+            continue
+        if count.line_id is not None:
+            line = by_id.get(count.line_id)
+        else:
+            product_lines = by_product.get(count.product_id, [])
+            if len(product_lines) > 1:
+                ambiguous.append({"index": index, "product_id": count.product_id,
+                                  "line_ids": [product_line.id for product_line in product_lines],
+                                  "status": 409, "error": "Product has several lines in document, specify line_id"})
+                continue
+            line = product_lines[0] if product_lines else None
+        if line is None:
+            errors.append({"index": index, "line_id": count.line_id, "product_id": count.product_id,
+                           "status": 404, "error": "Line not found in document"})
+        elif line.id in actual:
+            errors.append({"index": index, "line_id": line.id, "product_id": line.product_id,
+                           "status": 409, "error": "Line counted twice"})
+        else:
+            actual[line.id] = count.actual_quantity
+
+    if ambiguous:
+        raise HTTPException(status_code=409, detail={"errors": ambiguous + errors})
+    if errors:
+        raise HTTPException(status_code=422, detail={"errors": errors})
+
+    try:
+        # Временная таблица живёт в соединении, поэтому её удаляют и до, и после:
+        # после ошибки соединение вернётся в пул вместе с ней
+        await db.execute(text("DROP TEMPORARY TABLE IF EXISTS tmp_line_counts"))
+        await db.execute(text("""
+            CREATE TEMPORARY TABLE tmp_line_counts (
+                line_id INT PRIMARY KEY,
+                actual_quantity INT NOT NULL
+            ) ENGINE = MEMORY
+        """))
+        await db.execute(
+            text("INSERT INTO tmp_line_counts (line_id, actual_quantity) VALUES (:line_id, :actual_quantity)"),
+            [{"line_id": line_id, "actual_quantity": value} for line_id, value in actual.items()],
+        )
+        result = await db.execute(
+            text("""
+                UPDATE documentlines dl
+                JOIN tmp_line_counts c ON c.line_id = dl.id
+                SET dl.actual_quantity = c.actual_quantity
+                WHERE dl.document_id = :document_id
+            """),
+            {"document_id": batch.document_id},
+        )
+        await db.execute(text("DROP TEMPORARY TABLE tmp_line_counts"))
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logger.exception("Error applying counts to document %s", batch.document_id)
+        raise HTTPException(status_code=400, detail=f"Error applying counts: {str(e)}")
+
+    discrepancies = [
+        {
+            "line_id": line_id,
+            "product_id": by_id[line_id].product_id,
+            "expected": by_id[line_id].quantity,
+            "actual": value,
+            "difference": value - by_id[line_id].quantity,
+        }
+        for line_id, value in actual.items()
+        if value != by_id[line_id].quantity
+    ]
+    return {
+        "document_id": batch.document_id,
+        "counted": len(actual),
+        "updated": result.rowcount,
+        "matched": len(actual) - len(discrepancies),
+        "not_counted": sum(1 for line in lines if line.actual_quantity is None and line.id not in actual),
+        "surplus": sum(d["difference"] for d in discrepancies if d["difference"] > 0),
+        "shortage": -sum(d["difference"] for d in discrepancies if d["difference"] < 0),
+        "discrepancies": discrepancies,
+    }
+
+@router.post("/test-sql/", response_model=dict, dependencies=[Depends(require_permission("documents:write"))])
+async def test_direct_sql(
     document_id: int,
     product_id: int,
     quantity: int = 1,
     actual_quantity: Optional[int] = None,
     storage_from: Optional[int] = None,
     storage_to: Optional[int] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Тестовый прямой SQL запрос"""
-    print(f"🧪 TEST SQL: doc={document_id}, product={product_id}")
+    await stock_periods.check_document_open(db, document_id)
     
     try:
         # 1. Сначала просто проверьте доступность таблицы
         test_query = text("SELECT 1 FROM documentlines LIMIT 1")
-        db.execute(test_query)
-        print("✅ Таблица documentlines доступна")
+        await db.execute(test_query)
         
         # 2. Простой INSERT
         sql = text("""
@@ -212,13 +435,10 @@ def test_direct_sql(
             "to_zone": storage_to
         }
         
-        print(f"🔍 SQL: {sql}")
-        print(f"🔍 Параметры: {params}")
-        
-        result = db.execute(sql, params)
-        db.commit()
-        
-        print(f"✅ Успешно! ID строки: {result.lastrowid}")
+        result = await db.execute(sql, params)
+        await stock.apply_movements(db, stock.line_movements(product_id, quantity, storage_from, storage_to))
+        await document_stats.lines_changed(db, document_id, quantity or 0)
+        await db.commit()
         
         return {
             "success": True,
@@ -227,21 +447,19 @@ def test_direct_sql(
         }
         
     except Exception as e:
-        db.rollback()
-        print(f"❌ Ошибка: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        await db.rollback()
+        logger.exception("Test SQL insert failed for document %s", document_id)
         return {
             "success": False,
             "error": str(e),
             "error_type": type(e).__name__
         }
 
-@router.put("/{line_id}", response_model=dict)
-def update_document_line(
+@router.put("/{line_id}", response_model=dict, dependencies=[Depends(require_permission("documents:write"))])
+async def update_document_line(
     line_id: int, 
     document_line: DocumentLineUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Обновление строки документа через хранимую процедуру update_document_line
@@ -250,12 +468,13 @@ def update_document_line(
     if all(value is None for value in document_line.dict().values()):
         raise HTTPException(status_code=400, detail="No fields to update")
     
+    existing_line = await db.get(DocumentLine, line_id)
+    if not existing_line:
+        raise HTTPException(status_code=404, detail="Document line not found")
+    await stock_periods.check_document_open(db, existing_line.document_id)
+    
     try:
         # Используем текущие значения, если новые не предоставлены
-        existing_line = db.query(DocumentLine).filter(DocumentLine.id == line_id).first()
-        if not existing_line:
-            raise HTTPException(status_code=404, detail="Document line not found")
-        
         # Подготавливаем параметры с actual_quantity
         params = {
             "p_line_id": line_id,
@@ -265,8 +484,12 @@ def update_document_line(
             "p_storage_to": document_line.storage_zone_receiver_id if document_line.storage_zone_receiver_id is not None else existing_line.storage_zone_receiver_id
         }
         
+        # Снимаем с остатков старую версию строки
+        old_quantity = existing_line.quantity or 0
+        await stock.apply_line(db, existing_line, sign=-1)
+        
         # Вызываем обновленную хранимую процедуру update_document_line
-        result = db.execute(
+        result = await db.execute(
             text("CALL update_document_line(:p_line_id, :p_quantity, :p_actual_quantity, :p_storage_from, :p_storage_to)"),
             params
         )
@@ -274,11 +497,16 @@ def update_document_line(
         # Получаем результат процедуры
         message = result.fetchone()[0] if result.rowcount > 0 else "Строка документа обновлена"
         
-        # Фиксируем изменения
-        db.commit()
+        # Получаем обновленную строку и проводим её новую версию
+        updated_line = await db.get(DocumentLine, line_id, populate_existing=True)
+        if updated_line:
+            await stock.apply_line(db, updated_line)
+            await document_stats.lines_changed(
+                db, updated_line.document_id, (updated_line.quantity or 0) - old_quantity,
+            )
         
-        # Получаем обновленную строку
-        updated_line = db.query(DocumentLine).filter(DocumentLine.id == line_id).first()
+        # Фиксируем изменения
+        await db.commit()
         
         return {
             "message": message,
@@ -287,7 +515,7 @@ def update_document_line(
         }
             
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         error_msg = str(e)
         
         if "Строка документа с таким ID не найдена" in error_msg:
@@ -297,29 +525,32 @@ def update_document_line(
         else:
             raise HTTPException(status_code=400, detail=f"Error updating document line: {error_msg}")
 
-@router.delete("/{line_id}")
-def delete_document_line(line_id: int, db: Session = Depends(get_db)):
+@router.delete("/{line_id}", dependencies=[Depends(require_permission("documents:write"))])
+async def delete_document_line(line_id: int, db: AsyncSession = Depends(get_db)):
     """
     Удаление строки документа
     """
-    db_line = db.query(DocumentLine).filter(DocumentLine.id == line_id).first()
+    db_line = await db.get(DocumentLine, line_id)
     if not db_line:
         raise HTTPException(status_code=404, detail="Document line not found")
+    await stock_periods.check_document_open(db, db_line.document_id)
     
     try:
-        db.delete(db_line)
-        db.commit()
+        await stock.apply_line(db, db_line, sign=-1)
+        await document_stats.lines_changed(db, db_line.document_id, -(db_line.quantity or 0))
+        await db.delete(db_line)
+        await db.commit()
         return {"message": f"Document line {line_id} deleted successfully"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error deleting document line: {str(e)}")
 
 @router.get("/{line_id}", response_model=DocumentLineOut)
-def get_document_line(line_id: int, db: Session = Depends(get_db)):
+async def get_document_line(line_id: int, db: AsyncSession = Depends(get_db)):
     """
     Получение конкретной строки документа по ID
     """
-    db_line = db.query(DocumentLine).filter(DocumentLine.id == line_id).first()
+    db_line = await db.get(DocumentLine, line_id)
     if not db_line:
         raise HTTPException(status_code=404, detail="Document line not found")
     
@@ -1,11 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import aliased
 from typing import List, Optional
 from datetime import date
-from app.db.database import SessionLocal
-from app.models.models import Document, Company, DocumentType  # Убраны лишние импорты
-from app.schemas.schemas import DocumentOut, DocumentCreate, DocumentUpdate
+from fastapi.responses import StreamingResponse
+from app.db.database import AsyncSessionLocal
+from app.dependencies import current_user, get_db, require_permission
+from app.db.loading import with_plan
+from app.models.models import Document, Company, DocumentType, DocumentLine, Product, StorageZone
+from app.schemas.schemas import DocumentOut, DocumentCreate, DocumentUpdate, DocumentPage
+from app.schemas.schemas import DocumentDetailOut, DocumentLineDetail
+from app.core.pagination import decode_cursor, encode_cursor, keyset_after
+from app.core.security import Principal
+from app.services import document_stats, idempotency, stock, stock_periods
+import csv
+import io
+import json
 import logging
 import traceback
 
@@ -13,118 +24,306 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/documents",
-    tags=["documents"]
+    tags=["documents"],
+    dependencies=[Depends(current_user)]
 )
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-@router.get("/", response_model=List[DocumentOut])
-def get_documents(
-    skip: int = 0,
-    limit: int = 100,
+@router.get("/", response_model=DocumentPage)
+async def get_documents(
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
     document_type_id: Optional[int] = None,
     company_id: Optional[int] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(Document)
+    """
+    Документы от новых к старым с keyset-пагинацией по (date, id).
+    Следующую страницу запрашивают с cursor=next_cursor из предыдущего ответа.
+    """
+    query = with_plan(select(Document), "document")
     
     # Фильтры
     if document_type_id:
-        query = query.filter(Document.document_type_id == document_type_id)
+        query = query.where(Document.document_type_id == document_type_id)
     if company_id:
-        query = query.filter(Document.company_id == company_id)
+        query = query.where(Document.company_id == company_id)
     if start_date:
-        query = query.filter(Document.date >= start_date)
+        query = query.where(Document.date >= start_date)
     if end_date:
-        query = query.filter(Document.date <= end_date)
+        query = query.where(Document.date <= end_date)
+    
+    # Продолжаем строго после последней строки предыдущей страницы
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor, 2)
+        try:
+            cursor_date = date.fromisoformat(cursor_date)
+            cursor_id = int(cursor_id)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(
+            keyset_after(Document.date, Document.id, cursor_date, cursor_id, descending=True)
+        )
     
-    docs = query.offset(skip).limit(limit).all()
+    query = query.order_by(Document.date.desc(), Document.id.desc()).limit(limit + 1)
+    docs = (await db.scalars(query)).all()
     
-    return docs
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor([docs[-1].date.isoformat(), docs[-1].id])
+    
+    return {"items": docs, "next_cursor": next_cursor}
+
+EXPORT_DOCUMENT_COLUMNS = ["id", "number", "date", "comment", "company_id", "document_type_id"]
+EXPORT_LINE_COLUMNS = [
+    "id", "product_id", "quantity", "actual_quantity",
+    "storage_zone_sender_id", "storage_zone_receiver_id",
+]
+EXPORT_BATCH_SIZE = 1000
+
+def export_query(start_date: Optional[date], end_date: Optional[date]):
+    """Документы со строками, упорядоченные так, чтобы строки документа шли подряд"""
+    query = select(
+        *[getattr(Document, c) for c in EXPORT_DOCUMENT_COLUMNS],
+        *[getattr(DocumentLine, c).label(f"line_{c}") for c in EXPORT_LINE_COLUMNS],
+    ).outerjoin(DocumentLine, DocumentLine.document_id == Document.id)
+    if start_date:
+        query = query.where(Document.date >= start_date)
+    if end_date:
+        query = query.where(Document.date <= end_date)
+    return query.order_by(Document.date, Document.id, DocumentLine.id) \
+                .execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+async def stream_export_rows(query):
+    """
+    Читает результат серверным курсором. Сессия открывается внутри
+    генератора: она должна жить, пока ответ отдаётся клиенту.
+    """
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(query)
+        async for partition in result.partitions():
+            yield partition
+
+async def export_ndjson(query):
+    """Одна строка NDJSON на документ, строки документа вложены в "lines" """
+    current = None
+    buffer = []
+    async for partition in stream_export_rows(query):
+        for row in partition:
+            if current is None or current["id"] != row.id:
+                if current is not None:
+                    buffer.append(json.dumps(current, default=str, ensure_ascii=False))
+                current = {c: getattr(row, c) for c in EXPORT_DOCUMENT_COLUMNS}
+                current["lines"] = []
+            if row.line_id is not None:
+                current["lines"].append({c: getattr(row, f"line_{c}") for c in EXPORT_LINE_COLUMNS})
+        if buffer:
+            yield "\n".join(buffer) + "\n"
+            buffer = []
+    if current is not None:
+        yield json.dumps(current, default=str, ensure_ascii=False) + "\n"
+
+async def export_csv(query):
+    """Плоский CSV: одна строка на строку документа (документ без строк — одна строка)"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(
+        [f"document_{c}" for c in EXPORT_DOCUMENT_COLUMNS] +
+        [f"line_{c}" for c in EXPORT_LINE_COLUMNS]
+    )
+    yield output.getvalue()
+    async for partition in stream_export_rows(query):
+        output.seek(0)
+        output.truncate()
+        writer.writerows(partition)
+        yield output.getvalue()
+
+@router.get("/export")
+async def export_documents(
+    export_format: str = Query("ndjson", alias="format", enum=["ndjson", "csv"]),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+):
+    """
+    Потоковая выгрузка документов вместе со строками за период.
+    Память не зависит от размера периода: строки читаются серверным
+    курсором пачками по EXPORT_BATCH_SIZE и сразу отдаются клиенту.
+    """
+    query = export_query(start_date, end_date)
+    if export_format == "csv":
+        return StreamingResponse(
+            export_csv(query),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": 'attachment; filename="documents.csv"'},
+        )
+    return StreamingResponse(export_ndjson(query), media_type="application/x-ndjson")
+
+async def load_document(db: AsyncSession, document_id: int):
+    """Документ с компанией и типом одним запросом (план "document")"""
+    return (await db.scalars(
+        with_plan(select(Document), "document")
+        .where(Document.id == document_id)
+        .execution_options(populate_existing=True)
+    )).first()
+
+# Что можно встроить в ответ GET /documents/{id}; products и zones подразумевают lines
+DOCUMENT_INCLUDES = {"lines", "products", "zones"}
 
-@router.get("/{document_id}", response_model=DocumentOut)
-def get_document(document_id: int, db: Session = Depends(get_db)):
-    doc = db.query(Document).filter(Document.id == document_id).first()
+def parse_include(include: Optional[str]) -> set:
+    parts = {part.strip() for part in (include or "").split(",") if part.strip()}
+    unknown = parts - DOCUMENT_INCLUDES
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"include: неизвестные значения {sorted(unknown)}, допустимы {sorted(DOCUMENT_INCLUDES)}",
+        )
+    if parts & {"products", "zones"}:
+        parts.add("lines")
+    return parts
+
+async def load_document_lines(
+    db: AsyncSession, document_id: int, products: bool = False, zones: bool = False
+) -> List[DocumentLineDetail]:
+    """Строки документа вместе с именами товаров и зон одним запросом (LEFT JOIN)"""
+    columns = [DocumentLine]
+    query_joins = []
+    if products:
+        columns += [Product.name.label("product_name"), Product.article.label("product_article")]
+        query_joins.append((Product, Product.id == DocumentLine.product_id))
+    if zones:
+        sender = aliased(StorageZone)
+        receiver = aliased(StorageZone)
+        columns += [
+            sender.name.label("storage_zone_sender_name"),
+            receiver.name.label("storage_zone_receiver_name"),
+        ]
+        query_joins += [
+            (sender, sender.id == DocumentLine.storage_zone_sender_id),
+            (receiver, receiver.id == DocumentLine.storage_zone_receiver_id),
+        ]
+
+    query = select(*columns)
+    for target, on in query_joins:
+        query = query.outerjoin(target, on)
+    query = query.where(DocumentLine.document_id == document_id).order_by(DocumentLine.id)
+
+    lines = []
+    for row in await db.execute(query):
+        line, extra = row[0], row._mapping
+        lines.append(DocumentLineDetail(
+            id=line.id,
+            document_id=line.document_id,
+            product_id=line.product_id,
+            quantity=line.quantity,
+            actual_quantity=line.actual_quantity,
+            storage_zone_sender_id=line.storage_zone_sender_id,
+            storage_zone_receiver_id=line.storage_zone_receiver_id,
+            product_name=extra.get("product_name"),
+            product_article=extra.get("product_article"),
+            storage_zone_sender_name=extra.get("storage_zone_sender_name"),
+            storage_zone_receiver_name=extra.get("storage_zone_receiver_name"),
+        ))
+    return lines
+
+@router.get("/{document_id}", response_model=DocumentDetailOut)
+async def get_document(
+    document_id: int,
+    include: Optional[str] = Query(None, description="Через запятую: lines, products, zones"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Документ с компанией и типом; с include=lines,products,zones — вместе
+    со строками, именами товаров и зон. Всего не больше двух запросов.
+    """
+    includes = parse_include(include)
+    doc = await load_document(db, document_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
-    
-    return doc
 
-@router.post("/", response_model=DocumentOut)
-def create_document(document: DocumentCreate, db: Session = Depends(get_db)):
+    result = DocumentDetailOut.model_validate(doc, from_attributes=True)
+    if "lines" in includes:
+        result.lines = await load_document_lines(
+            db, document_id, products="products" in includes, zones="zones" in includes,
+        )
+    return result
+
+@router.post("/", response_model=DocumentOut, dependencies=[Depends(require_permission("documents:write"))])
+async def create_document(document: DocumentCreate, db: AsyncSession = Depends(get_db)):
     # Проверяем существование типа документа
-    doc_type = db.query(DocumentType).filter(DocumentType.id == document.document_type_id).first()
+    doc_type = await db.get(DocumentType, document.document_type_id)
     if not doc_type:
         raise HTTPException(status_code=404, detail="Document type not found")
     
     # Проверяем существование компании (если указана)
     if document.company_id:
-        company = db.query(Company).filter(Company.id == document.company_id).first()
+        company = await db.get(Company, document.company_id)
         if not company:
             raise HTTPException(status_code=404, detail="Company not found")
     
+    await stock_periods.check_date_open(db, document.date)
+    
     # Создаем документ
     db_doc = Document(**document.dict(exclude={"zone_id", "employee_id"}))
     db.add(db_doc)
-    db.commit()
-    db.refresh(db_doc)
+    await db.flush()
+    await document_stats.document_added(db, db_doc)
+    await db.commit()
     
-    return db_doc
+    return await load_document(db, db_doc.id)
+
+@router.post("/create_inv_doc", dependencies=[Depends(require_permission("documents:inventory"))])
+async def create_inventory_document(
+    doc: DocumentCreate,
+    prefill: bool = Query(False, description="Сразу добавить строки по всем товарам с остатком в зоне"),
+    db: AsyncSession = Depends(get_db),
+):
+    if prefill and not doc.zone_id:
+        raise HTTPException(status_code=400, detail="Для заполнения по остаткам нужен zone_id")
 
-@router.post("/create_inv_doc")
-def create_inventory_document(doc: DocumentCreate, db: Session = Depends(get_db)):
     try:
-        logger.info(f"🎯 Начало создания документа. Данные: {doc.dict()}")
-        
-        # Логируем отдельные поля
-        logger.info(f"📄 Номер: {doc.number}")
-        logger.info(f"📅 Дата: {doc.date}")
-        logger.info(f"🔢 Тип документа: {doc.document_type_id}")
-        logger.info(f"🏢 company_id: {doc.company_id}")
-        logger.info(f" employee_id: {doc.employee_id}")
+        logger.info("Creating inventory document: %s", doc)
 
         sql = text("""
             CALL create_inventory_document(
                 :p_zone_id, :p_employee_id)
         """)
         
-        result = db.execute(sql, {
+        result = await db.execute(sql, {
             'p_zone_id': doc.zone_id,
             'p_employee_id': doc.employee_id,
         })
 
-        db.commit()
-
         row = result.fetchone()
         if row:
             document_id = row[0]
-            logger.info(f"✅ Документ создан с ID: {document_id}")
+            lines_added = 0
+            if prefill:
+                lines_added = await stock.prefill_inventory(db, document_id, doc.zone_id)
+            # Сводка считает сумму строк сама, поэтому вызывается после заполнения
+            await document_stats.document_added_by_id(db, document_id)
+            await db.commit()
+            logger.info("Inventory document %s created with %s lines", document_id, lines_added)
             
             # Получаем полные данные документа
-            document = db.query(Document).filter(Document.id == document_id).first()
+            document = await db.get(Document, document_id)
             
             return {
                 "success": True,
                 "document": document,
+                "lines_added": lines_added,
                 "message": "Document inventory created successfully"
             }
         else:
-            logger.error("❌ Процедура не вернула ID документа")
+            logger.error("create_inventory_document returned no document id")
             raise HTTPException(status_code=500, detail="Failed to create document")
             
     except Exception as e:
-        logger.error(f"🔥 КРИТИЧЕСКАЯ ОШИБКА: {str(e)}")
-        logger.error(f"🔥 Трассировка:\n{traceback.format_exc()}")
+        logger.exception("Error creating inventory document")
         
         # Откатываем транзакцию
-        db.rollback()
+        await db.rollback()
         
         raise HTTPException(
             status_code=500,
@@ -135,53 +334,65 @@ def create_inventory_document(doc: DocumentCreate, db: Session = Depends(get_db)
             }
         )
 
-@router.post("/create_rec_doc")
-def create_receipt_document(doc: DocumentCreate, db: Session = Depends(get_db)):
+@router.post("/create_rec_doc", dependencies=[Depends(require_permission("documents:receipt"))])
+async def create_receipt_document(
+    doc: DocumentCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    user: Principal = Depends(current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """С заголовком Idempotency-Key повтор запроса вернёт первый ответ, не создавая документ заново"""
+    if idempotency_key:
+        return await idempotency.run_once(
+            idempotency_key, f"{user.id}:create_rec_doc", doc, lambda claim: _create_receipt_document(doc, db, claim),
+        )
+    return await _create_receipt_document(doc, db)
+
+async def _create_receipt_document(doc: DocumentCreate, db: AsyncSession, claim: Optional[idempotency.Claim] = None):
     try:
-        logger.info(f"🎯 Начало создания документа. Данные: {doc.dict()}")
-        
-        # Логируем отдельные поля
-        logger.info(f"📄 Номер: {doc.number}")
-        logger.info(f"📅 Дата: {doc.date}")
-        logger.info(f"🔢 Тип документа: {doc.document_type_id}")
-        logger.info(f"🏢 company_id: {doc.company_id}")
-        logger.info(f" employee_id: {doc.employee_id}")
+        logger.info("Creating receipt document: %s", doc)
 
         sql = text("""
             CALL create_receipt_document(
                 :p_company_id, :p_employee_id)
         """)
         
-        result = db.execute(sql, {
+        result = await db.execute(sql, {
             'p_company_id': doc.company_id,
             'p_employee_id': doc.employee_id,
         })
 
-        db.commit()
-
         row = result.fetchone()
         if row:
             document_id = row[0]
-            logger.info(f"✅ Документ создан с ID: {document_id}")
-            
+            await document_stats.document_added_by_id(db, document_id)
+
             # Получаем полные данные документа
-            document = db.query(Document).filter(Document.id == document_id).first()
-            
-            return {
+            document = await db.get(Document, document_id)
+            response = {
                 "success": True,
                 "document": document,
                 "message": "Document receipt created successfully"
             }
+            if claim is not None:
+                # Ответ на повторы фиксируется вместе с документом
+                await claim.store(db, response)
+            await db.commit()
+            logger.info("Receipt document %s created", document_id)
+
+            return response
         else:
-            logger.error("❌ Процедура не вернула ID документа")
+            logger.error("create_receipt_document returned no document id")
             raise HTTPException(status_code=500, detail="Failed to create document")
-            
+
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
-        logger.error(f"🔥 КРИТИЧЕСКАЯ ОШИБКА: {str(e)}")
-        logger.error(f"🔥 Трассировка:\n{traceback.format_exc()}")
+        logger.exception("Error creating receipt document")
         
         # Откатываем транзакцию
-        db.rollback()
+        await db.rollback()
         
         raise HTTPException(
             status_code=500,
@@ -192,36 +403,29 @@ def create_receipt_document(doc: DocumentCreate, db: Session = Depends(get_db)):
             }
         )
     
-@router.post("/create_trn_doc")
-def create_transfer_document(doc: DocumentCreate, db: Session = Depends(get_db)):
+@router.post("/create_trn_doc", dependencies=[Depends(require_permission("documents:transfer"))])
+async def create_transfer_document(doc: DocumentCreate, db: AsyncSession = Depends(get_db)):
     try:
-        logger.info(f"🎯 Начало создания документа. Данные: {doc.dict()}")
-        
-        # Логируем отдельные поля
-        logger.info(f"📄 Номер: {doc.number}")
-        logger.info(f"📅 Дата: {doc.date}")
-        logger.info(f"🔢 Тип документа: {doc.document_type_id}")
-        logger.info(f"🏢 company_id: {doc.company_id}")
-        logger.info(f" employee_id: {doc.employee_id}")
+        logger.info("Creating transfer document: %s", doc)
 
         sql = text("""
             CALL create_transfer_document(
                 :p_employee_id)
         """)
         
-        result = db.execute(sql, {
+        result = await db.execute(sql, {
             'p_employee_id': doc.employee_id,
         })
 
-        db.commit()
-
         row = result.fetchone()
         if row:
             document_id = row[0]
-            logger.info(f"✅ Документ создан с ID: {document_id}")
+            await document_stats.document_added_by_id(db, document_id)
+            await db.commit()
+            logger.info("Transfer document %s created", document_id)
             
             # Получаем полные данные документа
-            document = db.query(Document).filter(Document.id == document_id).first()
+            document = await db.get(Document, document_id)
             
             return {
                 "success": True,
@@ -229,15 +433,14 @@ def create_transfer_document(doc: DocumentCreate, db: Session = Depends(get_db))
                 "message": "Document transfer created successfully"
             }
         else:
-            logger.error("❌ Процедура не вернула ID документа")
+            logger.error("create_transfer_document returned no document id")
             raise HTTPException(status_code=500, detail="Failed to create document")
             
     except Exception as e:
-        logger.error(f"🔥 КРИТИЧЕСКАЯ ОШИБКА: {str(e)}")
-        logger.error(f"🔥 Трассировка:\n{traceback.format_exc()}")
+        logger.exception("Error creating transfer document")
         
         # Откатываем транзакцию
-        db.rollback()
+        await db.rollback()
         
         raise HTTPException(
             status_code=500,
@@ -248,53 +451,65 @@ def create_transfer_document(doc: DocumentCreate, db: Session = Depends(get_db))
             }
         )
     
-@router.post("/create_wrf_doc")
-def create_writeoff_document(doc: DocumentCreate, db: Session = Depends(get_db)):
+@router.post("/create_wrf_doc", dependencies=[Depends(require_permission("documents:writeoff"))])
+async def create_writeoff_document(
+    doc: DocumentCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    user: Principal = Depends(current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """С заголовком Idempotency-Key повтор запроса вернёт первый ответ, не создавая документ заново"""
+    if idempotency_key:
+        return await idempotency.run_once(
+            idempotency_key, f"{user.id}:create_wrf_doc", doc, lambda claim: _create_writeoff_document(doc, db, claim),
+        )
+    return await _create_writeoff_document(doc, db)
+
+async def _create_writeoff_document(doc: DocumentCreate, db: AsyncSession, claim: Optional[idempotency.Claim] = None):
     try:
-        logger.info(f"🎯 Начало создания документа. Данные: {doc.dict()}")
-        
-        # Логируем отдельные поля
-        logger.info(f"📄 Номер: {doc.number}")
-        logger.info(f"📅 Дата: {doc.date}")
-        logger.info(f"🔢 Тип документа: {doc.document_type_id}")
-        logger.info(f"🏢 company_id: {doc.company_id}")
-        logger.info(f" employee_id: {doc.employee_id}")
+        logger.info("Creating writeoff document: %s", doc)
 
         sql = text("""
             CALL create_writeoff_document(
                 :p_company_id, :p_employee_id)
         """)
         
-        result = db.execute(sql, {
+        result = await db.execute(sql, {
             'p_company_id': doc.company_id,
             'p_employee_id': doc.employee_id,
         })
 
-        db.commit()
-
         row = result.fetchone()
         if row:
             document_id = row[0]
-            logger.info(f"✅ Документ создан с ID: {document_id}")
-            
+            await document_stats.document_added_by_id(db, document_id)
+
             # Получаем полные данные документа
-            document = db.query(Document).filter(Document.id == document_id).first()
-            
-            return {
+            document = await db.get(Document, document_id)
+            response = {
                 "success": True,
                 "document": document,
                 "message": "Document writeoff created successfully"
             }
+            if claim is not None:
+                # Ответ на повторы фиксируется вместе с документом
+                await claim.store(db, response)
+            await db.commit()
+            logger.info("Writeoff document %s created", document_id)
+
+            return response
         else:
-            logger.error("❌ Процедура не вернула ID документа")
+            logger.error("create_writeoff_document returned no document id")
             raise HTTPException(status_code=500, detail="Failed to create document")
-            
+
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
-        logger.error(f"🔥 КРИТИЧЕСКАЯ ОШИБКА: {str(e)}")
-        logger.error(f"🔥 Трассировка:\n{traceback.format_exc()}")
+        logger.exception("Error creating writeoff document")
         
         # Откатываем транзакцию
-        db.rollback()
+        await db.rollback()
         
         raise HTTPException(
             status_code=500,
@@ -306,21 +521,21 @@ def create_writeoff_document(doc: DocumentCreate, db: Session = Depends(get_db))
         )
     
 
-@router.put("/{document_id}", response_model=DocumentOut)
-def update_document(document_id: int, document: DocumentUpdate, db: Session = Depends(get_db)):
-    db_doc = db.query(Document).filter(Document.id == document_id).first()
+@router.put("/{document_id}", response_model=DocumentOut, dependencies=[Depends(require_permission("documents:write"))])
+async def update_document(document_id: int, document: DocumentUpdate, db: AsyncSession = Depends(get_db)):
+    db_doc = await db.get(Document, document_id)
     if not db_doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
     # Проверяем существование типа документа (если обновляется)
     if document.document_type_id is not None:  # Изменено на is not None
-        doc_type = db.query(DocumentType).filter(DocumentType.id == document.document_type_id).first()
+        doc_type = await db.get(DocumentType, document.document_type_id)
         if not doc_type:
             raise HTTPException(status_code=404, detail="Document type not found")
     
     # Проверяем существование компании (если обновляется)
     if document.company_id is not None:  # Изменено на is not None
-        company = db.query(Company).filter(Company.id == document.company_id).first()
+        company = await db.get(Company, document.company_id)
         if not company:
             raise HTTPException(status_code=404, detail="Company not found")
     
@@ -332,44 +547,80 @@ def update_document(document_id: int, document: DocumentUpdate, db: Session = De
                 detail="Для приходного документа должен быть указан поставщик"
             )
     
-    # Обновляем поля
+    # Перенос даты не должен затрагивать закрытый период ни со старой, ни с новой стороны
     update_data = document.dict(exclude_unset=True)
+    if "date" in update_data and update_data["date"] != db_doc.date:
+        await stock_periods.check_date_open(db, db_doc.date)
+        await stock_periods.check_date_open(db, update_data["date"])
+    
+    # Обновляем поля
+    old_key = document_stats.document_key(db_doc)
     for key, value in update_data.items():
         setattr(db_doc, key, value)
     
-    db.commit()
-    db.refresh(db_doc)
+    # Дата, тип или компания изменились — переносим документ в другую ячейку сводки
+    if document_stats.document_key(db_doc) != old_key:
+        quantity = await db.scalar(
+            select(func.coalesce(func.sum(DocumentLine.quantity), 0))
+            .where(DocumentLine.document_id == document_id)
+        )
+        await document_stats.document_moved(db, old_key, db_doc, int(quantity))
+    
+    await db.commit()
     
-    return db_doc
+    return await load_document(db, document_id)
 
-@router.delete("/{document_id}")
-def delete_document(document_id: int, db: Session = Depends(get_db)):
-    db_doc = db.query(Document).filter(Document.id == document_id).first()
+@router.delete("/{document_id}", dependencies=[Depends(require_permission("documents:write"))])
+async def delete_document(document_id: int, db: AsyncSession = Depends(get_db)):
+    db_doc = await db.get(Document, document_id)
     if not db_doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    # Удаляем документ
-    db.delete(db_doc)
-    db.commit()
+    await stock_periods.check_date_open(db, db_doc.date)
+    
+    # Снимаем строки документа с остатков и удаляем документ
+    lines = (await db.scalars(select(DocumentLine).where(DocumentLine.document_id == document_id))).all()
+    await stock.apply_lines(db, lines, sign=-1)
+    await document_stats.document_removed(db, db_doc, sum(line.quantity or 0 for line in lines))
+    await db.delete(db_doc)
+    await db.commit()
     
     return {
         "detail": "Document deleted",
         "document_id": document_id
     }
 
+# /stats/count — прежний адрес, ответ совместим: total_documents и by_type[].type/count
 @router.get("/stats/count")
-def get_documents_stats(db: Session = Depends(get_db)):
-    # Получаем общее количество документов
-    total = db.query(Document).count()
-    
-    # Получаем количество по типам
-    types_stats = db.query(
-        DocumentType.name,
-        db.func.count(Document.id)
-    ).join(Document, DocumentType.id == Document.document_type_id)\
-     .group_by(DocumentType.name).all()
-    
+@router.get("/stats/summary")
+async def get_documents_stats(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    company_id: Optional[int] = Query(None, description="0 — документы без компании"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Число документов и сумма количеств по строкам за период — всего
+    и по типам документов. Считается по дневной сводке document_stats_daily,
+    а не по самим документам, поэтому не зависит от их числа.
+    """
+    return await document_stats.get_summary(db, date_from, date_to, company_id)
+
+@router.get("/stats/timeseries")
+async def get_documents_timeseries(
+    date_from: date,
+    date_to: date,
+    granularity: str = Query("day", enum=["day", "month"]),
+    document_type_id: Optional[int] = None,
+    company_id: Optional[int] = Query(None, description="0 — документы без компании"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Число документов и сумма количеств по дням или месяцам за период"""
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
     return {
-        "total_documents": total,
-        "by_type": [{"type": name, "count": count} for name, count in types_stats]
-    }
\ No newline at end of file
+        "granularity": granularity,
+        "items": await document_stats.get_timeseries(
+            db, date_from, date_to, granularity, document_type_id, company_id,
+        ),
+    }
@@ -1,29 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.db.database import SessionLocal
+from app.dependencies import current_user, get_db
+from app.core.cache import reference_cache
 from app.models.models import DocumentType
 from app.schemas.schemas import DocumentTypeOut, DocumentTypeCreate
 
 router = APIRouter(
     prefix="/documenttypes",
-    tags=["documenttypes"]
+    tags=["documenttypes"],
+    dependencies=[Depends(current_user)]
 )
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/", response_model=List[DocumentTypeOut])
-def get_document_types(db: Session = Depends(get_db)):
-    return db.query(DocumentType).all()
+async def get_document_types(request: Request, db: AsyncSession = Depends(get_db)):
+    async def load():
+        return [DocumentTypeOut.model_validate(row, from_attributes=True) for row in (await db.scalars(select(DocumentType))).all()]
+    return await reference_cache.response(request, "documenttypes", load)
 
 @router.get("/{document_type_id}", response_model=DocumentTypeOut)
-def get_document_type(document_type_id: int, db: Session = Depends(get_db)):
-    doc_type = db.query(DocumentType).filter(DocumentType.id == document_type_id).first()
+async def get_document_type(document_type_id: int, db: AsyncSession = Depends(get_db)):
+    doc_type = await db.get(DocumentType, document_type_id)
     if not doc_type:
         raise HTTPException(status_code=404, detail="DocumentType not found")
     return doc_type
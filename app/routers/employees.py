@@ -1,28 +1,26 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, text
 from typing import List
-from app.db.database import SessionLocal
+from app.dependencies import current_user, get_db, require_permission
 from app.models.models import Employee
 from app.schemas.schemas import EmployeeOut, EmployeeUpdate, EmployeeCreate
 from sqlalchemy.exc import DBAPIError
 
+import logging
+
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/employees",
-    tags=["employees"]
+    tags=["employees"],
+    dependencies=[Depends(current_user)]
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-@router.get("/", response_model=List[EmployeeOut])
-def get_employees(db: Session = Depends(get_db)):
-    employees = db.query(Employee).all()
+@router.get("/", response_model=List[EmployeeOut], dependencies=[Depends(require_permission("employees:read"))])
+async def get_employees(db: AsyncSession = Depends(get_db)):
+    employees = (await db.scalars(select(Employee))).all()
     result = []
     for employee in employees:
         result.append(
@@ -44,9 +42,9 @@ def get_employees(db: Session = Depends(get_db)):
         )
     return result
 
-@router.get("/{employee_id}", response_model=EmployeeOut)
-def get_employee(employee_id: int, db: Session = Depends(get_db)):
-    employee = db.query(Employee).filter(Employee.id == employee_id).first()
+@router.get("/{employee_id}", response_model=EmployeeOut, dependencies=[Depends(require_permission("employees:read"))])
+async def get_employee(employee_id: int, db: AsyncSession = Depends(get_db)):
+    employee = await db.get(Employee, employee_id)
     if not employee:
         raise HTTPException(status_code=404, detail="Company not found")
     
@@ -67,8 +65,8 @@ def get_employee(employee_id: int, db: Session = Depends(get_db)):
     )
 
 MAX_LOGIN_ATTEMPTS = 10
-@router.post("/create")
-def create_employee(employee: EmployeeCreate, db: Session = Depends(get_db)):
+@router.post("/create", dependencies=[Depends(require_permission("employees:write"))])
+async def create_employee(employee: EmployeeCreate, db: AsyncSession = Depends(get_db)):
     base_login = employee.login
     login = base_login
 
@@ -82,7 +80,7 @@ def create_employee(employee: EmployeeCreate, db: Session = Depends(get_db)):
                 )
             """)
 
-            db.execute(sql, {
+            await db.execute(sql, {
                 "login": login,
                 "password": employee.password,
                 "first_name": employee.first_name,
@@ -97,7 +95,7 @@ def create_employee(employee: EmployeeCreate, db: Session = Depends(get_db)):
                 "role_id": employee.role_id,
             })
 
-            db.commit()
+            await db.commit()
 
             return {
                 "success": True,
@@ -106,7 +104,7 @@ def create_employee(employee: EmployeeCreate, db: Session = Depends(get_db)):
             }
 
         except DBAPIError as e:
-            db.rollback()
+            await db.rollback()
             error_message = str(e.orig)
 
             if "логином уже существует" in error_message:
@@ -118,8 +116,8 @@ def create_employee(employee: EmployeeCreate, db: Session = Depends(get_db)):
                 detail=error_message
             )
 
-@router.put("/{employee_id}/update")
-def update_employee(employee_id: int, employee: EmployeeUpdate, db: Session = Depends(get_db)):
+@router.put("/{employee_id}/update", dependencies=[Depends(require_permission("employees:write"))])
+async def update_employee(employee_id: int, employee: EmployeeUpdate, db: AsyncSession = Depends(get_db)):
     try:
         sql = text("""
             CALL update_employee(
@@ -145,8 +143,8 @@ def update_employee(employee_id: int, employee: EmployeeUpdate, db: Session = De
             'role_id': employee.role_id
         }
 
-        result = db.execute(sql, params)
-        db.commit()
+        result = await db.execute(sql, params)
+        await db.commit()
 
         # Получаем сообщение из процедуры (если есть)
         message_row = result.fetchone()
@@ -160,7 +158,7 @@ def update_employee(employee_id: int, employee: EmployeeUpdate, db: Session = De
             FROM employees 
             WHERE id = :employee_id
         """)
-        updated_employee = db.execute(get_sql, {'employee_id': employee_id}).fetchone()
+        updated_employee = (await db.execute(get_sql, {'employee_id': employee_id})).fetchone()
         if not updated_employee:
             raise HTTPException(status_code=404, detail=f"Сотрудник с ID {employee_id} не найден после обновления")
 
@@ -170,35 +168,34 @@ def update_employee(employee_id: int, employee: EmployeeUpdate, db: Session = De
             "employee": dict(updated_employee._mapping)  # Преобразуем Row в dict
         }
 
-    except pymysql.err.OperationalError as e:
+    except DBAPIError as e:
+        await db.rollback()
         # Ловим SIGNAL SQLSTATE из процедуры
-        if e.args[0] == 1644:  # SIGNAL из процедуры
-            raise HTTPException(status_code=400, detail=e.args[1])
+        if e.orig.args[0] == 1644:  # SIGNAL из процедуры
+            raise HTTPException(status_code=400, detail=e.orig.args[1])
         raise HTTPException(status_code=500, detail=f"Ошибка обновления сотрудника: {str(e)}")
 
     except Exception as e:
-        db.rollback()
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Полная ошибка: {error_details}")
+        await db.rollback()
+        logger.exception("Error updating employee %s", employee_id)
         raise HTTPException(status_code=500, detail=f"Ошибка обновления сотрудника: {str(e)}")
 
     
-@router.delete("/{employee_id}/delete")
-def delete_employee( employee_id: int, db: Session = Depends(get_db)):
+@router.delete("/{employee_id}/delete", dependencies=[Depends(require_permission("employees:write"))])
+async def delete_employee( employee_id: int, db: AsyncSession = Depends(get_db)):
     try:
 
         # 1. Вызываем процедуру удаления
         sql = text("CALL delete_employee(:p_id)")
         
-        result = db.execute(sql, {'p_id': employee_id})
-        db.commit()
+        result = await db.execute(sql, {'p_id': employee_id})
+        await db.commit()
         
         # 2. Получаем сообщение из процедуры
         message_row = result.fetchone()
         message = message_row[0] if message_row else "Сотрудник удален"
         
-        print(f"✅ {message}")
+        logger.info("Employee %s deleted: %s", employee_id, message)
         
         # 3. Возвращаем успешный ответ
         return {
@@ -210,10 +207,10 @@ def delete_employee( employee_id: int, db: Session = Depends(get_db)):
         }
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         error_msg = str(e)
         
-        print(f"Ошибка удаления товара {employee_id}")
+        logger.exception("Error deleting employee %s", employee_id)
         
         # Обработка SQL ошибок из процедуры
         if "Сотрудник с указанным ID не найден" in error_msg:
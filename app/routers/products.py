@@ -1,51 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, text
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from typing import List, Optional
-from app.db.database import SessionLocal
-from app.models.models import Product
-from app.schemas.schemas import ProductOut, ProductCreate, ProductUpdate
+from datetime import date
+from app.db.database import AsyncSessionLocal
+from app.dependencies import current_user, get_db, require_permission
+from app.models.models import Product, Category, Unit
+from app.schemas.schemas import ProductOut, ProductCreate, ProductUpdate, ProductPage
+from app.core.pagination import (
+    decode_cursor, decode_signed_cursor, encode_cursor, encode_signed_cursor, keyset_after,
+)
 from typing import Dict, Any
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+from app.services import product_import, stock
+from app.services.product_import import ImportFormatError
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/products",
-    tags=["products"]
+    tags=["products"],
+    dependencies=[Depends(current_user)]
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-@router.get("/", response_model=List[ProductOut])
-def get_products(db: Session = Depends(get_db)):
-    products = db.query(Product).all()
-    result = []
-    for p in products:
-        result.append(
-            ProductOut(
-                id=p.id,
-                article=p.article,
-                name=p.name,
-                purchase_price=float(p.purchase_price) if p.purchase_price else None,
-                sell_price=float(p.sell_price) if p.sell_price else None,
-                is_active=bool(p.is_active),
-                category_id=p.category_id,
-                unit_id=p.unit_id
-            )
-        )
-    return result
-
-@router.get("/{product_id}", response_model=ProductOut)
-def get_product(product_id: int, db: Session = Depends(get_db)):
-    p = db.query(Product).filter(Product.id == product_id).first()
-    if not p:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
+def product_to_out(p: Product) -> ProductOut:
     return ProductOut(
         id=p.id,
         article=p.article,
@@ -53,12 +38,128 @@ def get_product(product_id: int, db: Session = Depends(get_db)):
         purchase_price=float(p.purchase_price) if p.purchase_price else None,
         sell_price=float(p.sell_price) if p.sell_price else None,
         is_active=bool(p.is_active),
-        category_id=p.category_id if p.category_id else None,
-        unit_id=p.unit_id if p.unit_id else None
+        category_id=p.category_id,
+        unit_id=p.unit_id
+    )
+
+# Допустимые ключи сортировки списка товаров; у каждого есть индекс по (key, id)
+SORT_COLUMNS = {
+    "id": Product.id,
+    "name": Product.name,
+    "article": Product.article,
+    "sell_price": Product.sell_price,
+}
+
+@router.get("/", response_model=ProductPage)
+async def get_products(
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    category_id: Optional[int] = None,
+    unit_id: Optional[int] = None,
+    is_active: Optional[bool] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    sort: str = Query("id", enum=list(SORT_COLUMNS)),
+    order: str = Query("asc", enum=["asc", "desc"]),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Каталог товаров постранично (keyset по (sort, id)).
+    min_price/max_price фильтруют по цене продажи.
+    Следующую страницу запрашивают с cursor=next_cursor из предыдущего ответа.
+    """
+    sort_column = SORT_COLUMNS[sort]
+    descending = order == "desc"
+    query = select(Product)
+
+    # Фильтры
+    if category_id is not None:
+        query = query.where(Product.category_id == category_id)
+    if unit_id is not None:
+        query = query.where(Product.unit_id == unit_id)
+    if is_active is not None:
+        query = query.where(Product.is_active == is_active)
+    if min_price is not None:
+        query = query.where(Product.sell_price >= min_price)
+    if max_price is not None:
+        query = query.where(Product.sell_price <= max_price)
+
+    if cursor:
+        cursor_value, cursor_id = decode_cursor(cursor, 2)
+        if not isinstance(cursor_id, int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if sort == "sell_price" and cursor_value is not None:
+            try:
+                cursor_value = Decimal(str(cursor_value))
+            except InvalidOperation:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+        if sort_column is not Product.id:
+            query = query.where(
+                keyset_after(sort_column, Product.id, cursor_value, cursor_id, descending)
+            )
+        elif descending:
+            query = query.where(Product.id < cursor_id)
+        else:
+            query = query.where(Product.id > cursor_id)
+
+    if descending:
+        query = query.order_by(sort_column.desc(), Product.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), Product.id.asc())
+
+    products = (await db.scalars(query.limit(limit + 1))).all()
+
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        last = products[-1]
+        next_cursor = encode_cursor([getattr(last, sort_column.key), last.id])
+
+    return {
+        "items": [product_to_out(p) for p in products],
+        "next_cursor": next_cursor,
+    }
+
+def parse_id_list(value: str, name: str) -> Optional[List[int]]:
+    """Разбирает "all" или список id через запятую ("1,2,3")"""
+    if value.strip().lower() == "all":
+        return None
+    try:
+        ids = [int(item) for item in value.split(",") if item.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name}: ожидается 'all' или список id через запятую")
+    # Убираем повторы, сохраняя порядок
+    return list(dict.fromkeys(ids))
+
+@router.get("/quantities")
+async def get_products_quantities(
+    product_ids: str = "all",
+    zone_ids: str = "all",
+    as_of: Optional[date] = Query(None, description="Остатки на конец этого дня"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Остатки по сетке товары × зоны за один запрос.
+    Ответ: {"product_ids": [...], "zone_ids": [...], "quantities": [[...], ...]},
+    где quantities[i][j] — остаток товара product_ids[i] в зоне zone_ids[j].
+    """
+    return await stock.get_stock_matrix(
+        db,
+        parse_id_list(product_ids, "product_ids"),
+        parse_id_list(zone_ids, "zone_ids"),
+        as_of,
     )
+
+@router.get("/{product_id}", response_model=ProductOut)
+async def get_product(product_id: int, db: AsyncSession = Depends(get_db)):
+    p = await db.get(Product, product_id)
+    if not p:
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    return product_to_out(p)
     
-@router.post("/create")
-def create_product(product: ProductCreate, db: Session = Depends(get_db)):
+@router.post("/create", dependencies=[Depends(require_permission("products:write"))])
+async def create_product(product: ProductCreate, db: AsyncSession = Depends(get_db)):
     try:
         # Вызов хранимой процедуры
         sql = text("""
@@ -68,7 +169,7 @@ def create_product(product: ProductCreate, db: Session = Depends(get_db)):
             )
         """)
         
-        result = db.execute(sql, {
+        result = await db.execute(sql, {
             'article': product.article,
             'name': product.name,
             'purchase_price': product.purchase_price,
@@ -78,7 +179,7 @@ def create_product(product: ProductCreate, db: Session = Depends(get_db)):
             'unit_id': product.unit_id,
         })
         
-        db.commit()
+        await db.commit()
         
         # Получаем сообщение из процедуры
         message = result.fetchone()
@@ -89,20 +190,101 @@ def create_product(product: ProductCreate, db: Session = Depends(get_db)):
         }
         
     except Exception as e:
-        db.rollback()
-        error_msg = str(e)
-        
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Полная ошибка: {error_details}")
+        await db.rollback()
+        logger.exception("Error creating product")
         
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка создания товара: {str(e)}"
         )
     
-@router.put("/{product_id}/update")
-def update_product(product_id: int, product: ProductUpdate, db: Session = Depends(get_db)):
+IMPORT_CHUNK_SIZE = 1000
+
+@router.post("/import", dependencies=[Depends(require_permission("products:write"))])
+async def import_products(file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
+    """
+    Импорт каталога из CSV/XLSX с колонками article, name, category_id, unit_id
+    и необязательными purchase_price, sell_price, is_active.
+    Товары создаются или обновляются по article пачками по IMPORT_CHUNK_SIZE
+    строк (INSERT ... ON DUPLICATE KEY UPDATE), каждая пачка — своя транзакция.
+    В ответе — итоги и статус каждой строки файла (row — номер строки в файле).
+    """
+    # Справочники загружаем один раз на весь файл
+    category_ids = set((await db.scalars(select(Category.id))).all())
+    unit_ids = set((await db.scalars(select(Unit.id))).all())
+
+    try:
+        rows = product_import.iter_rows(file.file, file.filename or "")
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    report = []
+    totals = {"created": 0, "updated": 0, "failed": 0}
+    seen_articles = set()
+
+    while True:
+        # Чтение и разбор файла — синхронные, поэтому выполняем их в пуле потоков
+        try:
+            chunk = await run_in_threadpool(product_import.take, rows, IMPORT_CHUNK_SIZE)
+        except (ImportFormatError, UnicodeDecodeError) as e:
+            raise HTTPException(status_code=400, detail=f"Ошибка чтения файла: {str(e)}")
+        if not chunk:
+            break
+
+        valid = []
+        for row_number, row in chunk:
+            values, error = product_import.validate_row(row, category_ids, unit_ids)
+            if error:
+                report.append({"row": row_number, "status": "error", "error": error})
+                totals["failed"] += 1
+            else:
+                valid.append((row_number, values))
+        if not valid:
+            continue
+
+        articles = {values["article"] for _, values in valid}
+        existing = set((await db.scalars(
+            select(Product.article).where(Product.article.in_(articles))
+        )).all())
+
+        statuses = []
+        for row_number, values in valid:
+            article = values["article"]
+            status = "updated" if article in existing or article in seen_articles else "created"
+            seen_articles.add(article)
+            statuses.append({"row": row_number, "article": article, "status": status})
+
+        stmt = mysql_insert(Product).values([values for _, values in valid])
+        stmt = stmt.on_duplicate_key_update(
+            name=stmt.inserted.name,
+            purchase_price=stmt.inserted.purchase_price,
+            sell_price=stmt.inserted.sell_price,
+            is_active=stmt.inserted.is_active,
+            category_id=stmt.inserted.category_id,
+            unit_id=stmt.inserted.unit_id,
+        )
+        try:
+            await db.execute(stmt)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            for status in statuses:
+                status.update(status="error", error=f"Ошибка записи пачки: {str(e)}")
+            totals["failed"] += len(statuses)
+        else:
+            for status in statuses:
+                totals[status["status"]] += 1
+        report.extend(statuses)
+
+    report.sort(key=lambda item: item["row"])
+    return {
+        "success": totals["failed"] == 0,
+        **totals,
+        "rows": report,
+    }
+
+@router.put("/{product_id}/update", dependencies=[Depends(require_permission("products:write"))])
+async def update_product(product_id: int, product: ProductUpdate, db: AsyncSession = Depends(get_db)):
     try:
         sql = text("""
             CALL update_product(
@@ -122,8 +304,8 @@ def update_product(product_id: int, product: ProductUpdate, db: Session = Depend
             'p_unit': product.unit_id
         }
     
-        result = db.execute(sql, params)
-        db.commit()
+        result = await db.execute(sql, params)
+        await db.commit()
         
         message_row = result.fetchone()
         message = message_row[0] if message_row else "Товар обновлён"
@@ -136,7 +318,7 @@ def update_product(product_id: int, product: ProductUpdate, db: Session = Depend
             WHERE id = :product_id
         """)
         
-        updated_product = db.execute(get_sql, {'product_id': product_id}).fetchone()
+        updated_product = (await db.execute(get_sql, {'product_id': product_id})).fetchone()
         
         if not updated_product:
             raise HTTPException(
@@ -161,32 +343,28 @@ def update_product(product_id: int, product: ProductUpdate, db: Session = Depend
         }
         
     except Exception as e:
-        db.rollback()
-        error_msg = str(e)
-        
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Полная ошибка: {error_details}")
+        await db.rollback()
+        logger.exception("Error updating product %s", product_id)
         
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка обновления товара: {str(e)}")
 
-@router.delete("/{product_id}/delete")
-def delete_product( product_id: int, db: Session = Depends(get_db)):
+@router.delete("/{product_id}/delete", dependencies=[Depends(require_permission("products:write"))])
+async def delete_product( product_id: int, db: AsyncSession = Depends(get_db)):
     try:
 
         # 1. Вызываем процедуру удаления
         sql = text("CALL delete_product(:p_id)")
         
-        result = db.execute(sql, {'p_id': product_id})
-        db.commit()
+        result = await db.execute(sql, {'p_id': product_id})
+        await db.commit()
         
         # 2. Получаем сообщение из процедуры
         message_row = result.fetchone()
         message = message_row[0] if message_row else "Товар помечен как удалённый"
         
-        print(f"✅ {message}")
+        logger.info("Product %s deleted: %s", product_id, message)
         
         # 3. Возвращаем успешный ответ
         return {
@@ -198,11 +376,9 @@ def delete_product( product_id: int, db: Session = Depends(get_db)):
         }
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         error_msg = str(e)
-        error_details = traceback.format_exc()
-        
-        print(f"Ошибка удаления товара {product_id}: {error_details}")
+        logger.exception("Error deleting product %s", product_id)
         
         # Обработка SQL ошибок из процедуры
         if "Товар с указанным ID не найден" in error_msg:
@@ -217,33 +393,19 @@ def delete_product( product_id: int, db: Session = Depends(get_db)):
             )
 
 @router.get("/{product_id}/quantity")
-def get_product_quantity(
+async def get_product_quantity(
     product_id: int,
     zone_id: int,
-    db: Session = Depends(get_db)
+    as_of: Optional[date] = Query(None, description="Остаток на конец этого дня"),
+    db: AsyncSession = Depends(get_db)
 ):
     try:
-        sql = text("""
-            SELECT get_inventory_quantity(:product_id, :zone_id) as quantity
-            """)
-            
-        result = db.execute(sql, {
-            'product_id': product_id,
-            'zone_id': zone_id
-        })
-            
-        quantity = result.scalar()
-            
         return {
-            "quantity": int(quantity) if quantity is not None else 0
+            "quantity": await stock.get_balance(db, product_id, zone_id, as_of)
         }
-        
             
     except Exception as e:
-        # Для отладки выведем полную ошибку
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Ошибка в get_product_quantity: {error_details}")
+        logger.exception("Error getting quantity of product %s in zone %s", product_id, zone_id)
         
         # Возвращаем 0 при ошибке, чтобы фронтенд не падал
         return {
@@ -252,48 +414,93 @@ def get_product_quantity(
         }
     
 @router.get("/{product_id}/fullquantity")
-def get_product_full_quantity(
+async def get_product_full_quantity(
     product_id: int,
-    db: Session = Depends(get_db)
+    as_of: Optional[date] = Query(None, description="Остаток на конец этого дня"),
+    db: AsyncSession = Depends(get_db)
 ):
     try:
-        sql = text("""
-            SELECT 
-                SUM(
-                    get_inventory_quantity(
-                        :product_id,
-                        z.id
-                    )
-                ) as total_quantity_on_warehouse
-            FROM StorageZones z;
-            """)
-            
-        result = db.execute(sql, {
-            'product_id': product_id,
-        })
-        
-        quantity = result.scalar()
-        print(f"Scalar результат: {quantity}")
-        print(f"Тип scalar: {type(quantity)}")
-
-        if isinstance(quantity, Decimal):
-            quantity_int = int(quantity)
-        else:
-            quantity_int = int(quantity) if quantity is not None else 0
-
         return {
-            "quantity": quantity_int
+            "quantity": await stock.get_total_balance(db, product_id, as_of)
         }
-        
             
     except Exception as e:
-        # Для отладки выведем полную ошибку
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Ошибка в get_product_quantity: {error_details}")
+        logger.exception("Error getting total quantity of product %s", product_id)
         
         # Возвращаем 0 при ошибке, чтобы фронтенд не падал
         return {
             "quantity": 0,
             "error": str(e)
-        }    
\ No newline at end of file
+        }
+
+MOVEMENTS_BATCH_SIZE = 1000
+MOVEMENT_COLUMNS = [
+    "date", "document_id", "number", "document_type_id", "document_type", "line_id",
+    "storage_zone_sender_id", "storage_zone_sender_name",
+    "storage_zone_receiver_id", "storage_zone_receiver_name",
+    "quantity", "balance",
+]
+
+def movement_to_dict(row) -> dict:
+    item = {c: getattr(row, c) for c in MOVEMENT_COLUMNS}
+    item["quantity"] = int(item["quantity"])
+    item["balance"] = int(item["balance"])
+    return item
+
+async def stream_movements(sql, params):
+    """NDJSON: журнал читается серверным курсором и отдаётся пачками"""
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(text(sql).execution_options(yield_per=MOVEMENTS_BATCH_SIZE), params)
+        async for partition in result.partitions():
+            yield "".join(
+                json.dumps(movement_to_dict(row), default=str, ensure_ascii=False) + "\n"
+                for row in partition
+            )
+
+@router.get("/{product_id}/movements")
+async def get_product_movements(
+    product_id: int,
+    zone_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    movements_format: str = Query("json", alias="format", enum=["json", "ndjson"]),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Журнал движений товара от старых документов к новым: дата, документ,
+    зоны, количество со знаком и нарастающий остаток (по зоне zone_id
+    или по всему складу). Страницы по limit строк, следующая — с
+    cursor=next_cursor; format=ndjson отдаёт весь журнал потоком.
+    Курсор несёт остаток на конец страницы и подписан сервером.
+    """
+    if not await db.get(Product, product_id):
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    params = {"product_id": product_id, "zone_id": zone_id, "opening": 0}
+    if cursor:
+        after_date, after_document_id, after_line_id, opening = decode_signed_cursor(cursor, 4)
+        try:
+            params.update(
+                after_date=date.fromisoformat(after_date),
+                after_document_id=int(after_document_id),
+                after_line_id=int(after_line_id),
+                opening=int(opening),
+            )
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if movements_format == "ndjson":
+        sql = stock.movements_sql(zone_id is not None, bool(cursor), limited=False)
+        return StreamingResponse(stream_movements(sql, params), media_type="application/x-ndjson")
+
+    params["limit"] = limit + 1
+    sql = stock.movements_sql(zone_id is not None, bool(cursor), limited=True)
+    items = [movement_to_dict(row) for row in await db.execute(text(sql), params)]
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_signed_cursor([str(last["date"]), last["document_id"], last["line_id"], last["balance"]])
+
+    return {"product_id": product_id, "zone_id": zone_id, "items": items, "next_cursor": next_cursor}
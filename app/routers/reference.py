@@ -1,28 +1,49 @@
 # app/routers/reference.py
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.models.models import Role as RoleModel, Position as PositionModel, Subdivision as SubdivisionModel
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.models import Role as RoleModel, Position as PositionModel, Subdivision as SubdivisionModel, RolePermission
 from app.schemas.schemas import Role as RoleSchema, Position as PositionSchema, Subdivision as SubdivisionSchema
-from app.db.database import SessionLocal
+from app.schemas.schemas import RolePermissions, RolePermissionsUpdate
+from app.dependencies import current_user, get_db, require_permission
+from app.core.cache import reference_cache
+from app.core.permissions import role_permissions
 
-router = APIRouter(prefix="", tags=["reference"])
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+router = APIRouter(prefix="", tags=["reference"], dependencies=[Depends(current_user)])
 
 @router.get("/roles", response_model=list[RoleSchema])
-def read_roles(db: Session = Depends(get_db)):
-    return db.query(RoleModel).all()
+async def read_roles(request: Request, db: AsyncSession = Depends(get_db)):
+    async def load():
+        return [RoleSchema.model_validate(row, from_attributes=True) for row in (await db.scalars(select(RoleModel))).all()]
+    return await reference_cache.response(request, "roles", load)
+
+@router.get("/roles/{role_id}/permissions", response_model=RolePermissions)
+async def read_role_permissions(role_id: int, db: AsyncSession = Depends(get_db)):
+    if not await db.get(RoleModel, role_id):
+        raise HTTPException(status_code=404, detail="Role not found")
+    return RolePermissions(role_id=role_id, permissions=sorted(await role_permissions.permissions(db, role_id)))
+
+@router.put("/roles/{role_id}/permissions", response_model=RolePermissions, dependencies=[Depends(require_permission("roles:write"))])
+async def update_role_permissions(role_id: int, data: RolePermissionsUpdate, db: AsyncSession = Depends(get_db)):
+    if not await db.get(RoleModel, role_id):
+        raise HTTPException(status_code=404, detail="Role not found")
+    permissions = sorted(set(data.permissions))
+    await db.execute(delete(RolePermission).where(RolePermission.role_id == role_id))
+    if permissions:
+        await db.execute(insert(RolePermission), [{"role_id": role_id, "permission": p} for p in permissions])
+    await db.commit()
+    role_permissions.invalidate()
+    return RolePermissions(role_id=role_id, permissions=permissions)
 
 @router.get("/positions", response_model=list[PositionSchema])
-def read_positions(db: Session = Depends(get_db)):
-    return db.query(PositionModel).all()
+async def read_positions(request: Request, db: AsyncSession = Depends(get_db)):
+    async def load():
+        return [PositionSchema.model_validate(row, from_attributes=True) for row in (await db.scalars(select(PositionModel))).all()]
+    return await reference_cache.response(request, "positions", load)
 
 @router.get("/subdivisions", response_model=list[SubdivisionSchema])
-def read_subdivisions(db: Session = Depends(get_db)):
-    return db.query(SubdivisionModel).all()
+async def read_subdivisions(request: Request, db: AsyncSession = Depends(get_db)):
+    async def load():
+        return [SubdivisionSchema.model_validate(row, from_attributes=True) for row in (await db.scalars(select(SubdivisionModel))).all()]
+    return await reference_cache.response(request, "subdivisions", load)
 
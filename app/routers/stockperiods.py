@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from datetime import date
+
+from app.dependencies import current_user, get_db, require_permission
+from app.services import stock_periods
+
+router = APIRouter(
+    prefix="/stock/periods",
+    tags=["stock"],
+    dependencies=[Depends(current_user)]
+)
+
+@router.get("/")
+async def read_stock_periods(db: AsyncSession = Depends(get_db)):
+    """Закрытые месяцы от новых к старым и число остатков в их снимках"""
+    return await stock_periods.list_periods(db)
+
+@router.post("/close", dependencies=[Depends(require_permission("stock:close"))])
+async def close_stock_periods(through: Optional[date] = None, db: AsyncSession = Depends(get_db)):
+    """
+    Закрывает все незакрытые месяцы по through включительно (по умолчанию —
+    по прошлый месяц). То же делает python -m app.services.stock_periods.
+    """
+    try:
+        closed = await stock_periods.close_periods(db, through)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Период уже закрывается другим запросом")
+    except ValueError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"closed": closed}
+
+@router.post("/reopen", dependencies=[Depends(require_permission("stock:close"))])
+async def reopen_stock_periods(period_end: date, db: AsyncSession = Depends(get_db)):
+    """
+    Открывает закрытый месяц period_end и все более поздние, чтобы исправить
+    их документы; при следующем закрытии снимки пересчитываются.
+    """
+    try:
+        reopened = await stock_periods.reopen_periods(db, period_end)
+    except ValueError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    await db.commit()
+    return {"reopened": reopened}
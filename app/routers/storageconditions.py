@@ -1,47 +1,55 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
-from app.db.database import get_db
+from app.dependencies import current_user, get_db, require_permission
+from app.core.cache import reference_cache
 from app.models.models import StorageCondition
 from app.schemas.schemas import StorageConditionOut, StorageConditionCreate
 
 router = APIRouter(
     prefix="/storageconditions",
-    tags=["storageconditions"]
+    tags=["storageconditions"],
+    dependencies=[Depends(current_user)]
 )
 
 # Получить все условия хранения
 @router.get("/", response_model=List[StorageConditionOut])
-def read_storage_conditions(db: Session = Depends(get_db)):
-    return db.query(StorageCondition).all()
+async def read_storage_conditions(request: Request, db: AsyncSession = Depends(get_db)):
+    async def load():
+        return [StorageConditionOut.model_validate(row, from_attributes=True) for row in (await db.scalars(select(StorageCondition))).all()]
+    return await reference_cache.response(request, "storageconditions", load)
 
 # Создать новое условие хранения
-@router.post("/", response_model=StorageConditionOut)
-def create_storage_condition(data: StorageConditionCreate, db: Session = Depends(get_db)):
+@router.post("/", response_model=StorageConditionOut, dependencies=[Depends(require_permission("references:write"))])
+async def create_storage_condition(data: StorageConditionCreate, db: AsyncSession = Depends(get_db)):
     condition = StorageCondition(name=data.name)
     db.add(condition)
-    db.commit()
-    db.refresh(condition)
+    await db.commit()
+    reference_cache.invalidate("storageconditions")
+    await db.refresh(condition)
     return condition
 
 # Обновить условие хранения
-@router.put("/{condition_id}", response_model=StorageConditionOut)
-def update_storage_condition(condition_id: int, data: StorageConditionCreate, db: Session = Depends(get_db)):
-    condition = db.query(StorageCondition).filter(StorageCondition.id == condition_id).first()
+@router.put("/{condition_id}", response_model=StorageConditionOut, dependencies=[Depends(require_permission("references:write"))])
+async def update_storage_condition(condition_id: int, data: StorageConditionCreate, db: AsyncSession = Depends(get_db)):
+    condition = await db.get(StorageCondition, condition_id)
     if not condition:
         raise HTTPException(status_code=404, detail="StorageCondition не найден")
     condition.name = data.name
-    db.commit()
-    db.refresh(condition)
+    await db.commit()
+    reference_cache.invalidate("storageconditions")
+    await db.refresh(condition)
     return condition
 
 # Удалить условие хранения
-@router.delete("/{condition_id}")
-def delete_storage_condition(condition_id: int, db: Session = Depends(get_db)):
-    condition = db.query(StorageCondition).filter(StorageCondition.id == condition_id).first()
+@router.delete("/{condition_id}", dependencies=[Depends(require_permission("references:write"))])
+async def delete_storage_condition(condition_id: int, db: AsyncSession = Depends(get_db)):
+    condition = await db.get(StorageCondition, condition_id)
     if not condition:
         raise HTTPException(status_code=404, detail="StorageCondition не найден")
-    db.delete(condition)
-    db.commit()
+    await db.delete(condition)
+    await db.commit()
+    reference_cache.invalidate("storageconditions")
     return {"detail": "Удалено"}
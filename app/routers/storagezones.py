@@ -1,34 +1,62 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
-from app.db.database import get_db
+from app.dependencies import current_user, get_db, require_permission
+from app.db.loading import with_plan
 from app.models.models import StorageZone, StorageCondition
 from app.schemas.schemas import StorageZoneOut, StorageZoneCreate
 
 router = APIRouter(
     prefix="/storagezones",
-    tags=["storagezones"]
+    tags=["storagezones"],
+    dependencies=[Depends(current_user)]
 )
 
 # Получить все зоны хранения
 @router.get("/", response_model=List[StorageZoneOut])
-def read_storage_zones(db: Session = Depends(get_db)):
-    zones = db.query(StorageZone).all()
-    result = []
-    for z in zones:
-        result.append(StorageZoneOut(
-            id=z.id,
-            name=z.name,
-            comment=z.comment,
-            storage_condition=z.storage_condition.name if z.storage_condition else None
-        ))
-    return result
+async def read_storage_zones(db: AsyncSession = Depends(get_db)):
+    # Проекция с JOIN: одно обращение к БД на весь список
+    rows = await db.execute(
+        select(
+            StorageZone.id,
+            StorageZone.name,
+            StorageZone.comment,
+            StorageCondition.name.label("storage_condition"),
+        )
+        .outerjoin(StorageCondition, StorageCondition.id == StorageZone.storage_condition_id)
+        .order_by(StorageZone.id)
+    )
+    return [
+        StorageZoneOut(
+            id=row.id,
+            name=row.name,
+            comment=row.comment,
+            storage_condition=row.storage_condition
+        )
+        for row in rows
+    ]
+
+# Получить зону хранения
+@router.get("/{zone_id}", response_model=StorageZoneOut)
+async def read_storage_zone(zone_id: int, db: AsyncSession = Depends(get_db)):
+    zone = (await db.scalars(
+        with_plan(select(StorageZone), "storage_zone").where(StorageZone.id == zone_id)
+    )).first()
+    if not zone:
+        raise HTTPException(status_code=404, detail="StorageZone не найден")
+    return StorageZoneOut(
+        id=zone.id,
+        name=zone.name,
+        comment=zone.comment,
+        storage_condition=zone.storage_condition.name if zone.storage_condition else None
+    )
 
 # Создать новую зону хранения
-@router.post("/", response_model=StorageZoneOut)
-def create_storage_zone(data: StorageZoneCreate, db: Session = Depends(get_db)):
-    condition = db.query(StorageCondition).filter(StorageCondition.id == data.storage_condition_id).first()
+@router.post("/", response_model=StorageZoneOut, dependencies=[Depends(require_permission("storagezones:write"))])
+async def create_storage_zone(data: StorageZoneCreate, db: AsyncSession = Depends(get_db)):
+    condition = await db.get(StorageCondition, data.storage_condition_id)
     if not condition:
         raise HTTPException(status_code=404, detail="StorageCondition не найден")
     
@@ -38,8 +66,8 @@ def create_storage_zone(data: StorageZoneCreate, db: Session = Depends(get_db)):
         storage_condition_id=data.storage_condition_id
     )
     db.add(zone)
-    db.commit()
-    db.refresh(zone)
+    await db.commit()
+    await db.refresh(zone)
     return StorageZoneOut(
         id=zone.id,
         name=zone.name,
@@ -48,13 +76,13 @@ def create_storage_zone(data: StorageZoneCreate, db: Session = Depends(get_db)):
     )
 
 # Обновить зону хранения
-@router.put("/{zone_id}", response_model=StorageZoneOut)
-def update_storage_zone(zone_id: int, data: StorageZoneCreate, db: Session = Depends(get_db)):
-    zone = db.query(StorageZone).filter(StorageZone.id == zone_id).first()
+@router.put("/{zone_id}", response_model=StorageZoneOut, dependencies=[Depends(require_permission("storagezones:write"))])
+async def update_storage_zone(zone_id: int, data: StorageZoneCreate, db: AsyncSession = Depends(get_db)):
+    zone = await db.get(StorageZone, zone_id)
     if not zone:
         raise HTTPException(status_code=404, detail="StorageZone не найден")
     
-    condition = db.query(StorageCondition).filter(StorageCondition.id == data.storage_condition_id).first()
+    condition = await db.get(StorageCondition, data.storage_condition_id)
     if not condition:
         raise HTTPException(status_code=404, detail="StorageCondition не найден")
 
@@ -62,8 +90,8 @@ def update_storage_zone(zone_id: int, data: StorageZoneCreate, db: Session = Dep
     zone.comment = data.comment
     zone.storage_condition_id = data.storage_condition_id
 
-    db.commit()
-    db.refresh(zone)
+    await db.commit()
+    await db.refresh(zone)
 
     return StorageZoneOut(
         id=zone.id,
@@ -73,11 +101,11 @@ def update_storage_zone(zone_id: int, data: StorageZoneCreate, db: Session = Dep
     )
 
 # Удалить зону хранения
-@router.delete("/{zone_id}")
-def delete_storage_zone(zone_id: int, db: Session = Depends(get_db)):
-    zone = db.query(StorageZone).filter(StorageZone.id == zone_id).first()
+@router.delete("/{zone_id}", dependencies=[Depends(require_permission("storagezones:write"))])
+async def delete_storage_zone(zone_id: int, db: AsyncSession = Depends(get_db)):
+    zone = await db.get(StorageZone, zone_id)
     if not zone:
         raise HTTPException(status_code=404, detail="StorageZone не найден")
-    db.delete(zone)
-    db.commit()
+    await db.delete(zone)
+    await db.commit()
     return {"detail": "Удалено"}
@@ -1,59 +1,60 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.db.database import SessionLocal
+from app.dependencies import current_user, get_db, require_permission
+from app.core.cache import reference_cache
 from app.models.models import Unit
 from app.schemas.schemas import UnitOut, UnitCreate
 
 router = APIRouter(
     prefix="/units",
-    tags=["units"]
+    tags=["units"],
+    dependencies=[Depends(current_user)]
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/", response_model=List[UnitOut])
-def get_units(db: Session = Depends(get_db)):
-    return db.query(Unit).all()
+async def get_units(request: Request, db: AsyncSession = Depends(get_db)):
+    async def load():
+        return [UnitOut.model_validate(row, from_attributes=True) for row in (await db.scalars(select(Unit))).all()]
+    return await reference_cache.response(request, "units", load)
 
 @router.get("/{unit_id}", response_model=UnitOut)
-def get_unit(unit_id: int, db: Session = Depends(get_db)):
-    unit = db.query(Unit).filter(Unit.id == unit_id).first()
+async def get_unit(unit_id: int, db: AsyncSession = Depends(get_db)):
+    unit = await db.get(Unit, unit_id)
     if not unit:
         raise HTTPException(status_code=404, detail="Unit not found")
     return unit
 
-@router.post("/", response_model=UnitOut)
-def create_unit(unit: UnitCreate, db: Session = Depends(get_db)):
+@router.post("/", response_model=UnitOut, dependencies=[Depends(require_permission("references:write"))])
+async def create_unit(unit: UnitCreate, db: AsyncSession = Depends(get_db)):
     db_unit = Unit(**unit.dict())
     db.add(db_unit)
-    db.commit()
-    db.refresh(db_unit)
+    await db.commit()
+    reference_cache.invalidate("units")
+    await db.refresh(db_unit)
     return db_unit
 
-@router.put("/{unit_id}", response_model=UnitOut)
-def update_unit(unit_id: int, unit: UnitCreate, db: Session = Depends(get_db)):
-    db_unit = db.query(Unit).filter(Unit.id == unit_id).first()
+@router.put("/{unit_id}", response_model=UnitOut, dependencies=[Depends(require_permission("references:write"))])
+async def update_unit(unit_id: int, unit: UnitCreate, db: AsyncSession = Depends(get_db)):
+    db_unit = await db.get(Unit, unit_id)
     if not db_unit:
         raise HTTPException(status_code=404, detail="Unit not found")
     
     db_unit.name = unit.name
-    db.commit()
-    db.refresh(db_unit)
+    await db.commit()
+    reference_cache.invalidate("units")
+    await db.refresh(db_unit)
     return db_unit
 
-@router.delete("/{unit_id}")
-def delete_unit(unit_id: int, db: Session = Depends(get_db)):
-    db_unit = db.query(Unit).filter(Unit.id == unit_id).first()
+@router.delete("/{unit_id}", dependencies=[Depends(require_permission("references:write"))])
+async def delete_unit(unit_id: int, db: AsyncSession = Depends(get_db)):
+    db_unit = await db.get(Unit, unit_id)
     if not db_unit:
         raise HTTPException(status_code=404, detail="Unit not found")
     
-    db.delete(db_unit)
-    db.commit()
+    await db.delete(db_unit)
+    await db.commit()
+    reference_cache.invalidate("units")
     return {"detail": "Unit deleted"}
@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
+import datetime as dt
 from datetime import date, datetime
 from typing import Optional, List
 
@@ -48,6 +49,20 @@ class DocumentLineBase(BaseModel):
 class DocumentLineCreate(DocumentLineBase):
     document_id: int  # ID документа, к которому добавляется строка
 
+class DocumentLineBatchCreate(BaseModel):
+    document_id: int
+    lines: List[DocumentLineBase]
+
+class DocumentLineCount(BaseModel):
+    # Строка указывается по line_id или по товару документа (product_id)
+    line_id: Optional[int] = None
+    product_id: Optional[int] = None
+    actual_quantity: int
+
+class DocumentLineCountBatch(BaseModel):
+    document_id: int
+    counts: List[DocumentLineCount]
+
 class DocumentLineUpdate(BaseModel):
     quantity: Optional[int] = None
     actual_quantity: Optional[int] = None
@@ -71,10 +86,22 @@ class DocumentOut(BaseModel):
     comment: Optional[str] = None
     company_id: Optional[int] = None
     document_type_id: int
+    company_name: Optional[str] = None
+    document_type_name: Optional[str] = None
 
     class Config:
         orm_mode = True
 
+class DocumentLineDetail(DocumentLineOut):
+    product_name: Optional[str] = None
+    product_article: Optional[int] = None
+    storage_zone_sender_name: Optional[str] = None
+    storage_zone_receiver_name: Optional[str] = None
+
+class DocumentDetailOut(DocumentOut):
+    # Заполняется только с ?include=lines (products, zones)
+    lines: Optional[List[DocumentLineDetail]] = None
+
 class DocumentCreate(BaseModel):
     number: Optional[str] = None
     date: date
@@ -86,11 +113,24 @@ class DocumentCreate(BaseModel):
 
 class DocumentUpdate(BaseModel):
     number: Optional[str] = None
-    date: Optional[str] = None
+    # dt.date: имя поля date перекрывает тип внутри класса
+    date: Optional[dt.date] = None
     comment: Optional[str] = None
     company_id: Optional[int] = None
     document_type_id: Optional[int] = None
 
+    # Поле можно не передавать, но явный null для NOT NULL колонок недопустим
+    @field_validator("number", "date", "document_type_id")
+    @classmethod
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("не может быть null")
+        return value
+
+class DocumentPage(BaseModel):
+    items: List[DocumentOut]
+    next_cursor: Optional[str] = None  # None — страниц больше нет
+
 
 # Category 
 class CategoryOut(BaseModel):
@@ -196,6 +236,10 @@ class ProductUpdate(BaseModel):
     category_id: Optional[int] = None
     unit_id: Optional[int] = None
 
+class ProductPage(BaseModel):
+    items: List[ProductOut]
+    next_cursor: Optional[str] = None  # None — страниц больше нет
+
 # StorageCondition
 class StorageConditionOut(BaseModel):
     id: int
@@ -229,6 +273,13 @@ class Role(BaseModel):
     class Config:
         orm_mode = True
 
+class RolePermissions(BaseModel):
+    role_id: int
+    permissions: List[str]
+
+class RolePermissionsUpdate(BaseModel):
+    permissions: List[str]
+
 class Position(BaseModel):
     id: int
     name: str
@@ -0,0 +1,169 @@
+# app/services/document_stats.py
+"""
+Дневная сводка по документам (таблица document_stats_daily).
+
+Ключ строки — (date, document_type_id, company_id), значения — число
+документов и сумма quantity их строк. Документ без компании учитывается
+под company_id = NO_COMPANY. Сводка поддерживается инкрементально: все
+записи документов и их строк должны вызывать функции этого модуля в той
+же транзакции, что и сама запись (как stock.apply_lines для остатков).
+"""
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+NO_COMPANY = 0
+
+_ON_DUPLICATE = """
+    ON DUPLICATE KEY UPDATE
+        count = count + VALUES(count),
+        total_quantity = total_quantity + VALUES(total_quantity)
+"""
+
+_UPSERT_DAY = text("""
+    INSERT INTO document_stats_daily (date, document_type_id, company_id, count, total_quantity)
+    VALUES (:date, :document_type_id, :company_id, :count, :total_quantity)
+""" + _ON_DUPLICATE)
+
+# Ключ берётся из самого документа: так не нужно читать его отдельным запросом
+_UPSERT_BY_DOCUMENT = text("""
+    INSERT INTO document_stats_daily (date, document_type_id, company_id, count, total_quantity)
+    SELECT d.date, d.document_type_id, COALESCE(d.company_id, 0), :count,
+           :quantity + :with_lines * COALESCE(
+               (SELECT SUM(dl.quantity) FROM documentlines dl WHERE dl.document_id = d.id), 0)
+    FROM documents d
+    WHERE d.id = :document_id
+""" + _ON_DUPLICATE)
+
+
+def document_key(document) -> dict:
+    """Ячейка сводки, в которой учитывается документ"""
+    return {
+        "date": document.date,
+        "document_type_id": document.document_type_id,
+        "company_id": document.company_id or NO_COMPANY,
+    }
+
+
+async def _bump(db: AsyncSession, key: dict, count: int, quantity: int) -> None:
+    await db.execute(_UPSERT_DAY, {**key, "count": count, "total_quantity": quantity})
+
+
+async def document_added(db: AsyncSession, document, quantity: int = 0) -> None:
+    """Новый документ (quantity — сумма его строк, если они уже есть)"""
+    await _bump(db, document_key(document), 1, quantity)
+
+
+async def document_removed(db: AsyncSession, document, quantity: int) -> None:
+    """Удаление документа вместе со строками на сумму quantity"""
+    await _bump(db, document_key(document), -1, -quantity)
+
+
+async def document_moved(db: AsyncSession, old_key: dict, document, quantity: int) -> None:
+    """
+    Изменение даты, типа или компании документа: он со своими строками
+    переносится из ячейки old_key (результат document_key до изменения) в новую
+    """
+    new_key = document_key(document)
+    if new_key != old_key:
+        await _bump(db, old_key, -1, -quantity)
+        await _bump(db, new_key, 1, quantity)
+
+
+async def document_added_by_id(db: AsyncSession, document_id: int) -> None:
+    """Новый документ, созданный хранимой процедурой: ключ и сумму строк берёт из БД"""
+    await db.execute(_UPSERT_BY_DOCUMENT, {
+        "document_id": document_id, "count": 1, "quantity": 0, "with_lines": 1,
+    })
+
+
+async def lines_changed(db: AsyncSession, document_id: int, delta: int) -> None:
+    """Строки документа добавлены, изменены или удалены: сумма quantity изменилась на delta"""
+    if delta:
+        await db.execute(_UPSERT_BY_DOCUMENT, {
+            "document_id": document_id, "count": 0, "quantity": delta, "with_lines": 0,
+        })
+
+
+def _filters(
+    date_from: Optional[date],
+    date_to: Optional[date],
+    document_type_id: Optional[int],
+    company_id: Optional[int],
+) -> tuple:
+    conditions, params = [], {}
+    if date_from:
+        conditions.append("s.date >= :date_from")
+        params["date_from"] = date_from
+    if date_to:
+        conditions.append("s.date <= :date_to")
+        params["date_to"] = date_to
+    if document_type_id:
+        conditions.append("s.document_type_id = :document_type_id")
+        params["document_type_id"] = document_type_id
+    if company_id is not None:
+        conditions.append("s.company_id = :company_id")
+        params["company_id"] = company_id
+    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    return where, params
+
+
+async def get_summary(
+    db: AsyncSession,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    company_id: Optional[int] = None,
+) -> dict:
+    """Итоги и разбивка по типам документов за период одним GROUP BY по сводке"""
+    where, params = _filters(date_from, date_to, None, company_id)
+    rows = (await db.execute(text(f"""
+        SELECT t.id, t.name,
+               COALESCE(SUM(s.count), 0) AS documents,
+               COALESCE(SUM(s.total_quantity), 0) AS quantity
+        FROM document_stats_daily s
+        JOIN documenttypes t ON t.id = s.document_type_id
+        {where}
+        GROUP BY t.id, t.name
+        HAVING documents <> 0
+        ORDER BY t.id
+    """), params)).all()
+
+    by_type = [
+        {"document_type_id": type_id, "type": name, "count": int(count), "total_quantity": int(quantity)}
+        for type_id, name, count, quantity in rows
+    ]
+    return {
+        "total_documents": sum(item["count"] for item in by_type),
+        "total_quantity": sum(item["total_quantity"] for item in by_type),
+        "by_type": by_type,
+    }
+
+
+async def get_timeseries(
+    db: AsyncSession,
+    date_from: date,
+    date_to: date,
+    granularity: str = "day",
+    document_type_id: Optional[int] = None,
+    company_id: Optional[int] = None,
+) -> List[dict]:
+    """Ряд по дням или месяцам; периоды без документов в ответ не попадают"""
+    where, params = _filters(date_from, date_to, document_type_id, company_id)
+    period = "s.date" if granularity == "day" else "DATE_FORMAT(s.date, '%Y-%m-01')"
+    rows = (await db.execute(text(f"""
+        SELECT {period} AS period,
+               SUM(s.count) AS documents,
+               SUM(s.total_quantity) AS quantity
+        FROM document_stats_daily s
+        {where}
+        GROUP BY period
+        HAVING documents <> 0
+        ORDER BY period
+    """), params)).all()
+
+    return [
+        {"period": str(period), "count": int(count), "total_quantity": int(quantity)}
+        for period, count, quantity in rows
+    ]
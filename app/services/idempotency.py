@@ -0,0 +1,251 @@
+# app/services/idempotency.py
+"""
+Идемпотентность создающих запросов по заголовку Idempotency-Key.
+
+Первый запрос с ключом сразу (отдельной короткой транзакцией) записывает
+в idempotency_keys строку "выполняется" со своим lock_token и получает
+Claim. Обработчик делает работу и перед своим commit вызывает
+claim.store(db, ответ): ответ ложится в строку ключа в той же транзакции,
+что и сама работа, поэтому либо зафиксировано и то и другое, либо ничего.
+Повтор с тем же ключом получает сохранённый ответ без повторного вызова
+процедур; одновременный дубликат опрашивает строку, пока первый запрос
+не закончится. Ключ с другим телом запроса — ошибка 422.
+
+Если работа завершилась ошибкой, строка удаляется и запрос можно
+повторить. Строка "выполняется" держит ключ IDEMPOTENCY_LOCK секунд:
+если процесс упал до commit, после этого повтор перехватывает ключ
+(новый lock_token) и выполняет работу. Все изменения строки ключа
+проверяют lock_token, поэтому опоздавший первый запрос не может ни
+сохранить ответ (его транзакция откатывается с 409), ни удалить ключ
+повтора. Ключи живут IDEMPOTENCY_TTL секунд.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.models.models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+TOKEN_BYTES = 16
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 0.5
+# Доля запросов, которые попутно удаляют просроченные ключи
+PURGE_PROBABILITY = 0.01
+PURGE_BATCH = 1000
+
+
+class Claim:
+    """Ключ, занятый этим запросом (строка с его lock_token)"""
+
+    def __init__(self, key_hash: bytes, token: bytes, status_code: int):
+        self.key_hash = key_hash
+        self.token = token
+        self.status_code = status_code
+        self.content = None
+
+    def _owned(self):
+        return (
+            IdempotencyKey.key_hash == self.key_hash,
+            IdempotencyKey.lock_token == self.token,
+            IdempotencyKey.status_code.is_(None),
+        )
+
+    async def store(self, db: AsyncSession, content) -> None:
+        """
+        Записывает ответ в строку ключа в транзакции обработчика; вызывать
+        перед его commit. Если ключ перехватил повтор — 409, и обработчик
+        должен откатить свою работу.
+        """
+        content = jsonable_encoder(content)
+        result = await db.execute(
+            update(IdempotencyKey)
+            .where(*self._owned())
+            .values(status_code=self.status_code, response=json.dumps(content, ensure_ascii=False))
+        )
+        if result.rowcount != 1:
+            raise HTTPException(status_code=409, detail="Запрос с этим Idempotency-Key выполнил повтор")
+        self.content = content
+
+    async def release(self) -> None:
+        """Освобождает ключ после ошибки, если его не перехватили и ответ не сохранён"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(IdempotencyKey).where(*self._owned()))
+            await db.commit()
+
+
+def _now() -> datetime:
+    # DATETIME в MySQL без часового пояса; время ключей хранится в UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _digest(value: str) -> bytes:
+    return hashlib.sha256(value.encode()).digest()
+
+
+def _request_hash(payload) -> bytes:
+    return _digest(json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":")))
+
+
+def _lock_until(now: datetime) -> datetime:
+    return now + timedelta(seconds=settings.idempotency_lock)
+
+
+def _stale(row: IdempotencyKey, now: datetime) -> bool:
+    """Ответ не сохранён, и запрос, занявший ключ, больше его не держит"""
+    return row.status_code is None and row.locked_until <= now
+
+
+def _replay(row: IdempotencyKey) -> JSONResponse:
+    return JSONResponse(
+        status_code=row.status_code,
+        content=json.loads(row.response),
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+async def _claim(
+    key_hash: bytes, request_hash: bytes, status_code: int,
+) -> Tuple[Optional[Claim], Optional[IdempotencyKey]]:
+    """
+    Занимает ключ. (Claim, None) — ключ наш и работу нужно выполнить;
+    иначе (None, уже существующая непросроченная строка).
+    """
+    while True:
+        now = _now()
+        token = secrets.token_bytes(TOKEN_BYTES)
+        async with AsyncSessionLocal() as db:
+            if random.random() < PURGE_PROBABILITY:
+                await purge_expired(db, now)
+            try:
+                db.add(IdempotencyKey(
+                    key_hash=key_hash,
+                    request_hash=request_hash,
+                    lock_token=token,
+                    created_at=now,
+                    locked_until=_lock_until(now),
+                    expires_at=now + timedelta(seconds=settings.idempotency_ttl),
+                ))
+                await db.commit()
+                return Claim(key_hash, token, status_code), None
+            except IntegrityError:
+                await db.rollback()
+
+            existing = await db.get(IdempotencyKey, key_hash)
+            if existing is None:
+                # Первый запрос успел завершиться ошибкой и освободить ключ
+                continue
+            current = (IdempotencyKey.key_hash == key_hash, IdempotencyKey.lock_token == existing.lock_token)
+            if existing.expires_at <= now:
+                # Просроченный ключ освобождаем и занимаем заново
+                await db.execute(delete(IdempotencyKey).where(*current, IdempotencyKey.expires_at <= now))
+                await db.commit()
+                continue
+            if _stale(existing, now) and existing.request_hash == request_hash:
+                # Запрос, занявший ключ, не закончился за IDEMPOTENCY_LOCK:
+                # перехватываем ключ, если его не перехватил другой повтор
+                taken = await db.execute(
+                    update(IdempotencyKey)
+                    .where(*current, IdempotencyKey.status_code.is_(None), IdempotencyKey.locked_until <= now)
+                    .values(lock_token=token, locked_until=_lock_until(now))
+                )
+                await db.commit()
+                if taken.rowcount == 1:
+                    return Claim(key_hash, token, status_code), None
+                continue
+            return None, existing
+
+
+async def _wait(key_hash: bytes) -> Optional[IdempotencyKey]:
+    """
+    Ждёт, пока первый запрос с ключом сохранит ответ; None — ключ освобождён.
+    Строка без ответа возвращается, когда истекла блокировка первого запроса.
+    """
+    deadline = asyncio.get_running_loop().time() + settings.idempotency_wait
+    interval = POLL_INTERVAL
+    while asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(interval)
+        interval = min(interval * 2, MAX_POLL_INTERVAL)
+        async with AsyncSessionLocal() as db:
+            row = await db.get(IdempotencyKey, key_hash)
+        if row is None or row.status_code is not None or _stale(row, _now()):
+            return row
+    raise HTTPException(status_code=409, detail="Запрос с этим Idempotency-Key ещё выполняется")
+
+
+async def purge_expired(db, now: Optional[datetime] = None) -> int:
+    """Удаляет пачку просроченных ключей (по индексу expires_at)"""
+    now = now or _now()
+    expired = select(IdempotencyKey.key_hash).where(IdempotencyKey.expires_at <= now).limit(PURGE_BATCH)
+    keys = list(await db.scalars(expired))
+    if not keys:
+        return 0
+    # Ключ мог быть занят заново между SELECT и DELETE: такой уже не просрочен
+    await db.execute(
+        delete(IdempotencyKey)
+        .where(IdempotencyKey.key_hash.in_(keys), IdempotencyKey.expires_at <= now)
+    )
+    await db.commit()
+    return len(keys)
+
+
+async def run_once(
+    key: str,
+    scope: str,
+    payload,
+    handler: Callable[[Claim], Awaitable[dict]],
+    status_code: int = 200,
+):
+    """
+    Выполняет handler не больше одного раза на (scope, key). scope отделяет
+    операции и пользователей друг от друга, payload — тело запроса.
+    handler(claim) должен вызвать await claim.store(db, ответ) перед своим commit.
+    """
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key: от 1 до {MAX_KEY_LENGTH} символов")
+
+    key_hash = _digest(f"{scope}\n{key}")
+    request_hash = _request_hash(payload)
+
+    while True:
+        claim, existing = await _claim(key_hash, request_hash, status_code)
+        if claim is not None:
+            break
+        if existing.request_hash != request_hash:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key уже использован для запроса с другими параметрами",
+            )
+        if existing.status_code is None:
+            existing = await _wait(key_hash)
+            if existing is None or existing.status_code is None:
+                continue
+        return _replay(existing)
+
+    try:
+        content = await handler(claim)
+    except BaseException:
+        await claim.release()
+        raise
+
+    if claim.content is None:
+        # Обработчик завершился без commit с ответом: повтор выполнит его снова
+        logger.error("Idempotent handler for %s returned without storing its response", scope)
+        await claim.release()
+        return content
+    return JSONResponse(status_code=status_code, content=claim.content)
@@ -0,0 +1,158 @@
+# app/services/product_import.py
+"""
+Чтение и проверка строк импорта каталога товаров из CSV/XLSX.
+
+Файл читается потоково: iter_rows() отдаёт пары (номер строки в файле,
+значения) по одной, не загружая файл целиком; пустые строки пропускаются.
+Проверка идёт по заранее загруженным множествам id категорий и единиц
+измерения, без запросов к БД на каждую строку.
+"""
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+from typing import IO, Dict, Iterator, List, Optional, Set, Tuple
+
+REQUIRED_COLUMNS = ("article", "name", "category_id", "unit_id")
+OPTIONAL_COLUMNS = ("purchase_price", "sell_price", "is_active")
+NAME_MAX_LENGTH = 45
+
+TRUE_VALUES = {"1", "true", "yes", "да", "y"}
+FALSE_VALUES = {"0", "false", "no", "нет", "n"}
+
+
+class ImportFormatError(ValueError):
+    """Файл не удаётся прочитать как таблицу товаров"""
+
+
+def _normalize_header(header) -> List[str]:
+    return [str(cell or "").strip().lower() for cell in header]
+
+
+def _check_header(header: List[str]) -> None:
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ImportFormatError(f"Не хватает колонок: {', '.join(missing)}")
+
+
+def _iter_csv(file: IO[bytes]) -> Iterator[Tuple[int, Dict[str, object]]]:
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(text, dialect)
+    header = _normalize_header(next(reader, []))
+    _check_header(header)
+    for row_number, values in enumerate(reader, start=2):
+        if any(not _is_empty(value) for value in values):
+            yield row_number, dict(zip(header, values))
+
+
+def _iter_xlsx(file: IO[bytes]) -> Iterator[Tuple[int, Dict[str, object]]]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFormatError("Для импорта XLSX нужен пакет openpyxl")
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = _normalize_header(next(rows, []))
+        _check_header(header)
+        for row_number, values in enumerate(rows, start=2):
+            if any(not _is_empty(value) for value in values):
+                yield row_number, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def iter_rows(file: IO[bytes], filename: str) -> Iterator[Tuple[int, Dict[str, object]]]:
+    if filename.lower().endswith(".xlsx"):
+        return _iter_xlsx(file)
+    if filename.lower().endswith((".csv", ".txt")):
+        return _iter_csv(file)
+    raise ImportFormatError("Поддерживаются только файлы .csv и .xlsx")
+
+
+def take(rows: Iterator, size: int) -> list:
+    """Следующие size строк итератора (для чтения файла пачками в потоке)"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            break
+    return chunk
+
+
+def _is_empty(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _to_int(value, column: str) -> int:
+    try:
+        number = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"{column}: ожидается целое число")
+    if not number.is_finite() or number != number.to_integral_value():
+        raise ValueError(f"{column}: ожидается целое число")
+    return int(number)
+
+
+def _to_price(value, column: str) -> Optional[Decimal]:
+    if _is_empty(value):
+        return None
+    try:
+        return Decimal(str(value).strip().replace(",", "."))
+    except InvalidOperation:
+        raise ValueError(f"{column}: ожидается число")
+
+
+def _to_bool(value) -> bool:
+    if _is_empty(value):
+        return True
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError("is_active: ожидается 1/0 или true/false")
+
+
+def validate_row(
+    row: Dict[str, object],
+    category_ids: Set[int],
+    unit_ids: Set[int],
+) -> Tuple[Optional[dict], Optional[str]]:
+    """Возвращает (значения для products, None) или (None, текст ошибки)"""
+    try:
+        for column in REQUIRED_COLUMNS:
+            if _is_empty(row.get(column)):
+                raise ValueError(f"{column}: обязательное поле")
+
+        name = str(row["name"]).strip()
+        if len(name) > NAME_MAX_LENGTH:
+            raise ValueError(f"name: не длиннее {NAME_MAX_LENGTH} символов")
+
+        category_id = _to_int(row["category_id"], "category_id")
+        if category_id not in category_ids:
+            raise ValueError(f"Категория {category_id} не найдена")
+
+        unit_id = _to_int(row["unit_id"], "unit_id")
+        if unit_id not in unit_ids:
+            raise ValueError(f"Единица измерения {unit_id} не найдена")
+
+        return {
+            "article": _to_int(row["article"], "article"),
+            "name": name,
+            "purchase_price": _to_price(row.get("purchase_price"), "purchase_price"),
+            "sell_price": _to_price(row.get("sell_price"), "sell_price"),
+            "is_active": _to_bool(row.get("is_active")),
+            "category_id": category_id,
+            "unit_id": unit_id,
+        }, None
+    except ValueError as e:
+        return None, str(e)
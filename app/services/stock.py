@@ -0,0 +1,298 @@
+# app/services/stock.py
+"""
+Материализованные остатки товаров по зонам хранения (таблица stock_balances).
+
+Строка документа перемещает quantity единиц товара: в зону-получатель
+(storage_zone_receiver_id) со знаком "+", из зоны-отправителя
+(storage_zone_sender_id) со знаком "-". Все записи строк документов
+должны вызывать apply_line()/apply_lines() в той же транзакции, что и сама запись.
+"""
+from datetime import date
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services import stock_periods
+
+_UPSERT_BALANCE = text("""
+    INSERT INTO stock_balances (product_id, zone_id, quantity)
+    VALUES (:product_id, :zone_id, :delta)
+    ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)
+""")
+
+
+def line_movements(
+    product_id: Optional[int],
+    quantity: Optional[int],
+    sender_id: Optional[int],
+    receiver_id: Optional[int],
+    sign: int = 1,
+) -> List[dict]:
+    """Изменения остатков, которые вносит одна строка документа"""
+    if not product_id or not quantity:
+        return []
+
+    movements = []
+    if receiver_id:
+        movements.append({"product_id": product_id, "zone_id": receiver_id, "delta": sign * quantity})
+    if sender_id:
+        movements.append({"product_id": product_id, "zone_id": sender_id, "delta": -sign * quantity})
+    return movements
+
+
+async def apply_movements(db: AsyncSession, movements: Iterable[dict]) -> None:
+    """Применяет изменения остатков одним executemany"""
+    movements = list(movements)
+    if movements:
+        await db.execute(_UPSERT_BALANCE, movements)
+
+
+async def apply_lines(db: AsyncSession, lines: Iterable, sign: int = 1) -> None:
+    """
+    Проводит строки документа по остаткам (sign=1) или отменяет
+    их проведение (sign=-1), например перед удалением или изменением строки.
+    """
+    movements = []
+    for line in lines:
+        movements.extend(line_movements(
+            line.product_id,
+            line.quantity,
+            line.storage_zone_sender_id,
+            line.storage_zone_receiver_id,
+            sign,
+        ))
+    await apply_movements(db, movements)
+
+
+async def apply_line(db: AsyncSession, line, sign: int = 1) -> None:
+    await apply_lines(db, [line], sign)
+
+
+async def prefill_inventory(db: AsyncSession, document_id: int, zone_id: int) -> int:
+    """
+    Заполняет документ инвентаризации строками по всем товарам с ненулевым
+    остатком в зоне одним INSERT ... SELECT. quantity — ожидаемый остаток,
+    actual_quantity заполняют при пересчёте. Отправитель и получатель
+    строки — сама зона, поэтому остатки строки не меняют. Возвращает число строк.
+    """
+    result = await db.execute(
+        text("""
+            INSERT INTO documentlines
+                (document_id, product_id, quantity, actual_quantity,
+                 storage_zone_sender_id, storage_zone_receiver_id)
+            SELECT :document_id, sb.product_id, sb.quantity, NULL, sb.zone_id, sb.zone_id
+            FROM stock_balances sb
+            WHERE sb.zone_id = :zone_id AND sb.quantity <> 0
+            ORDER BY sb.product_id
+        """),
+        {"document_id": document_id, "zone_id": zone_id},
+    )
+    return result.rowcount
+
+
+async def get_balance(db: AsyncSession, product_id: int, zone_id: int, as_of: Optional[date] = None) -> int:
+    """
+    Текущий остаток товара в зоне: один поиск по первичному ключу.
+    С as_of — остаток на конец этого дня (см. get_stock_matrix).
+    """
+    if as_of is not None:
+        matrix = await get_stock_matrix(db, [product_id], [zone_id], as_of)
+        return matrix["quantities"][0][0]
+
+    quantity = await db.scalar(
+        text("""
+            SELECT quantity FROM stock_balances
+            WHERE product_id = :product_id AND zone_id = :zone_id
+        """),
+        {"product_id": product_id, "zone_id": zone_id},
+    )
+    return int(quantity) if quantity is not None else 0
+
+
+async def get_total_balance(db: AsyncSession, product_id: int, as_of: Optional[date] = None) -> int:
+    """Остаток товара по всему складу (диапазон по префиксу ключа); с as_of — на конец дня"""
+    if as_of is not None:
+        matrix = await get_stock_matrix(db, [product_id], None, as_of)
+        return sum(matrix["quantities"][0])
+
+    quantity = await db.scalar(
+        text("""
+            SELECT COALESCE(SUM(quantity), 0) FROM stock_balances
+            WHERE product_id = :product_id
+        """),
+        {"product_id": product_id},
+    )
+    return int(quantity) if quantity is not None else 0
+
+
+def _balances_sql(with_snapshot: bool, dates: str, sign: int, by_products: bool, by_zones: bool) -> str:
+    """
+    Остатки товары × зоны: снимок закрытого периода плюс (sign=1) или минус
+    (sign=-1) движения документов, даты которых отобраны условием dates
+    (шаблон с {date}). by_products/by_zones — фильтровать по спискам
+    :product_ids/:zone_ids; без них запрос читает все товары и зоны без
+    параметров IN (...). Для списка товаров даты берутся из строк
+    (диапазон индекса ix_documentlines_product_date), для всех товаров —
+    из documents по индексу даты.
+    """
+    def filters(product: str, zone: str) -> str:
+        conditions = [f"{product} IN :product_ids"] if by_products else []
+        conditions.append(f"{zone} IN :zone_ids" if by_zones else f"{zone} IS NOT NULL")
+        return " AND ".join(conditions)
+
+    snapshot = f"""
+            SELECT s.product_id, s.zone_id, s.quantity AS delta
+            FROM stock_snapshots s
+            WHERE s.period_end = :period_end
+              AND {filters("s.product_id", "s.zone_id")}
+            UNION ALL
+    """ if with_snapshot else ""
+    receiver, sender = ("", "-") if sign > 0 else ("-", "")
+    if by_products:
+        source = "documentlines dl"
+        dates = dates.format(date="dl.document_date")
+    else:
+        source = "documentlines dl JOIN documents d ON d.id = dl.document_id"
+        dates = dates.format(date="d.date")
+    return f"""
+        SELECT m.product_id, m.zone_id, SUM(m.delta) AS quantity
+        FROM (
+            {snapshot}
+            SELECT dl.product_id, dl.storage_zone_receiver_id AS zone_id, {receiver}dl.quantity AS delta
+            FROM {source}
+            WHERE {filters("dl.product_id", "dl.storage_zone_receiver_id")}
+              {dates}
+            UNION ALL
+            SELECT dl.product_id, dl.storage_zone_sender_id AS zone_id, {sender}dl.quantity AS delta
+            FROM {source}
+            WHERE {filters("dl.product_id", "dl.storage_zone_sender_id")}
+              {dates}
+        ) m
+        GROUP BY m.product_id, m.zone_id
+    """
+
+
+async def _balances_plan(db: AsyncSession, as_of: Optional[date]) -> Tuple[Optional[date], str, int]:
+    """
+    Какой снимок взять и какие движения к нему добавить: (period_end, dates, sign);
+    в условии dates колонку даты подставляет _balances_sql вместо {date}.
+    На дату as_of берётся ближайший снимок не позже неё плюс движения до as_of,
+    а если такого нет — ближайший снимок после неё минус движения после as_of.
+    Так читаются движения не больше чем за месяц, а не вся история.
+    """
+    if as_of is None:
+        period_end = await stock_periods.latest_closed(db)
+        return period_end, ("AND {date} > :period_end" if period_end else ""), 1
+
+    period_end = await stock_periods.latest_closed(db, on_or_before=as_of)
+    if period_end is not None:
+        return period_end, "AND {date} > :period_end AND {date} <= :as_of", 1
+
+    period_end = await stock_periods.first_closed_after(db, as_of)
+    if period_end is not None:
+        return period_end, "AND {date} > :as_of AND {date} <= :period_end", -1
+    return None, "AND {date} <= :as_of", 1
+
+
+async def get_stock_matrix(
+    db: AsyncSession,
+    product_ids: Optional[List[int]] = None,
+    zone_ids: Optional[List[int]] = None,
+    as_of: Optional[date] = None,
+) -> dict:
+    """
+    Матрица остатков товары × зоны одним GROUP BY: снимок закрытого месяца
+    (app/services/stock_periods.py) плюс движения после него. С as_of —
+    остатки на конец этого дня по документам с date <= as_of.
+    None вместо списка означает "все товары" / "все зоны".
+    Ответ колоночный: массивы id и плотная матрица quantities[i][j].
+    """
+    # Для "все" списки id нужны только для осей ответа: в сам запрос они
+    # не передаются, иначе на большом каталоге это IN (...) на сто тысяч параметров
+    by_products, by_zones = product_ids is not None, zone_ids is not None
+    if not by_products:
+        product_ids = list(await db.scalars(text("SELECT id FROM products ORDER BY id")))
+    if not by_zones:
+        zone_ids = list(await db.scalars(text("SELECT id FROM storagezones ORDER BY id")))
+
+    quantities = [[0] * len(zone_ids) for _ in product_ids]
+    result = {"product_ids": product_ids, "zone_ids": zone_ids, "quantities": quantities}
+    if as_of is not None:
+        result["as_of"] = as_of
+    if not product_ids or not zone_ids:
+        return result
+
+    period_end, dates, sign = await _balances_plan(db, as_of)
+    sql = text(_balances_sql(period_end is not None, dates, sign, by_products, by_zones))
+    params = {"period_end": period_end, "as_of": as_of}
+    if by_products:
+        sql = sql.bindparams(bindparam("product_ids", expanding=True))
+        params["product_ids"] = product_ids
+    if by_zones:
+        sql = sql.bindparams(bindparam("zone_ids", expanding=True))
+        params["zone_ids"] = zone_ids
+
+    product_index = {product_id: i for i, product_id in enumerate(product_ids)}
+    zone_index = {zone_id: j for j, zone_id in enumerate(zone_ids)}
+    for product_id, zone_id, quantity in await db.execute(sql, params):
+        # Товар или зона, добавленные после чтения осей, в матрицу не попадают
+        i, j = product_index.get(product_id), zone_index.get(zone_id)
+        if i is not None and j is not None:
+            quantities[i][j] = int(quantity or 0)
+
+    return result
+
+
+def movements_sql(by_zone: bool, after_cursor: bool, limited: bool) -> str:
+    """
+    Журнал движений одного товара в хронологическом порядке
+    (date, document_id, line_id) с нарастающим остатком. Страница строк
+    отбирается и сортируется только по индексу ix_documentlines_product_date
+    (product_id, document_date, document_id, id, ...), который покрывает все
+    нужные колонки, и лишь затем соединяется с документами. Оконная сумма
+    считается по странице и начинается с :opening — остатка на конец
+    предыдущей страницы из подписанного курсора.
+    """
+    if by_zone:
+        signed = """
+              CASE WHEN dl.storage_zone_receiver_id = :zone_id THEN dl.quantity ELSE 0 END
+            - CASE WHEN dl.storage_zone_sender_id = :zone_id THEN dl.quantity ELSE 0 END"""
+        zone_filter = "AND (dl.storage_zone_receiver_id = :zone_id OR dl.storage_zone_sender_id = :zone_id)"
+    else:
+        # Перемещение между зонами общий остаток товара не меняет
+        signed = """
+              CASE WHEN dl.storage_zone_receiver_id IS NOT NULL THEN dl.quantity ELSE 0 END
+            - CASE WHEN dl.storage_zone_sender_id IS NOT NULL THEN dl.quantity ELSE 0 END"""
+        zone_filter = ""
+    # Условие "после ключа курсора" раскрыто, чтобы MySQL построил по нему диапазон индекса
+    after = """
+              AND dl.document_date >= :after_date
+              AND (dl.document_date > :after_date
+                   OR dl.document_id > :after_document_id
+                   OR (dl.document_id = :after_document_id AND dl.id > :after_line_id))""" if after_cursor else ""
+    limit = "LIMIT :limit" if limited else ""
+    return f"""
+        SELECT m.date, m.document_id, d.number, d.document_type_id, t.name AS document_type,
+               m.line_id, m.storage_zone_sender_id, zs.name AS storage_zone_sender_name,
+               m.storage_zone_receiver_id, zr.name AS storage_zone_receiver_name,
+               m.quantity,
+               :opening + SUM(m.quantity) OVER (
+                   ORDER BY m.date, m.document_id, m.line_id ROWS UNBOUNDED PRECEDING
+               ) AS balance
+        FROM (
+            SELECT dl.document_date AS date, dl.document_id, dl.id AS line_id,
+                   dl.storage_zone_sender_id, dl.storage_zone_receiver_id,
+                   {signed} AS quantity
+            FROM documentlines dl
+            WHERE dl.product_id = :product_id
+              {zone_filter}{after}
+            ORDER BY dl.document_date, dl.document_id, dl.id
+            {limit}
+        ) m
+        JOIN documents d ON d.id = m.document_id
+        JOIN documenttypes t ON t.id = d.document_type_id
+        LEFT JOIN storagezones zs ON zs.id = m.storage_zone_sender_id
+        LEFT JOIN storagezones zr ON zr.id = m.storage_zone_receiver_id
+        ORDER BY m.date, m.document_id, m.line_id
+    """
@@ -0,0 +1,221 @@
+# app/services/stock_periods.py
+"""
+Закрытие периодов: помесячные снимки остатков (таблица stock_snapshots).
+
+Для закрытого месяца в stock_snapshots лежат остатки по каждой паре
+(товар, зона) на конец его последнего дня (period_end), а в stock_periods —
+сам факт закрытия. Остаток на любую дату после закрытия считается как
+снимок плюс движения документов с более поздней датой, поэтому стоимость
+запроса зависит от движений за последние недели, а не от всей истории.
+
+Документы закрытого периода больше не меняются: строки, удаление и
+перенос даты проверяются через check_document_open()/check_date_open().
+Чтобы исправить такой документ, месяц открывают заново (reopen_periods()):
+его снимок и снимки всех более поздних месяцев удаляются, а при следующем
+закрытии пересчитываются.
+
+Закрытие запускается по расписанию (например, cron первого числа):
+    python -m app.services.stock_periods [--through 2026-09-30]
+    python -m app.services.stock_periods --reopen 2026-08-31
+"""
+import argparse
+import asyncio
+import calendar
+from datetime import date, timedelta
+from typing import List, Optional
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.database import AsyncSessionLocal, engine
+from app.models.models import Document, StockPeriod, StockSnapshot
+
+
+class PeriodClosedError(ValueError):
+    """Изменение задело бы остатки закрытого периода"""
+
+
+def month_end(day: date) -> date:
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def previous_month_end(day: date) -> date:
+    return day.replace(day=1) - timedelta(days=1)
+
+
+async def latest_closed(db: AsyncSession, on_or_before: Optional[date] = None) -> Optional[date]:
+    """Конец последнего закрытого периода (не позже on_or_before, если задано)"""
+    query = select(func.max(StockPeriod.period_end))
+    if on_or_before is not None:
+        query = query.where(StockPeriod.period_end <= on_or_before)
+    return await db.scalar(query)
+
+
+async def first_closed_after(db: AsyncSession, day: date) -> Optional[date]:
+    """Конец первого закрытого периода строго после day"""
+    return await db.scalar(
+        select(func.min(StockPeriod.period_end)).where(StockPeriod.period_end > day)
+    )
+
+
+async def list_periods(db: AsyncSession) -> List[dict]:
+    rows = await db.execute(text("""
+        SELECT p.period_end, p.closed_at, COUNT(s.product_id) AS balances
+        FROM stock_periods p
+        LEFT JOIN stock_snapshots s ON s.period_end = p.period_end
+        GROUP BY p.period_end, p.closed_at
+        ORDER BY p.period_end DESC
+    """))
+    return [
+        {"period_end": period_end, "closed_at": closed_at, "balances": int(balances)}
+        for period_end, closed_at, balances in rows
+    ]
+
+
+async def check_date_open(db: AsyncSession, document_date: Optional[date]) -> None:
+    closed = await latest_closed(db)
+    if closed is not None and document_date is not None and document_date <= closed:
+        raise PeriodClosedError(
+            f"Период по {closed} закрыт: документы с датой {document_date} не изменяются"
+        )
+
+
+async def check_document_open(db: AsyncSession, document_id: int) -> None:
+    """Проверка перед изменением строк документа; документ должен существовать"""
+    row = (await db.execute(
+        select(Document.date, select(func.max(StockPeriod.period_end)).scalar_subquery())
+        .where(Document.id == document_id)
+    )).first()
+    if row is None:
+        return
+    document_date, closed = row
+    if closed is not None and document_date <= closed:
+        raise PeriodClosedError(f"Период по {closed} закрыт: документ {document_id} не изменяется")
+
+
+def _closing_sql(with_previous: bool) -> str:
+    """
+    Остатки на конец периода: снимок предыдущего периода плюс движения
+    между периодами. Для первого закрытия снимка нет, и читается вся история.
+    """
+    previous_snapshot = """
+            SELECT product_id, zone_id, quantity AS delta
+            FROM stock_snapshots
+            WHERE period_end = :previous
+            UNION ALL
+    """ if with_previous else ""
+    after_previous = "AND d.date > :previous" if with_previous else ""
+    return f"""
+        INSERT INTO stock_snapshots (period_end, product_id, zone_id, quantity)
+        SELECT :period_end, m.product_id, m.zone_id, SUM(m.delta)
+        FROM (
+            {previous_snapshot}
+            SELECT dl.product_id, dl.storage_zone_receiver_id AS zone_id, dl.quantity AS delta
+            FROM documents d
+            JOIN documentlines dl ON dl.document_id = d.id
+            WHERE d.date <= :period_end {after_previous}
+              AND dl.product_id IS NOT NULL AND dl.storage_zone_receiver_id IS NOT NULL
+            UNION ALL
+            SELECT dl.product_id, dl.storage_zone_sender_id AS zone_id, -dl.quantity AS delta
+            FROM documents d
+            JOIN documentlines dl ON dl.document_id = d.id
+            WHERE d.date <= :period_end {after_previous}
+              AND dl.product_id IS NOT NULL AND dl.storage_zone_sender_id IS NOT NULL
+        ) m
+        GROUP BY m.product_id, m.zone_id
+        HAVING SUM(m.delta) <> 0
+    """
+
+
+async def close_period(db: AsyncSession, period_end: date) -> int:
+    """
+    Закрывает месяц, оканчивающийся period_end; предыдущие месяцы должны быть
+    закрыты. Возвращает число записанных остатков. Транзакцию фиксирует вызывающий.
+    """
+    if period_end != month_end(period_end):
+        raise ValueError("period_end: ожидается последний день месяца")
+    if period_end >= month_end(date.today()):
+        raise ValueError("Нельзя закрыть текущий или будущий месяц")
+
+    previous = await latest_closed(db)
+    if previous is not None and period_end <= previous:
+        raise ValueError(f"Период {period_end.isoformat()} уже закрыт")
+
+    # Первичный ключ stock_periods не даст двум процессам закрыть месяц одновременно
+    await db.execute(insert(StockPeriod).values(period_end=period_end, closed_at=func.now()))
+    result = await db.execute(
+        text(_closing_sql(previous is not None)),
+        {"period_end": period_end, "previous": previous},
+    )
+    return result.rowcount
+
+
+async def close_periods(db: AsyncSession, through: Optional[date] = None) -> List[dict]:
+    """
+    Закрывает по порядку все незакрытые месяцы по through включительно
+    (по умолчанию — по прошлый месяц). Каждый месяц фиксируется отдельно.
+    """
+    last_finished = previous_month_end(date.today())
+    through = min(month_end(through), last_finished) if through else last_finished
+
+    previous = await latest_closed(db)
+    if previous is not None:
+        start = month_end(previous + timedelta(days=1))
+    else:
+        first = await db.scalar(text("SELECT MIN(date) FROM documents"))
+        if first is None:
+            return []
+        start = month_end(first)
+
+    closed = []
+    period_end = start
+    while period_end <= through:
+        balances = await close_period(db, period_end)
+        await db.commit()
+        closed.append({"period_end": period_end, "balances": balances})
+        period_end = month_end(period_end + timedelta(days=1))
+    return closed
+
+
+async def reopen_periods(db: AsyncSession, period_end: date) -> List[date]:
+    """
+    Открывает закрытый месяц period_end и все закрытые после него (их снимки
+    считались от его снимка). Возвращает открытые периоды. Транзакцию
+    фиксирует вызывающий.
+    """
+    periods = list(await db.scalars(
+        select(StockPeriod.period_end)
+        .where(StockPeriod.period_end >= period_end)
+        .order_by(StockPeriod.period_end)
+        .with_for_update()
+    ))
+    if not periods or periods[0] != period_end:
+        raise ValueError(f"Период {period_end.isoformat()} не закрыт")
+
+    await db.execute(delete(StockSnapshot).where(StockSnapshot.period_end >= period_end))
+    await db.execute(delete(StockPeriod).where(StockPeriod.period_end >= period_end))
+    return periods
+
+
+async def _run(through: Optional[date], reopen: Optional[date]) -> None:
+    async with AsyncSessionLocal() as db:
+        if reopen is not None:
+            reopened = await reopen_periods(db, reopen)
+            await db.commit()
+            print("Открыты: " + ", ".join(period.isoformat() for period in reopened))
+        else:
+            for period in await close_periods(db, through):
+                print(f"{period['period_end'].isoformat()}: {period['balances']} остатков")
+    await engine.dispose()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Закрытие месяцев: снимки остатков")
+    parser.add_argument("--through", type=date.fromisoformat, help="закрыть месяцы по эту дату включительно")
+    parser.add_argument("--reopen", type=date.fromisoformat, help="открыть этот и все более поздние месяцы")
+    args = parser.parse_args(argv)
+    asyncio.run(_run(args.through, args.reopen))
+
+
+if __name__ == "__main__":
+    main()
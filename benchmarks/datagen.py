@@ -0,0 +1,413 @@
+# benchmarks/datagen.py
+"""
+Генератор синтетических данных склада для нагрузочного тестирования.
+
+    python -m benchmarks.datagen --products 100000 --documents 1000000 \
+        --lines 10000000 --zones 200 --seed 42 --reset
+
+Данные строятся векторно (numpy) блоками документов и грузятся через
+LOAD DATA LOCAL INFILE (--method load-data, нужен local_infile=ON на
+сервере) или многострочными INSERT (--method insert). Результат
+детерминирован по --seed:
+- популярность товаров скошена (закон Ципфа, --skew), популярные товары
+  разбросаны по id, а не сосредоточены в начале;
+- типы документов согласованы с зонами: приход — только получатель,
+  списание — только отправитель, перемещение — разные зоны,
+  инвентаризация — отправитель и получатель совпадают (движение нулевое);
+- товар встречается в документе не больше одного раза.
+
+Пишет в SYNC_DATABASE_URL; схема должна уже существовать
+(дамп БД + alembic upgrade head). Без --reset отказывается работать
+с непустой БД.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, Tuple
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+from app.db.database import SYNC_DATABASE_URL
+
+# Порядок важен: очищаем от зависимых таблиц к справочникам
+TABLES = [
+    "idempotency_keys", "role_permissions", "document_stats_daily", "stock_snapshots", "stock_periods",
+    "stock_balances", "documentlines", "documents", "products", "employees",
+    "companies", "companytypes", "documenttypes", "categories", "units",
+    "storagezones", "storageconditions", "roles", "positions", "subdivisions",
+]
+
+# id типов документов; 1 — приход (на него завязана проверка поставщика)
+RECEIPT, TRANSFER, WRITEOFF, INVENTORY = 1, 2, 3, 4
+DOCUMENT_TYPES = [
+    (RECEIPT, "Приход"),
+    (TRANSFER, "Перемещение"),
+    (WRITEOFF, "Списание"),
+    (INVENTORY, "Инвентаризация"),
+]
+DOCUMENT_TYPE_SHARES = [0.45, 0.25, 0.2, 0.1]
+# Средний размер строки по типу документа (геометрическое распределение)
+MEAN_QUANTITY = {RECEIPT: 40, TRANSFER: 15, WRITEOFF: 3, INVENTORY: 30}
+
+START_DATE = np.datetime64("2020-01-01")
+END_DATE = np.datetime64("2026-01-01")
+
+BENCH_LOGIN = "bench"
+BENCH_PASSWORD = "bench"
+
+# В числовых массивах NULL кодируется как -1
+NULL = -1
+
+
+@dataclass
+class Scale:
+    products: int = 100_000
+    documents: int = 1_000_000
+    lines: int = 10_000_000
+    zones: int = 200
+    companies: int = 1_000
+    categories: int = 100
+    seed: int = 42
+
+
+@dataclass
+class TableSpec:
+    """Как превратить целочисленные массивы в строки таблицы"""
+    table: str
+    columns: Tuple[str, ...]
+    nullable: Tuple[str, ...] = ()
+    # Даты хранятся как число дней от 1970-01-01
+    dates: Tuple[str, ...] = ()
+    # Текстовые столбцы вида префикс + значение другого столбца
+    labels: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+
+
+PRODUCTS = TableSpec(
+    "products",
+    ("id", "article", "purchase_price", "sell_price", "is_active", "category_id", "unit_id"),
+    labels={"name": ("Товар ", "id")},
+)
+DOCUMENTS = TableSpec(
+    "documents",
+    ("id", "date", "company_id", "document_type_id"),
+    nullable=("company_id",),
+    dates=("date",),
+    labels={"number": ("", "id")},
+)
+DOCUMENT_LINES = TableSpec(
+    "documentlines",
+    ("document_id", "product_id", "quantity", "actual_quantity",
+     "storage_zone_sender_id", "storage_zone_receiver_id"),
+    nullable=("actual_quantity", "storage_zone_sender_id", "storage_zone_receiver_id"),
+)
+
+
+# --- генерация ---
+
+def product_popularity(rng: np.random.Generator, n_products: int, skew: float) -> np.ndarray:
+    """Кумулятивное распределение выбора товаров по id (Ципф со случайной перестановкой рангов)"""
+    weights = 1.0 / np.arange(1, n_products + 1) ** skew
+    weights = weights[rng.permutation(n_products)]
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+def generate_products(rng: np.random.Generator, scale: Scale) -> Dict[str, np.ndarray]:
+    n = scale.products
+    ids = np.arange(1, n + 1)
+    purchase = np.clip(rng.lognormal(np.log(300), 1.0, n), 1, 1_000_000).astype(np.int64)
+    category_cdf = product_popularity(rng, scale.categories, 0.8)
+    return {
+        "id": ids,
+        "article": 100_000 + ids,
+        "purchase_price": purchase,
+        "sell_price": (purchase * rng.uniform(1.1, 1.8, n)).astype(np.int64),
+        "is_active": (rng.random(n) > 0.05).astype(np.int64),
+        "category_id": np.searchsorted(category_cdf, rng.random(n)) + 1,
+        "unit_id": rng.choice(4, n, p=[0.7, 0.15, 0.1, 0.05]) + 1,
+    }
+
+
+def generate_documents(
+    rng: np.random.Generator,
+    scale: Scale,
+    popularity: np.ndarray,
+    chunk_documents: int,
+) -> Iterator[Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]]:
+    """Блоки (документы, строки) по chunk_documents документов"""
+    days = int((END_DATE - START_DATE).astype(int))
+    start_day = int(START_DATE.astype("datetime64[D]").astype(int))
+
+    for start in range(1, scale.documents + 1, chunk_documents):
+        end = min(start + chunk_documents, scale.documents + 1)
+        doc_ids = np.arange(start, end)
+        n_docs = len(doc_ids)
+
+        doc_types = rng.choice(4, n_docs, p=DOCUMENT_TYPE_SHARES) + 1
+        # Даты растут вместе с id, как при обычной работе склада
+        dates = start_day + (doc_ids - 1) * days // scale.documents
+        companies = np.where(doc_types == RECEIPT, rng.integers(1, scale.companies + 1, n_docs), NULL)
+        zones = rng.integers(1, scale.zones + 1, n_docs)
+        # Вторая зона перемещения всегда отличается от первой
+        other_zones = (zones - 1 + rng.integers(1, max(scale.zones, 2), n_docs)) % scale.zones + 1
+
+        # Строки делим между документами блока так, чтобы в сумме вышло --lines
+        # (за вычетом схлопнутых повторов товара в документе)
+        chunk_lines = (end - 1) * scale.lines // scale.documents - (start - 1) * scale.lines // scale.documents
+        counts = rng.multinomial(chunk_lines, np.full(n_docs, 1.0 / n_docs))
+
+        line_doc = np.repeat(np.arange(n_docs), counts)
+        products = np.searchsorted(popularity, rng.random(len(line_doc))) + 1
+        # Повтор товара в документе схлопываем; ключ заодно сортирует строки
+        _, keep = np.unique(line_doc * (scale.products + 1) + products, return_index=True)
+        line_doc, products = line_doc[keep], products[keep]
+
+        line_types = doc_types[line_doc]
+        line_zones = zones[line_doc]
+        mean = np.array([0] + [MEAN_QUANTITY[t] for t in (RECEIPT, TRANSFER, WRITEOFF, INVENTORY)])
+        quantities = rng.geometric(1.0 / mean[line_types])
+
+        is_inventory = line_types == INVENTORY
+        actual = np.where(
+            is_inventory,
+            np.maximum(quantities + rng.integers(-2, 3, len(quantities)), 0),
+            NULL,
+        )
+        sender = np.where(line_types == RECEIPT, NULL, line_zones)
+        receiver = np.select(
+            [line_types == RECEIPT, line_types == TRANSFER, is_inventory],
+            [line_zones, other_zones[line_doc], line_zones],
+            NULL,
+        )
+
+        documents = {
+            "id": doc_ids,
+            "date": dates,
+            "company_id": companies,
+            "document_type_id": doc_types,
+        }
+        lines = {
+            "document_id": doc_ids[line_doc],
+            "product_id": products,
+            "quantity": quantities,
+            "actual_quantity": actual,
+            "storage_zone_sender_id": sender,
+            "storage_zone_receiver_id": receiver,
+        }
+        yield documents, lines
+
+
+# --- загрузка ---
+
+def _rows(spec: TableSpec, arrays: Dict[str, np.ndarray]) -> Tuple[list, list]:
+    columns = list(spec.columns) + list(spec.labels)
+    values = []
+    for column in spec.columns:
+        array = arrays[column]
+        if column in spec.dates:
+            values.append(array.astype("datetime64[D]").astype(str).tolist())
+        elif column in spec.nullable:
+            values.append([None if v == NULL else v for v in array.tolist()])
+        else:
+            values.append(array.tolist())
+    for prefix, source in spec.labels.values():
+        values.append([prefix + str(v) for v in arrays[source].tolist()])
+    return columns, list(zip(*values))
+
+
+def write_insert(conn, spec: TableSpec, arrays: Dict[str, np.ndarray], batch_size: int) -> None:
+    columns, rows = _rows(spec, arrays)
+    sql = f"INSERT INTO {spec.table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    # pymysql сворачивает executemany для INSERT ... VALUES в многострочный INSERT
+    for start in range(0, len(rows), batch_size):
+        conn.exec_driver_sql(sql, rows[start:start + batch_size])
+
+
+def write_load_data(conn, spec: TableSpec, arrays: Dict[str, np.ndarray], batch_size: int = 0) -> None:
+    matrix = np.column_stack([arrays[column] for column in spec.columns])
+    targets = [f"@{c}" if c in spec.nullable or c in spec.dates else c for c in spec.columns]
+    assignments = [f"{c} = NULLIF(@{c}, {NULL})" for c in spec.nullable]
+    assignments += [f"{c} = DATE_ADD('1970-01-01', INTERVAL @{c} DAY)" for c in spec.dates]
+    assignments += [f"{c} = CONCAT('{prefix}', {source})" for c, (prefix, source) in spec.labels.items()]
+
+    fd, path = tempfile.mkstemp(suffix=".tsv")
+    try:
+        with os.fdopen(fd, "w") as f:
+            np.savetxt(f, matrix, fmt="%d", delimiter="\t")
+        conn.exec_driver_sql(
+            f"LOAD DATA LOCAL INFILE '{path.replace(os.sep, '/')}' INTO TABLE {spec.table} "
+            f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' "
+            f"({', '.join(targets)}) SET {', '.join(assignments)}"
+        )
+    finally:
+        os.remove(path)
+
+
+WRITERS = {"insert": write_insert, "load-data": write_load_data}
+
+
+def _insert(conn, table: str, columns: list, rows: list) -> None:
+    conn.exec_driver_sql(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+        rows,
+    )
+
+
+def reset(conn) -> None:
+    conn.exec_driver_sql("SET FOREIGN_KEY_CHECKS = 0")
+    for table in TABLES:
+        conn.exec_driver_sql(f"TRUNCATE TABLE {table}")
+    conn.exec_driver_sql("SET FOREIGN_KEY_CHECKS = 1")
+
+
+def seed_reference(conn, scale: Scale) -> None:
+    _insert(conn, "documenttypes", ["id", "name"], DOCUMENT_TYPES)
+    _insert(conn, "companytypes", ["id", "name"], [(1, "Поставщик"), (2, "Покупатель")])
+    _insert(conn, "categories", ["id", "name"], [(i, f"Категория {i}") for i in range(1, scale.categories + 1)])
+    _insert(conn, "units", ["id", "name"], [(1, "шт"), (2, "кг"), (3, "л"), (4, "м")])
+    _insert(conn, "storageconditions", ["id", "name"], [(1, "Обычные"), (2, "Холод"), (3, "Заморозка")])
+    _insert(
+        conn, "storagezones", ["id", "name", "comment", "storage_condition_id"],
+        [(i, f"Зона {i}", None, i % 3 + 1) for i in range(1, scale.zones + 1)],
+    )
+    _insert(
+        conn, "companies", ["id", "name", "company_type_id"],
+        [(i, f"Компания {i}", i % 2 + 1) for i in range(1, scale.companies + 1)],
+    )
+    _insert(conn, "roles", ["id", "name"], [(1, "admin"), (2, "storekeeper")])
+    _insert(conn, "role_permissions", ["role_id", "permission"], [(1, "*"), (2, "documents:*")])
+    _insert(conn, "positions", ["id", "name"], [(1, "Кладовщик")])
+    _insert(conn, "subdivisions", ["id", "name"], [(1, "Склад")])
+    _insert(
+        conn, "employees",
+        ["id", "login", "password", "first_name", "last_name", "passport_series",
+         "passport_number", "position_id", "subdivision_id", "role_id"],
+        [(1, BENCH_LOGIN, BENCH_PASSWORD, "Bench", "User", 1000, 100000, 1, 1, 1)],
+    )
+
+
+def rebuild_stock_balances(conn) -> None:
+    conn.exec_driver_sql("""
+        INSERT INTO stock_balances (product_id, zone_id, quantity)
+        SELECT product_id, zone_id, SUM(delta)
+        FROM (
+            SELECT product_id, storage_zone_receiver_id AS zone_id, quantity AS delta
+            FROM documentlines WHERE storage_zone_receiver_id IS NOT NULL
+            UNION ALL
+            SELECT product_id, storage_zone_sender_id AS zone_id, -quantity AS delta
+            FROM documentlines WHERE storage_zone_sender_id IS NOT NULL
+        ) movements
+        GROUP BY product_id, zone_id
+    """)
+
+
+def rebuild_document_stats(conn) -> None:
+    conn.exec_driver_sql("""
+        INSERT INTO document_stats_daily (date, document_type_id, company_id, count, total_quantity)
+        SELECT d.date, d.document_type_id, COALESCE(d.company_id, 0),
+               COUNT(*), COALESCE(SUM(l.quantity), 0)
+        FROM documents d
+        LEFT JOIN (
+            SELECT document_id, SUM(quantity) AS quantity FROM documentlines GROUP BY document_id
+        ) l ON l.document_id = d.id
+        GROUP BY d.date, d.document_type_id, COALESCE(d.company_id, 0)
+    """)
+
+
+def generate(
+    scale: Scale,
+    method: str = "load-data",
+    skew: float = 1.1,
+    chunk_documents: int = 100_000,
+    batch_size: int = 5_000,
+    reset_tables: bool = False,
+    url: str = SYNC_DATABASE_URL,
+) -> None:
+    if scale.zones < 2:
+        raise SystemExit("Нужно минимум две зоны хранения (перемещения идут между разными зонами)")
+
+    write = WRITERS[method]
+    connect_args = {"local_infile": True} if method == "load-data" else {}
+    engine = create_engine(url, connect_args=connect_args)
+    rng = np.random.default_rng(scale.seed)
+
+    with engine.begin() as conn:
+        if reset_tables:
+            reset(conn)
+        elif conn.execute(text("SELECT COUNT(*) FROM products")).scalar():
+            raise SystemExit("База не пуста; запустите с --reset, чтобы очистить таблицы склада")
+
+    def timed(name: str):
+        started = time.perf_counter()
+        return lambda rows: print(
+            f"{name}: {rows} строк за {time.perf_counter() - started:.1f} с", file=sys.stderr,
+        )
+
+    with engine.begin() as conn:
+        done = timed("справочники")
+        seed_reference(conn, scale)
+        done(scale.zones + scale.companies + scale.categories)
+
+    with engine.begin() as conn:
+        # Проверки ключей на время массовой загрузки не нужны: данные согласованы по построению
+        conn.exec_driver_sql("SET SESSION unique_checks = 0, foreign_key_checks = 0")
+        done = timed("товары")
+        write(conn, PRODUCTS, generate_products(rng, scale), batch_size)
+        done(scale.products)
+
+    popularity = product_popularity(rng, scale.products, skew)
+    total_documents = total_lines = 0
+    done = timed("документы и строки")
+    for documents, lines in generate_documents(rng, scale, popularity, chunk_documents):
+        with engine.begin() as conn:
+            conn.exec_driver_sql("SET SESSION unique_checks = 0, foreign_key_checks = 0")
+            write(conn, DOCUMENTS, documents, batch_size)
+            write(conn, DOCUMENT_LINES, lines, batch_size)
+        total_documents += len(documents["id"])
+        total_lines += len(lines["document_id"])
+    done(total_documents + total_lines)
+
+    with engine.begin() as conn:
+        done = timed("остатки")
+        rebuild_stock_balances(conn)
+        done(conn.execute(text("SELECT COUNT(*) FROM stock_balances")).scalar())
+        done = timed("сводка документов")
+        rebuild_document_stats(conn)
+        done(conn.execute(text("SELECT COUNT(*) FROM document_stats_daily")).scalar())
+    engine.dispose()
+
+
+def add_scale_arguments(parser: argparse.ArgumentParser) -> None:
+    for name, value in asdict(Scale()).items():
+        parser.add_argument(f"--{name}", type=int, default=value)
+
+
+def scale_from_args(args: argparse.Namespace) -> Scale:
+    return Scale(**{name: getattr(args, name) for name in asdict(Scale())})
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Генератор синтетических данных склада")
+    add_scale_arguments(parser)
+    parser.add_argument("--method", choices=sorted(WRITERS), default="load-data")
+    parser.add_argument("--skew", type=float, default=1.1, help="показатель Ципфа для популярности товаров")
+    parser.add_argument("--chunk-documents", type=int, default=100_000, help="документов в одном блоке/транзакции")
+    parser.add_argument("--batch-size", type=int, default=5_000, help="строк в одном INSERT (--method insert)")
+    parser.add_argument("--reset", action="store_true", help="очистить таблицы склада перед заполнением")
+    args = parser.parse_args(argv)
+    generate(
+        scale_from_args(args),
+        method=args.method,
+        skew=args.skew,
+        chunk_documents=args.chunk_documents,
+        batch_size=args.batch_size,
+        reset_tables=args.reset,
+    )
+
+
+if __name__ == "__main__":
+    main()
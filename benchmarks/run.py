@@ -0,0 +1,264 @@
+# benchmarks/run.py
+"""
+Нагрузочный прогон эндпоинтов через ASGI-приложение в том же процессе.
+
+    python -m benchmarks.run --concurrency 1 8 32 --requests 500 \
+        --output benchmarks/results/after.json --baseline benchmarks/results/before.json
+
+Для каждого сценария и уровня параллельности считает p50/p95/p99,
+пропускную способность и число SQL на запрос (из заголовка Server-Timing,
+см. app/core/metrics.py). Результаты сохраняются в JSON; с --baseline
+печатается сравнение p95 с предыдущим прогоном.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import re
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import httpx
+from sqlalchemy import create_engine, text
+
+from app.db.database import SYNC_DATABASE_URL, engine
+from app.main import app
+from benchmarks.datagen import BENCH_LOGIN, BENCH_PASSWORD
+
+_SERVER_TIMING_DB = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+
+@dataclass
+class Ids:
+    """Диапазоны id в БД, из которых сценарии выбирают параметры пути"""
+    products: int
+    documents: int
+    lines: int
+    companies: int
+    zones: int
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    # (rng, ids) -> (path, json-тело или None)
+    request: Callable[[random.Random, Ids], tuple]
+    write: bool = False
+
+
+def _get(path: str) -> Callable[[random.Random, Ids], tuple]:
+    return lambda rng, ids: (path, None)
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario("products.list", "GET", _get("/products/?limit=50")),
+    Scenario("products.list_by_price", "GET", _get("/products/?limit=50&sort=sell_price&order=desc&category_id=1")),
+    Scenario("products.get", "GET", lambda rng, ids: (f"/products/{rng.randint(1, ids.products)}", None)),
+    Scenario("products.quantity", "GET", lambda rng, ids: (
+        f"/products/{rng.randint(1, ids.products)}/quantity?zone_id={rng.randint(1, ids.zones)}", None)),
+    Scenario("products.fullquantity", "GET", lambda rng, ids: (
+        f"/products/{rng.randint(1, ids.products)}/fullquantity", None)),
+    Scenario("products.movements", "GET", lambda rng, ids: (
+        f"/products/{rng.randint(1, ids.products)}/movements?limit=100", None)),
+    Scenario("products.quantities", "GET", lambda rng, ids: (
+        "/products/quantities?product_ids=" + ",".join(str(rng.randint(1, ids.products)) for _ in range(20)), None)),
+    Scenario("documents.list", "GET", _get("/documents/?limit=50")),
+    Scenario("documents.list_by_type", "GET", _get("/documents/?limit=50&document_type_id=2")),
+    Scenario("documents.stats", "GET", _get("/documents/stats/summary")),
+    Scenario("documents.timeseries", "GET", _get(
+        "/documents/stats/timeseries?date_from=2025-01-01&date_to=2025-12-31&granularity=month")),
+    Scenario("documents.get", "GET", lambda rng, ids: (f"/documents/{rng.randint(1, ids.documents)}", None)),
+    Scenario("documentlines.by_document", "GET", lambda rng, ids: (
+        f"/documentlines/document/{rng.randint(1, ids.documents)}", None)),
+    Scenario("documentlines.get", "GET", lambda rng, ids: (f"/documentlines/{rng.randint(1, ids.lines)}", None)),
+    Scenario("companies.list", "GET", _get("/companies/")),
+    Scenario("companies.get", "GET", lambda rng, ids: (f"/companies/{rng.randint(1, ids.companies)}", None)),
+    Scenario("storagezones.list", "GET", _get("/storagezones/")),
+    Scenario("storagezones.get", "GET", lambda rng, ids: (f"/storagezones/{rng.randint(1, ids.zones)}", None)),
+    Scenario("auth.login", "POST", lambda rng, ids: (
+        "/auth/login", {"login": BENCH_LOGIN, "password": BENCH_PASSWORD})),
+    Scenario("auth.validate", "GET", _get("/auth/validate")),
+    # Пишущие сценарии меняют данные и включаются флагом --writes
+    Scenario("documents.create", "POST", lambda rng, ids: ("/documents/", {
+        "number": f"bench-{rng.getrandbits(32)}", "date": "2026-01-01", "document_type_id": 2,
+    }), write=True),
+    Scenario("documentlines.batch", "POST", lambda rng, ids: ("/documentlines/batch", {
+        "document_id": rng.randint(1, ids.documents),
+        "lines": [
+            {"product_id": product_id, "quantity": rng.randint(1, 10),
+             "storage_zone_receiver_id": rng.randint(1, ids.zones)}
+            for product_id in rng.sample(range(1, ids.products + 1), 10)
+        ],
+    }), write=True),
+]
+
+
+def load_ids(url: str = SYNC_DATABASE_URL) -> Ids:
+    sync_engine = create_engine(url)
+    with sync_engine.connect() as conn:
+        values = {
+            table: conn.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {table}")).scalar()
+            for table in ("products", "documents", "documentlines", "companies", "storagezones")
+        }
+    sync_engine.dispose()
+    return Ids(
+        products=values["products"], documents=values["documents"], lines=values["documentlines"],
+        companies=values["companies"], zones=values["storagezones"],
+    )
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    ids: Ids,
+    concurrency: int,
+    total: int,
+    seed: int,
+) -> dict:
+    rng = random.Random(f"{seed}:{scenario.name}:{concurrency}")
+    requests = [scenario.request(rng, ids) for _ in range(total)]
+    latencies, queries, db_ms = [], [], []
+    errors = 0
+    queue = iter(requests)
+
+    async def worker():
+        nonlocal errors
+        for path, body in queue:
+            started = time.perf_counter()
+            response = await client.request(scenario.method, path, json=body)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+            match = _SERVER_TIMING_DB.search(response.headers.get("server-timing", ""))
+            if match:
+                db_ms.append(float(match.group(1)))
+                queries.append(int(match.group(2)))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "endpoint": scenario.name,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "queries_per_request": round(sum(queries) / len(queries), 2) if queries else None,
+        "db_ms_per_request": round(sum(db_ms) / len(db_ms), 3) if db_ms else None,
+    }
+
+
+async def login(client: httpx.AsyncClient) -> Optional[str]:
+    response = await client.post("/auth/login", json={"login": BENCH_LOGIN, "password": BENCH_PASSWORD})
+    if response.status_code != 200:
+        return None
+    return response.json()["access_token"]
+
+
+async def run(args: argparse.Namespace) -> dict:
+    ids = load_ids()
+    scenarios = [
+        s for s in SCENARIOS
+        if (args.writes or not s.write) and (not args.only or any(s.name.startswith(p) for p in args.only))
+    ]
+    transport = httpx.ASGITransport(app=app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        token = await login(client)
+        if token:
+            client.headers["Authorization"] = f"Bearer {token}"
+        for scenario in scenarios:
+            # Прогрев: пул соединений, кэши справочников, план запроса в MySQL
+            await run_scenario(client, scenario, ids, 1, args.warmup, args.seed)
+            for concurrency in args.concurrency:
+                result = await run_scenario(client, scenario, ids, concurrency, args.requests, args.seed)
+                results.append(result)
+                print(
+                    f"{result['endpoint']:<28} c={concurrency:<3} p50={result['p50_ms']:>8.2f}ms "
+                    f"p95={result['p95_ms']:>8.2f}ms p99={result['p99_ms']:>8.2f}ms "
+                    f"{result['throughput_rps']:>8.1f} rps q/req={result['queries_per_request']} "
+                    f"errors={result['errors']}",
+                    file=sys.stderr,
+                )
+    await engine.dispose()
+    return {"meta": meta(args, ids), "results": results}
+
+
+def meta(args: argparse.Namespace, ids: Ids) -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "seed": args.seed,
+        "dataset": ids.__dict__,
+    }
+
+
+def compare(current: dict, baseline: dict) -> None:
+    """Печатает изменение p95 и числа SQL относительно предыдущего прогона"""
+    previous = {(r["endpoint"], r["concurrency"]): r for r in baseline["results"]}
+    for result in current["results"]:
+        before = previous.get((result["endpoint"], result["concurrency"]))
+        if not before or not before["p95_ms"]:
+            continue
+        change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+        print(
+            f"{result['endpoint']:<28} c={result['concurrency']:<3} "
+            f"p95 {before['p95_ms']:>8.2f} -> {result['p95_ms']:>8.2f}ms ({change:+.1f}%) "
+            f"q/req {before['queries_per_request']} -> {result['queries_per_request']}",
+        )
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк эндпоинтов API")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="запросов на сценарий и уровень параллельности")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--writes", action="store_true", help="включить сценарии, изменяющие данные")
+    parser.add_argument("--only", nargs="*", help="префиксы имён сценариев, например products documents.get")
+    parser.add_argument("--output", type=Path, help="куда сохранить JSON (по умолчанию benchmarks/results/<время>.json)")
+    parser.add_argument("--baseline", type=Path, help="JSON предыдущего прогона для сравнения")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+
+    output = args.output or Path("benchmarks/results") / (
+        datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"Результаты: {output}", file=sys.stderr)
+
+    if args.baseline:
+        compare(report, json.loads(args.baseline.read_text()))
+
+
+if __name__ == "__main__":
+    main()
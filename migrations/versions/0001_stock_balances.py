@@ -0,0 +1,45 @@
+"""stock_balances: материализованные остатки по товарам и зонам
+
+Revision ID: 0001_stock_balances
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_stock_balances"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "stock_balances",
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id"), primary_key=True),
+        sa.Column("zone_id", sa.Integer(), sa.ForeignKey("storagezones.id"), primary_key=True),
+        sa.Column("quantity", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.create_index("ix_stock_balances_zone_id", "stock_balances", ["zone_id"])
+
+    # Заполняем остатки по уже проведённым строкам документов
+    op.execute("""
+        INSERT INTO stock_balances (product_id, zone_id, quantity)
+        SELECT product_id, zone_id, SUM(delta)
+        FROM (
+            SELECT product_id, storage_zone_receiver_id AS zone_id, quantity AS delta
+            FROM documentlines
+            WHERE storage_zone_receiver_id IS NOT NULL
+            UNION ALL
+            SELECT product_id, storage_zone_sender_id AS zone_id, -quantity AS delta
+            FROM documentlines
+            WHERE storage_zone_sender_id IS NOT NULL
+        ) movements
+        WHERE product_id IS NOT NULL
+        GROUP BY product_id, zone_id
+    """)
+
+
+def downgrade():
+    op.drop_index("ix_stock_balances_zone_id", table_name="stock_balances")
+    op.drop_table("stock_balances")
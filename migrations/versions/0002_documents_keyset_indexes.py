@@ -0,0 +1,31 @@
+"""documents: составные индексы под keyset-пагинацию
+
+Revision ID: 0002_documents_keyset_indexes
+Revises: 0001_stock_balances
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0002_documents_keyset_indexes"
+down_revision = "0001_stock_balances"
+branch_labels = None
+depends_on = None
+
+# Каждый индекс заканчивается на (date, id) — порядок сортировки списка,
+# поэтому любая страница читается диапазоном по индексу без filesort
+INDEXES = {
+    "ix_documents_date_id": ["date", "id"],
+    "ix_documents_type_date_id": ["document_type_id", "date", "id"],
+    "ix_documents_company_date_id": ["company_id", "date", "id"],
+    "ix_documents_type_company_date_id": ["document_type_id", "company_id", "date", "id"],
+}
+
+
+def upgrade():
+    for name, columns in INDEXES.items():
+        op.create_index(name, "documents", columns)
+
+
+def downgrade():
+    for name in INDEXES:
+        op.drop_index(name, table_name="documents")
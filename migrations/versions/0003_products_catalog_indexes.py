@@ -0,0 +1,34 @@
+"""products: индексы под фильтры и сортировку каталога
+
+Revision ID: 0003_products_catalog_indexes
+Revises: 0002_documents_keyset_indexes
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0003_products_catalog_indexes"
+down_revision = "0002_documents_keyset_indexes"
+branch_labels = None
+depends_on = None
+
+# Ключи сортировки (name, article, sell_price) дополнены id — это второй
+# ключ keyset-курсора. Фильтр по category_id чаще всего идёт вместе с
+# сортировкой по цене, для остальных фильтров хватает (filter, id).
+INDEXES = {
+    "ix_products_name_id": ["name", "id"],
+    "ix_products_article_id": ["article", "id"],
+    "ix_products_sell_price_id": ["sell_price", "id"],
+    "ix_products_category_sell_price_id": ["category_id", "sell_price", "id"],
+    "ix_products_unit_id_id": ["unit_id", "id"],
+    "ix_products_is_active_id": ["is_active", "id"],
+}
+
+
+def upgrade():
+    for name, columns in INDEXES.items():
+        op.create_index(name, "products", columns)
+
+
+def downgrade():
+    for name in INDEXES:
+        op.drop_index(name, table_name="products")
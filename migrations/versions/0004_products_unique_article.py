@@ -0,0 +1,25 @@
+"""products: уникальный article для upsert при импорте каталога
+
+Revision ID: 0004_products_unique_article
+Revises: 0003_products_catalog_indexes
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0004_products_unique_article"
+down_revision = "0003_products_catalog_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Перед миграцией в products не должно быть повторяющихся article.
+    # Уникальный индекс заменяет (article, id): InnoDB и так хранит id
+    # в каждом вторичном индексе, поэтому сортировка по article не страдает.
+    op.drop_index("ix_products_article_id", table_name="products")
+    op.create_index("ux_products_article", "products", ["article"], unique=True)
+
+
+def downgrade():
+    op.drop_index("ux_products_article", table_name="products")
+    op.create_index("ix_products_article_id", "products", ["article", "id"])
@@ -0,0 +1,29 @@
+"""role_permissions: права ролей для проверки доступа к маршрутам
+
+Revision ID: 0005_role_permissions
+Revises: 0004_products_unique_article
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005_role_permissions"
+down_revision = "0004_products_unique_article"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "role_permissions",
+        sa.Column("role_id", sa.Integer(), sa.ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("permission", sa.String(64), primary_key=True),
+    )
+    # До этой миграции маршруты были открыты всем; чтобы никого не
+    # заблокировать, существующие роли получают полный доступ, а
+    # администратор затем сужает права через PUT /roles/{role_id}/permissions
+    op.execute("INSERT INTO role_permissions (role_id, permission) SELECT id, '*' FROM roles")
+
+
+def downgrade():
+    op.drop_table("role_permissions")
@@ -0,0 +1,42 @@
+"""document_stats_daily: дневная сводка по документам для статистики
+
+Revision ID: 0006_document_stats_daily
+Revises: 0005_role_permissions
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006_document_stats_daily"
+down_revision = "0005_role_permissions"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "document_stats_daily",
+        sa.Column("date", sa.Date(), primary_key=True),
+        sa.Column("document_type_id", sa.Integer(), sa.ForeignKey("documenttypes.id"), primary_key=True),
+        sa.Column("company_id", sa.Integer(), primary_key=True, server_default="0"),
+        sa.Column("count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("total_quantity", sa.BigInteger(), nullable=False, server_default="0"),
+    )
+
+    # Заполняем сводку по уже существующим документам
+    op.execute("""
+        INSERT INTO document_stats_daily (date, document_type_id, company_id, count, total_quantity)
+        SELECT d.date, d.document_type_id, COALESCE(d.company_id, 0),
+               COUNT(*), COALESCE(SUM(l.quantity), 0)
+        FROM documents d
+        LEFT JOIN (
+            SELECT document_id, SUM(quantity) AS quantity
+            FROM documentlines
+            GROUP BY document_id
+        ) l ON l.document_id = d.id
+        GROUP BY d.date, d.document_type_id, COALESCE(d.company_id, 0)
+    """)
+
+
+def downgrade():
+    op.drop_table("document_stats_daily")
@@ -0,0 +1,71 @@
+"""stock_snapshots: помесячные снимки остатков и закрытие периодов
+
+Revision ID: 0007_stock_snapshots
+Revises: 0006_document_stats_daily
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007_stock_snapshots"
+down_revision = "0006_document_stats_daily"
+branch_labels = None
+depends_on = None
+
+# Остаток по снимку последнего закрытого месяца плюс движения после него;
+# пока периоды не закрыты, v_period = '1000-01-01' и читается вся история.
+# Существующая в БД get_inventory_quantity не меняется: её определение
+# в репозитории не хранится, и заменить её без возможности отката нельзя
+GET_STOCK_QUANTITY = """
+    CREATE FUNCTION get_stock_quantity(p_product_id INT, p_zone_id INT)
+    RETURNS INT
+    READS SQL DATA
+    BEGIN
+        DECLARE v_period DATE;
+        DECLARE v_snapshot INT DEFAULT 0;
+        DECLARE v_movements INT DEFAULT 0;
+
+        SELECT COALESCE(MAX(period_end), '1000-01-01') INTO v_period FROM stock_periods;
+
+        SELECT COALESCE(SUM(quantity), 0) INTO v_snapshot
+        FROM stock_snapshots
+        WHERE period_end = v_period AND product_id = p_product_id AND zone_id = p_zone_id;
+
+        SELECT COALESCE(SUM(
+                   CASE WHEN dl.storage_zone_receiver_id = p_zone_id THEN dl.quantity ELSE 0 END
+                 - CASE WHEN dl.storage_zone_sender_id = p_zone_id THEN dl.quantity ELSE 0 END
+               ), 0) INTO v_movements
+        FROM documents d
+        JOIN documentlines dl ON dl.document_id = d.id
+        WHERE d.date > v_period
+          AND dl.product_id = p_product_id
+          AND (dl.storage_zone_receiver_id = p_zone_id OR dl.storage_zone_sender_id = p_zone_id);
+
+        RETURN v_snapshot + v_movements;
+    END
+"""
+
+
+def upgrade():
+    op.create_table(
+        "stock_periods",
+        sa.Column("period_end", sa.Date(), primary_key=True),
+        sa.Column("closed_at", sa.DateTime(), nullable=False),
+    )
+    op.create_table(
+        "stock_snapshots",
+        sa.Column(
+            "period_end", sa.Date(),
+            sa.ForeignKey("stock_periods.period_end", ondelete="CASCADE"), primary_key=True,
+        ),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id"), primary_key=True),
+        sa.Column("zone_id", sa.Integer(), sa.ForeignKey("storagezones.id"), primary_key=True),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+    )
+    op.execute(GET_STOCK_QUANTITY)
+
+
+def downgrade():
+    op.execute("DROP FUNCTION IF EXISTS get_stock_quantity")
+    op.drop_table("stock_snapshots")
+    op.drop_table("stock_periods")
@@ -0,0 +1,28 @@
+"""documentlines: покрывающий индекс (product_id, document_id, id) под журнал движений
+
+Revision ID: 0008_documentlines_product_index
+Revises: 0007_stock_snapshots
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0008_documentlines_product_index"
+down_revision = "0007_stock_snapshots"
+branch_labels = None
+depends_on = None
+
+# Журнал движений сортирует и листает строки товара по (document_id, id),
+# поэтому id строки стоит в индексе явно сразу за document_id (неявно InnoDB
+# добавляет его только в конец). Остальные колонки журнала тоже входят в
+# индекс, и страница читается из него без обращения к таблице. Индекс по
+# одному product_id от внешнего ключа становится лишним, но MySQL удалит его
+# только вместе с ограничением, поэтому он остаётся.
+COLUMNS = ["product_id", "document_id", "id", "quantity", "storage_zone_sender_id", "storage_zone_receiver_id"]
+
+
+def upgrade():
+    op.create_index("ix_documentlines_product_document", "documentlines", COLUMNS)
+
+
+def downgrade():
+    op.drop_index("ix_documentlines_product_document", table_name="documentlines")
@@ -0,0 +1,40 @@
+"""idempotency_keys: ответы на повторы запросов с заголовком Idempotency-Key
+
+Revision ID: 0009_idempotency_keys
+Revises: 0008_documentlines_product_index
+Create Date: 2026-10-18
+
+Колонки locked_until и lock_token добавлены в эту миграцию после её
+первой версии. Если она уже применена без них, таблицу нужно пересоздать:
+alembic downgrade 0008_documentlines_product_index && alembic upgrade head
+(в таблице только кэш ответов на повторы, терять в ней нечего, кроме
+защиты от повтора запросов, отправленных до пересоздания).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0009_idempotency_keys"
+down_revision = "0008_documentlines_product_index"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "idempotency_keys",
+        sa.Column("key_hash", sa.BINARY(32), primary_key=True),
+        sa.Column("request_hash", sa.BINARY(32), nullable=False),
+        sa.Column("lock_token", sa.BINARY(16), nullable=False),
+        sa.Column("status_code", sa.SmallInteger(), nullable=True),
+        sa.Column("response", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("locked_until", sa.DateTime(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+    )
+    # Очистка просроченных ключей идёт диапазоном по expires_at
+    op.create_index("ix_idempotency_keys_expires_at", "idempotency_keys", ["expires_at"])
+
+
+def downgrade():
+    op.drop_index("ix_idempotency_keys_expires_at", table_name="idempotency_keys")
+    op.drop_table("idempotency_keys")
@@ -0,0 +1,188 @@
+"""documentlines.document_date: дата документа в строке и get_inventory_quantity по снимку
+
+Revision ID: 0010_documentlines_document_date
+Revises: 0009_idempotency_keys
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0010_documentlines_document_date"
+down_revision = "0009_idempotency_keys"
+branch_labels = None
+depends_on = None
+
+# Дата документа копируется в строки триггерами (строки вставляют и хранимые
+# процедуры), чтобы движения товара после даты снимка читались диапазоном
+# индекса (product_id, document_date, ...), а не всей историей товара
+TRIGGERS = {
+    "documentlines_set_document_date": """
+        CREATE TRIGGER documentlines_set_document_date
+        BEFORE INSERT ON documentlines FOR EACH ROW
+        SET NEW.document_date = (SELECT date FROM documents WHERE id = NEW.document_id)
+    """,
+    "documentlines_move_document_date": """
+        CREATE TRIGGER documentlines_move_document_date
+        BEFORE UPDATE ON documentlines FOR EACH ROW
+        BEGIN
+            IF NOT (NEW.document_id <=> OLD.document_id) THEN
+                SET NEW.document_date = (SELECT date FROM documents WHERE id = NEW.document_id);
+            END IF;
+        END
+    """,
+    "documents_copy_date_to_lines": """
+        CREATE TRIGGER documents_copy_date_to_lines
+        AFTER UPDATE ON documents FOR EACH ROW
+        BEGIN
+            IF NEW.date <> OLD.date THEN
+                UPDATE documentlines SET document_date = NEW.date WHERE document_id = NEW.id;
+            END IF;
+        END
+    """,
+}
+
+INDEX_COLUMNS = [
+    "product_id", "document_date", "document_id", "id",
+    "quantity", "storage_zone_sender_id", "storage_zone_receiver_id",
+]
+
+# Снимок последнего закрытого месяца плюс движения после него; строки
+# товара после v_period берутся диапазоном индекса ix_documentlines_product_date
+GET_STOCK_QUANTITY = """
+    CREATE FUNCTION get_stock_quantity(p_product_id INT, p_zone_id INT)
+    RETURNS INT
+    READS SQL DATA
+    BEGIN
+        DECLARE v_period DATE;
+        DECLARE v_snapshot INT DEFAULT 0;
+        DECLARE v_movements INT DEFAULT 0;
+
+        SELECT COALESCE(MAX(period_end), '1000-01-01') INTO v_period FROM stock_periods;
+
+        SELECT COALESCE(SUM(quantity), 0) INTO v_snapshot
+        FROM stock_snapshots
+        WHERE period_end = v_period AND product_id = p_product_id AND zone_id = p_zone_id;
+
+        SELECT COALESCE(SUM(
+                   CASE WHEN storage_zone_receiver_id = p_zone_id THEN quantity ELSE 0 END
+                 - CASE WHEN storage_zone_sender_id = p_zone_id THEN quantity ELSE 0 END
+               ), 0) INTO v_movements
+        FROM documentlines
+        WHERE product_id = p_product_id
+          AND document_date > v_period
+          AND (storage_zone_receiver_id = p_zone_id OR storage_zone_sender_id = p_zone_id);
+
+        RETURN v_snapshot + v_movements;
+    END
+"""
+
+# Определение из 0007_stock_snapshots (для отката)
+GET_STOCK_QUANTITY_0007 = """
+    CREATE FUNCTION get_stock_quantity(p_product_id INT, p_zone_id INT)
+    RETURNS INT
+    READS SQL DATA
+    BEGIN
+        DECLARE v_period DATE;
+        DECLARE v_snapshot INT DEFAULT 0;
+        DECLARE v_movements INT DEFAULT 0;
+
+        SELECT COALESCE(MAX(period_end), '1000-01-01') INTO v_period FROM stock_periods;
+
+        SELECT COALESCE(SUM(quantity), 0) INTO v_snapshot
+        FROM stock_snapshots
+        WHERE period_end = v_period AND product_id = p_product_id AND zone_id = p_zone_id;
+
+        SELECT COALESCE(SUM(
+                   CASE WHEN dl.storage_zone_receiver_id = p_zone_id THEN dl.quantity ELSE 0 END
+                 - CASE WHEN dl.storage_zone_sender_id = p_zone_id THEN dl.quantity ELSE 0 END
+               ), 0) INTO v_movements
+        FROM documents d
+        JOIN documentlines dl ON dl.document_id = d.id
+        WHERE d.date > v_period
+          AND dl.product_id = p_product_id
+          AND (dl.storage_zone_receiver_id = p_zone_id OR dl.storage_zone_sender_id = p_zone_id);
+
+        RETURN v_snapshot + v_movements;
+    END
+"""
+
+# get_inventory_quantity вызывают хранимые процедуры, поэтому имя и сигнатура
+# остаются, а считает она теперь через get_stock_quantity
+GET_INVENTORY_QUANTITY = """
+    CREATE FUNCTION get_inventory_quantity(p_product_id INT, p_zone_id INT)
+    RETURNS INT
+    READS SQL DATA
+    RETURN get_stock_quantity(p_product_id, p_zone_id)
+"""
+
+
+def _show_create_function(bind, name: str):
+    """(sql_mode, CREATE FUNCTION ...) существующей функции или None"""
+    exists = bind.execute(sa.text("""
+        SELECT COUNT(*) FROM information_schema.ROUTINES
+        WHERE ROUTINE_SCHEMA = DATABASE() AND ROUTINE_TYPE = 'FUNCTION' AND ROUTINE_NAME = :name
+    """), {"name": name}).scalar()
+    if not exists:
+        return None
+    row = bind.execute(sa.text(f"SHOW CREATE FUNCTION {name}")).mappings().one()
+    if not row["Create Function"]:
+        # Без прав на определение функции её нельзя будет восстановить при откате
+        raise RuntimeError(f"SHOW CREATE FUNCTION {name} не вернул определение: не хватает прав")
+    return row["sql_mode"], row["Create Function"]
+
+
+def upgrade():
+    op.add_column("documentlines", sa.Column("document_date", sa.Date(), nullable=True))
+    op.execute("""
+        UPDATE documentlines dl
+        JOIN documents d ON d.id = dl.document_id
+        SET dl.document_date = d.date
+    """)
+    for trigger in TRIGGERS.values():
+        op.execute(trigger)
+    op.create_index("ix_documentlines_product_date", "documentlines", INDEX_COLUMNS)
+
+    op.execute("DROP FUNCTION IF EXISTS get_stock_quantity")
+    op.execute(GET_STOCK_QUANTITY)
+
+    # Прежнее определение get_inventory_quantity в репозитории не хранится:
+    # сохраняем его из БД как есть, откат восстановит именно его
+    op.create_table(
+        "routine_backups",
+        sa.Column("name", sa.String(64), primary_key=True),
+        sa.Column("sql_mode", sa.Text(), nullable=False),
+        sa.Column("definition", sa.Text(length=2**24), nullable=False),
+    )
+    bind = op.get_bind()
+    previous = _show_create_function(bind, "get_inventory_quantity")
+    if previous is not None:
+        bind.execute(
+            sa.text("INSERT INTO routine_backups (name, sql_mode, definition) VALUES (:name, :sql_mode, :definition)"),
+            {"name": "get_inventory_quantity", "sql_mode": previous[0], "definition": previous[1]},
+        )
+        op.execute("DROP FUNCTION get_inventory_quantity")
+    op.execute(GET_INVENTORY_QUANTITY)
+
+
+def downgrade():
+    bind = op.get_bind()
+    op.execute("DROP FUNCTION IF EXISTS get_inventory_quantity")
+    previous = bind.execute(sa.text(
+        "SELECT sql_mode, definition FROM routine_backups WHERE name = 'get_inventory_quantity'"
+    )).first()
+    if previous is not None:
+        sql_mode = bind.execute(sa.text("SELECT @@SESSION.sql_mode")).scalar()
+        bind.execute(sa.text("SET SESSION sql_mode = :mode"), {"mode": previous[0]})
+        # Курсор DBAPI без параметров: тело функции выполняется как есть,
+        # без подстановки %s и :name
+        bind.connection.cursor().execute(previous[1])
+        bind.execute(sa.text("SET SESSION sql_mode = :mode"), {"mode": sql_mode})
+    op.drop_table("routine_backups")
+
+    op.execute("DROP FUNCTION IF EXISTS get_stock_quantity")
+    op.execute(GET_STOCK_QUANTITY_0007)
+
+    op.drop_index("ix_documentlines_product_date", table_name="documentlines")
+    for name in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.drop_column("documentlines", "document_date")
@@ -0,0 +1,24 @@
+"""documentlines: журнал движений читается по ix_documentlines_product_date
+
+Revision ID: 0011_drop_product_document_index
+Revises: 0010_documentlines_document_date
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0011_drop_product_document_index"
+down_revision = "0010_documentlines_document_date"
+branch_labels = None
+depends_on = None
+
+# Журнал движений идёт в порядке (document_date, document_id, id), и его
+# обслуживает индекс из 0010; индекс из 0008 по (document_id, id) больше не нужен
+COLUMNS_0008 = ["product_id", "document_id", "id", "quantity", "storage_zone_sender_id", "storage_zone_receiver_id"]
+
+
+def upgrade():
+    op.drop_index("ix_documentlines_product_document", table_name="documentlines")
+
+
+def downgrade():
+    op.create_index("ix_documentlines_product_document", "documentlines", COLUMNS_0008)
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.db.database import Base
+from app.models import models
+
+
+@pytest.fixture
+def run_db():
+    """
+    Запускает async-тест test(sessions) на чистой SQLite в памяти со схемой
+    из моделей. Движок создаётся внутри того же цикла событий, что и тест.
+    """
+    pytest.importorskip("aiosqlite")
+
+    def run(test):
+        async def main():
+            engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+            try:
+                async with engine.begin() as conn:
+                    await conn.run_sync(Base.metadata.create_all)
+                sessions = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+                return await test(sessions)
+            finally:
+                await engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
+
+
+async def seed_catalog(db, products=(1,), zones=(1, 2)) -> None:
+    """Минимальный справочник: тип документа 1, товары и зоны с заданными id"""
+    db.add(models.DocumentType(id=1, name="receipt"))
+    for product_id in products:
+        db.add(models.Product(id=product_id, article=product_id, name=f"p{product_id}", is_active=True))
+    for zone_id in zones:
+        db.add(models.StorageZone(id=zone_id, name=f"z{zone_id}", storage_condition_id=1))
+    await db.flush()
+
+
+def add_document(db, document_id, day, lines) -> None:
+    """
+    Документ с датой day и строками (product_id, quantity, sender, receiver).
+    document_date строк в MySQL заполняет триггер, здесь — сам тест.
+    """
+    db.add(models.Document(id=document_id, number=str(document_id), date=day, document_type_id=1))
+    for product_id, quantity, sender, receiver in lines:
+        db.add(models.DocumentLine(
+            document_id=document_id, product_id=product_id, quantity=quantity,
+            storage_zone_sender_id=sender, storage_zone_receiver_id=receiver, document_date=day,
+        ))
@@ -0,0 +1,39 @@
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+
+from app.routers.documentlines import update_actual_quantities
+from app.schemas.schemas import DocumentLineCountBatch
+from tests.conftest import add_document, seed_catalog
+
+
+def apply_counts(run_db, counts):
+    """Статус и тело ошибки PATCH /documentlines/actual для документа с двумя строками товара 1"""
+    async def check(sessions):
+        async with sessions() as db:
+            await seed_catalog(db, products=(1, 2))
+            add_document(db, 1, date(2026, 1, 5), [(1, 10, 1, 1), (1, 3, 2, 2), (2, 5, 1, 1)])
+            await db.commit()
+            batch = DocumentLineCountBatch(document_id=1, counts=counts)
+            with pytest.raises(HTTPException) as error:
+                await update_actual_quantities(batch, db)
+            return error.value.status_code, error.value.detail["errors"]
+
+    return run_db(check)
+
+
+def test_ambiguous_product_count_is_409(run_db):
+    status, errors = apply_counts(run_db, [{"product_id": 1, "actual_quantity": 9}])
+    assert status == 409
+    assert errors == [{
+        "index": 0, "product_id": 1, "line_ids": [1, 2],
+        "status": 409, "error": "Product has several lines in document, specify line_id",
+    }]
+
+
+def test_unknown_product_is_422(run_db):
+    status, errors = apply_counts(run_db, [{"product_id": 2, "actual_quantity": 5},
+                                           {"product_id": 3, "actual_quantity": 1}])
+    assert status == 422
+    assert [(error["index"], error["status"]) for error in errors] == [(1, 404)]
@@ -0,0 +1,149 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.models import IdempotencyKey
+from app.services import idempotency
+
+
+@pytest.fixture
+def run_keys(run_db, monkeypatch):
+    """run_db, в котором сервис идемпотентности открывает сессии той же БД"""
+
+    def run(test):
+        async def with_sessions(sessions):
+            monkeypatch.setattr(idempotency, "AsyncSessionLocal", sessions)
+            return await test(sessions)
+
+        return run_db(with_sessions)
+
+    return run
+
+
+def handler(sessions, calls, content=None, before_store=None):
+    """Обработчик, который сохраняет ответ в своей транзакции, как роутеры"""
+
+    async def run(claim):
+        calls.append(claim)
+        if before_store is not None:
+            await before_store()
+        async with sessions() as db:
+            response = content or {"call": len(calls)}
+            await claim.store(db, response)
+            await db.commit()
+            return response
+
+    return run
+
+
+def body(response):
+    return json.loads(response.body)
+
+
+def test_first_run_is_stored_and_replayed(run_keys):
+    async def check(sessions):
+        calls = []
+        first = await idempotency.run_once("k", "scope", {"a": 1}, handler(sessions, calls), 201)
+        again = await idempotency.run_once("k", "scope", {"a": 1}, handler(sessions, calls), 201)
+        assert len(calls) == 1
+        assert (first.status_code, body(first)) == (201, {"call": 1})
+        assert (again.status_code, body(again)) == (201, {"call": 1})
+        assert again.headers["Idempotent-Replayed"] == "true"
+
+        other = await idempotency.run_once("k", "other", {"a": 1}, handler(sessions, calls))
+        assert body(other) == {"call": 2}
+
+    run_keys(check)
+
+
+def test_same_key_with_other_payload_is_rejected(run_keys):
+    async def check(sessions):
+        calls = []
+        await idempotency.run_once("k", "scope", {"a": 1}, handler(sessions, calls))
+        with pytest.raises(HTTPException) as error:
+            await idempotency.run_once("k", "scope", {"a": 2}, handler(sessions, calls))
+        assert error.value.status_code == 422
+        assert len(calls) == 1
+
+    run_keys(check)
+
+
+def test_concurrent_duplicate_waits_for_first_response(run_keys):
+    async def check(sessions):
+        calls, started, finish = [], asyncio.Event(), asyncio.Event()
+
+        async def slow():
+            started.set()
+            await finish.wait()
+
+        first = asyncio.create_task(
+            idempotency.run_once("k", "scope", {}, handler(sessions, calls, before_store=slow))
+        )
+        await started.wait()
+        second = asyncio.create_task(idempotency.run_once("k", "scope", {}, handler(sessions, calls)))
+        await asyncio.sleep(idempotency.POLL_INTERVAL * 2)
+        finish.set()
+        first, second = await first, await second
+        assert len(calls) == 1
+        assert body(first) == body(second) == {"call": 1}
+
+    run_keys(check)
+
+
+def test_failed_handler_releases_key(run_keys):
+    async def check(sessions):
+        calls = []
+
+        async def failing(claim):
+            calls.append(claim)
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            await idempotency.run_once("k", "scope", {}, failing)
+        response = await idempotency.run_once("k", "scope", {}, handler(sessions, calls))
+        assert len(calls) == 2
+        assert body(response) == {"call": 2}
+
+    run_keys(check)
+
+
+def test_stale_claim_is_taken_over_and_late_original_cannot_store(run_keys, monkeypatch):
+    async def check(sessions):
+        # Блокировка истекает сразу: повтор перехватывает ключ у "зависшего" запроса
+        monkeypatch.setattr(idempotency, "_lock_until", lambda now: now)
+        key_hash = idempotency._digest("scope\nk")
+        request_hash = idempotency._request_hash({})
+        original, _ = await idempotency._claim(key_hash, request_hash, 200)
+
+        calls = []
+        retry = await idempotency.run_once("k", "scope", {}, handler(sessions, calls, {"by": "retry"}))
+        assert body(retry) == {"by": "retry"}
+
+        async with sessions() as db:
+            with pytest.raises(HTTPException) as error:
+                await original.store(db, {"by": "original"})
+            assert error.value.status_code == 409
+            await db.rollback()
+        # Опоздавший запрос не удаляет ключ повтора
+        await original.release()
+
+        async with sessions() as db:
+            row = await db.get(IdempotencyKey, key_hash)
+            assert json.loads(row.response) == {"by": "retry"}
+            assert row.lock_token != original.token
+
+    run_keys(check)
+
+
+def test_claim_is_not_taken_over_while_locked(run_keys):
+    async def check(sessions):
+        key_hash = idempotency._digest("scope\nk")
+        request_hash = idempotency._request_hash({})
+        claim, _ = await idempotency._claim(key_hash, request_hash, 200)
+        again, existing = await idempotency._claim(key_hash, request_hash, 200)
+        assert again is None
+        assert existing.lock_token == claim.token and existing.status_code is None
+
+    run_keys(check)
@@ -0,0 +1,102 @@
+import io
+from decimal import Decimal
+
+import pytest
+
+from app.services.product_import import (
+    ImportFormatError,
+    _to_bool,
+    _to_int,
+    iter_rows,
+    validate_row,
+)
+
+CATEGORY_IDS = {1, 2}
+UNIT_IDS = {10}
+
+
+def make_row(**overrides):
+    row = {"article": "1001", "name": "Болт М8", "category_id": "1", "unit_id": "10"}
+    row.update(overrides)
+    return row
+
+
+def csv_rows(content: str):
+    return list(iter_rows(io.BytesIO(content.encode("utf-8")), "products.csv"))
+
+
+@pytest.mark.parametrize("value, expected", [("42", 42), (" 7 ", 7), (5, 5), (3.0, 3), ("1.00", 1)])
+def test_to_int_accepts_integers(value, expected):
+    assert _to_int(value, "article") == expected
+
+
+@pytest.mark.parametrize("value", ["abc", "1.5", "", "NaN", "Infinity"])
+def test_to_int_rejects_non_integers(value):
+    with pytest.raises(ValueError, match="article"):
+        _to_int(value, "article")
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, True), ("", True), (True, True), (False, False),
+    ("1", True), ("Да", True), (" yes ", True), ("0", False), ("нет", False), ("N", False),
+])
+def test_to_bool(value, expected):
+    assert _to_bool(value) is expected
+
+
+def test_to_bool_rejects_unknown_value():
+    with pytest.raises(ValueError, match="is_active"):
+        _to_bool("maybe")
+
+
+def test_validate_row_returns_product_values():
+    values, error = validate_row(
+        make_row(name="  Болт М8 ", purchase_price="10,50", is_active="0"), CATEGORY_IDS, UNIT_IDS
+    )
+    assert error is None
+    assert values == {
+        "article": 1001,
+        "name": "Болт М8",
+        "purchase_price": Decimal("10.50"),
+        "sell_price": None,
+        "is_active": False,
+        "category_id": 1,
+        "unit_id": 10,
+    }
+
+
+@pytest.mark.parametrize("overrides, message", [
+    ({"name": " "}, "name: обязательное поле"),
+    ({"name": "x" * 46}, "name: не длиннее 45 символов"),
+    ({"category_id": "3"}, "Категория 3 не найдена"),
+    ({"unit_id": "11"}, "Единица измерения 11 не найдена"),
+    ({"article": "A-1"}, "article: ожидается целое число"),
+    ({"sell_price": "дорого"}, "sell_price: ожидается число"),
+    ({"is_active": "maybe"}, "is_active: ожидается 1/0 или true/false"),
+])
+def test_validate_row_reports_error(overrides, message):
+    assert validate_row(make_row(**overrides), CATEGORY_IDS, UNIT_IDS) == (None, message)
+
+
+@pytest.mark.parametrize("delimiter", [",", ";", "\t"])
+def test_csv_dialect_is_sniffed(delimiter):
+    content = delimiter.join(["Article", "Name", "Category_ID", "Unit_ID"]) + "\r\n"
+    content += delimiter.join(["1001", "Болт", "1", "10"]) + "\r\n"
+    assert csv_rows(content) == [
+        (2, {"article": "1001", "name": "Болт", "category_id": "1", "unit_id": "10"}),
+    ]
+
+
+def test_csv_skips_empty_rows_and_keeps_file_row_numbers():
+    rows = csv_rows("\ufeffarticle;name;category_id;unit_id\n1;A;1;10\n;;;\n2;B;1;10\n")
+    assert [(number, row["article"]) for number, row in rows] == [(2, "1"), (4, "2")]
+
+
+def test_csv_without_required_columns_is_rejected():
+    with pytest.raises(ImportFormatError, match="unit_id"):
+        csv_rows("article,name,category_id\n1,A,1\n")
+
+
+def test_unsupported_extension_is_rejected():
+    with pytest.raises(ImportFormatError):
+        iter_rows(io.BytesIO(b""), "products.json")
@@ -0,0 +1,94 @@
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.pagination import decode_cursor, decode_signed_cursor, encode_cursor, encode_signed_cursor
+from app.routers.products import get_product_movements
+from tests.conftest import add_document, seed_catalog
+
+
+async def seed(db) -> None:
+    """Документ 4 введён задним числом: по дате он идёт вторым"""
+    await seed_catalog(db, products=(1, 2))
+    add_document(db, 1, date(2026, 1, 5), [(1, 10, None, 1)])
+    add_document(db, 2, date(2026, 1, 20), [(1, 3, 1, 2), (2, 7, None, 1)])
+    add_document(db, 3, date(2026, 2, 1), [(1, 4, 2, None)])
+    add_document(db, 4, date(2026, 1, 10), [(1, 5, None, 2), (1, 1, 1, None)])
+    await db.commit()
+
+
+async def read_pages(db, limit, zone_id=None):
+    items, cursor = [], None
+    while True:
+        page = await get_product_movements(
+            1, zone_id=zone_id, limit=limit, cursor=cursor, movements_format="json", db=db,
+        )
+        items.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return items
+
+
+def test_signed_cursor_round_trip():
+    cursor = encode_signed_cursor(["2026-01-10", 4, 7, 15])
+    assert decode_signed_cursor(cursor, 4) == ["2026-01-10", 4, 7, 15]
+
+
+def forge(cursor: str, balance: int) -> str:
+    """Тот же курсор с другим остатком и прежней подписью"""
+    payload, signature = cursor.split(".")
+    kid, *values = decode_cursor(payload, 5)
+    return encode_cursor([kid, *values[:3], balance]) + "." + signature
+
+
+def test_signed_cursor_rejects_forged_values():
+    cursor = encode_signed_cursor(["2026-01-10", 4, 7, 15])
+    payload, signature = cursor.split(".")
+    for value in [forge(cursor, 1000), payload, payload + "." + signature[::-1], encode_cursor([1, 2, 3, 4])]:
+        with pytest.raises(HTTPException) as error:
+            decode_signed_cursor(value, 4)
+        assert error.value.status_code == 400
+
+
+def test_ledger_is_chronological_with_running_balance(run_db):
+    async def check(sessions):
+        async with sessions() as db:
+            await seed(db)
+            items = await read_pages(db, limit=1000)
+            assert [(str(i["date"]), i["document_id"], i["quantity"], i["balance"]) for i in items] == [
+                ("2026-01-05", 1, 10, 10),
+                ("2026-01-10", 4, 5, 15),
+                ("2026-01-10", 4, -1, 14),
+                ("2026-01-20", 2, 0, 14),
+                ("2026-02-01", 3, -4, 10),
+            ]
+
+    run_db(check)
+
+
+@pytest.mark.parametrize("zone_id", [None, 1, 2])
+@pytest.mark.parametrize("limit", [1, 2, 3])
+def test_pages_match_full_ledger(run_db, zone_id, limit):
+    async def check(sessions):
+        async with sessions() as db:
+            await seed(db)
+            full = await read_pages(db, limit=1000, zone_id=zone_id)
+            assert await read_pages(db, limit=limit, zone_id=zone_id) == full
+            assert full[-1]["balance"] == sum(i["quantity"] for i in full)
+
+    run_db(check)
+
+
+def test_tampered_balance_in_cursor_is_rejected(run_db):
+    async def check(sessions):
+        async with sessions() as db:
+            await seed(db)
+            page = await get_product_movements(1, limit=2, cursor=None, movements_format="json", db=db)
+            with pytest.raises(HTTPException) as error:
+                await get_product_movements(
+                    1, limit=2, cursor=forge(page["next_cursor"], 1000), movements_format="json", db=db,
+                )
+            assert error.value.status_code == 400
+
+    run_db(check)
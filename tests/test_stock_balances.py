@@ -0,0 +1,83 @@
+from datetime import date, datetime
+
+import pytest
+
+from app.models.models import StockPeriod, StockSnapshot
+from app.services import stock, stock_periods
+from tests.conftest import add_document, seed_catalog
+
+JANUARY = date(2026, 1, 31)
+
+
+async def seed(db) -> None:
+    """
+    Январь: приход 10 в зону 1, перемещение 4 из зоны 1 в зону 2; месяц закрыт
+    снимком (6, 4). Февраль: приход 5 в зону 1, списание 2 из зоны 2.
+    """
+    await seed_catalog(db)
+    add_document(db, 1, date(2026, 1, 10), [(1, 10, None, 1)])
+    add_document(db, 2, date(2026, 1, 20), [(1, 4, 1, 2)])
+    db.add(StockPeriod(period_end=JANUARY, closed_at=datetime(2026, 2, 1)))
+    db.add(StockSnapshot(period_end=JANUARY, product_id=1, zone_id=1, quantity=6))
+    db.add(StockSnapshot(period_end=JANUARY, product_id=1, zone_id=2, quantity=4))
+    add_document(db, 3, date(2026, 2, 5), [(1, 5, None, 1)])
+    add_document(db, 4, date(2026, 2, 10), [(1, 2, 2, None)])
+    await db.commit()
+
+
+@pytest.mark.parametrize("as_of, expected", [
+    (None, [11, 2]),
+    (date(2025, 12, 31), [0, 0]),
+    (date(2026, 1, 15), [10, 0]),
+    (JANUARY, [6, 4]),
+    (date(2026, 2, 7), [11, 4]),
+    (date(2026, 3, 1), [11, 2]),
+])
+def test_matrix_as_of_around_snapshot(run_db, as_of, expected):
+    async def check(sessions):
+        async with sessions() as db:
+            await seed(db)
+            for product_ids in ([1], None):
+                matrix = await stock.get_stock_matrix(db, product_ids, None, as_of)
+                assert matrix["zone_ids"] == [1, 2]
+                assert matrix["quantities"] == [expected]
+            if as_of is not None:
+                assert await stock.get_balance(db, 1, 2, as_of) == expected[1]
+                assert await stock.get_total_balance(db, 1, as_of) == sum(expected)
+
+    run_db(check)
+
+
+def test_movements_before_snapshot_are_not_replayed(run_db):
+    async def check(sessions):
+        async with sessions() as db:
+            await seed(db)
+            # Строка задним числом в закрытом месяце снимок не меняет
+            add_document(db, 5, date(2026, 1, 25), [(1, 100, None, 1)])
+            await db.commit()
+            matrix = await stock.get_stock_matrix(db, [1], [1, 2])
+            assert matrix["quantities"] == [[11, 2]]
+            matrix = await stock.get_stock_matrix(db, [1], [1], date(2026, 2, 7))
+            assert matrix["quantities"] == [[11]]
+
+    run_db(check)
+
+
+def test_reopened_period_accepts_edits_and_drops_snapshot(run_db):
+    async def check(sessions):
+        async with sessions() as db:
+            await seed(db)
+            with pytest.raises(stock_periods.PeriodClosedError):
+                await stock_periods.check_document_open(db, 2)
+
+            assert await stock_periods.reopen_periods(db, JANUARY) == [JANUARY]
+            await db.commit()
+            await stock_periods.check_document_open(db, 2)
+            assert await stock_periods.latest_closed(db) is None
+            matrix = await stock.get_stock_matrix(db, [1], [1, 2], JANUARY)
+            assert matrix["quantities"] == [[6, 4]]
+
+            with pytest.raises(ValueError):
+                await stock_periods.reopen_periods(db, JANUARY)
+
+    run_db(check)